@@ -1,4 +1,7 @@
 import base64
+from itertools import count
+
+from intervals import IntervalTree
 
 class Publican:
     def __init__(self, pub_name, email, ID, password, address, xcoord, ycoord, tables, pub_image=None):
@@ -10,12 +13,20 @@ class Publican:
         self.xcoord = xcoord
         self.ycoord = ycoord 
         self.tables = tables
-        self.events = []
+        # Events by [start_time, end_time), for overlap checks and lookups by start time
+        self.schedule = IntervalTree()
+        self._event_ids = count()
         self.pub_image = pub_image
 
+    @property
+    def events(self):
+        return [event for _, _, _, event in self.schedule.items()]
+
     def create_event(self, game_type, start_time, end_time, expires, num_units, unit_capacity=None, available_slots=None):
         if game_type not in ["Seat Based", "Table Based"]:
             return {"status": "error", "message": "Invalid game type specified."}
+        if self.schedule.overlapping(start_time, end_time):
+            return {"status": "error", "message": "Event overlaps an existing event."}
 
         event = {
             "game_type": game_type,
@@ -28,13 +39,14 @@ class Publican:
         if game_type == "Table Based":
             event["table_capacity"] = unit_capacity
 
-        self.events.append(event)
+        self.schedule.add(start_time, end_time, next(self._event_ids), event)
         return {"status": "success", "event": event}
         
     def delete_event(self, start_time, game_type):
-        for event in self.events:
-            if event["start_time"] == start_time and event["game_type"] == game_type:
-                self.events.remove(event)
+        # Only events starting at start_time can match: the ones covering that instant
+        for start, _, key, event in self.schedule.covering(start_time, start_time):
+            if start == start_time and event["game_type"] == game_type:
+                self.schedule.remove(key)
                 return {"status": "success", "message": "Event deleted."}
         return {"status": "error", "message": "Event not found."}
 
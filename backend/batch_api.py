@@ -0,0 +1,79 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify, request
+
+# Headers of the batch request that are passed on to every sub-request. Accept-Encoding is
+# deliberately not forwarded: only the combined batch response is compressed.
+FORWARDED_HEADERS = ("Authorization", "Cookie", "Accept-Language")
+
+ALLOWED_METHODS = {"GET", "POST"}
+
+logger = logging.getLogger(__name__)
+
+
+def _error(status, message):
+    return {"status": status, "body": {"error": message}}
+
+
+def init_app(app):
+    """
+    Summary:
+        Add POST /api/batch, which runs several API calls in one HTTP exchange. The body is
+        {"requests": [{"method": "POST", "path": "/api/fetch_profile", "body": {...}}, ...]};
+        sub-requests run concurrently on a bounded executor shared by all batches and go
+        through the normal routing and request hooks.
+
+    Returns:
+        .JSON + HTTP Status: {"responses": [{"status": ..., "body": ...}, ...]} in request
+        order with HTTP status 200, or 400 when the batch itself is malformed
+    """
+    max_requests = app.config.get("BATCH_MAX_REQUESTS", 10)
+    executor = ThreadPoolExecutor(max_workers=app.config.get("BATCH_MAX_WORKERS", 8),
+                                  thread_name_prefix="batch")
+    app.extensions["batch_executor"] = executor
+
+    def run(item, headers):
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            return _error(400, "Each request needs a path")
+        method = str(item.get("method", "GET")).upper()
+        path = item["path"]
+        if method not in ALLOWED_METHODS:
+            return _error(405, f"Method {method} not allowed in a batch")
+        if not path.startswith("/api/") or path.split("?")[0].rstrip("/") == "/api/batch":
+            return _error(400, f"Path {path} not allowed in a batch")
+
+        started = time.perf_counter()
+        options = {"method": method, "headers": headers}
+        if "body" in item and method != "GET":
+            options["json"] = item["body"]
+        try:
+            with app.test_request_context(path, **options):
+                response = app.full_dispatch_request()
+        except Exception:
+            logger.exception("Batched request %s %s failed", method, path)
+            return _error(500, "Internal server error")
+
+        if response.is_json:
+            body = response.get_json(silent=True)
+        else:
+            body = response.get_data(as_text=True)
+        return {
+            "status": response.status_code,
+            "body": body,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    @app.route("/api/batch", methods=["POST"])
+    def batch():
+        data = request.get_json(silent=True)
+        items = data.get("requests") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Expected a non-empty 'requests' list"}), 400
+        if len(items) > max_requests:
+            return jsonify({"error": f"At most {max_requests} requests per batch"}), 400
+
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        futures = [executor.submit(run, item, headers) for item in items]
+        return jsonify({"responses": [future.result() for future in futures]}), 200
@@ -0,0 +1,77 @@
+"""
+Build the facet bitmap index over synthetic live games and time filter combinations,
+facet counts and single-game updates (a join flipping "open").
+
+Usage: python benchmarks/bench_facets.py [games] [repeat]
+"""
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from facets import FacetIndex
+
+GAME_TYPES = ["Pool", "Darts", "Poker", "Pub Quiz", "Chess", "Trivia", "Bingo", "Cards", "Karaoke", "Scrabble"]
+
+FILTERS = [
+    ("type", {"type": {"Pool"}}),
+    ("type or type + open", {"type": {"Pool", "Darts"}, "open": {"yes"}}),
+    ("pub + daypart", {"pub": {"pub7"}, "daypart": {"evening"}}),
+    ("four facets", {"type": {"Chess", "Poker", "Bingo"}, "daypart": {"evening", "night"},
+                     "open": {"yes"}, "area": {"533_-63"}}),
+]
+
+
+def make_games(count, rng):
+    games = []
+    for i in range(count):
+        max_players = rng.randint(2, 12)
+        games.append((f"game{i}", {
+            "game_type": rng.choice(GAME_TYPES),
+            "pub_id": f"pub{rng.randrange(500)}",
+            "start_time": f"2999-01-01T{rng.randrange(24):02d}:00:00",
+            "expires": "2999-01-02T00:00:00",
+            "xcoord": 53.35 + rng.uniform(-0.15, 0.15),
+            "ycoord": -6.26 + rng.uniform(-0.25, 0.25),
+            "max_players": max_players,
+            "participants": [f"gamer{j}" for j in range(rng.randint(1, max_players))],
+        }))
+    return games
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return result, timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.99)] * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(1)
+    games = make_games(count, rng)
+
+    index = FacetIndex()
+    started = time.perf_counter()
+    index.add_many(games)
+    print(f"indexed {len(index)} games, {index.stats()['bitmaps']} bitsets in {time.perf_counter() - started:.2f}s")
+
+    for name, filters in FILTERS:
+        result, p50, p99 = timed(lambda: index.filter(filters), repeat)
+        print(f"{name:<22} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms  {len(result)} games")
+    (total, _), p50, p99 = timed(lambda: index.facet_counts(FILTERS[1][1]), repeat)
+    print(f"{'facet counts':<22} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms  {total} games")
+
+    game_id, data = games[count // 2]
+    full = {**data, "participants": ["gamer"] * data["max_players"]}
+    _, p50, p99 = timed(lambda: (index.add(game_id, full), index.add(game_id, data)), repeat)
+    print(f"{'join + leave':<22} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare Flask's stdlib JSON provider with the orjson provider on fetch_games-sized
+payloads: building the jsonify response and parsing a request body.
+
+Usage: python benchmarks/bench_json.py [records] [repeat]
+"""
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import OrjsonProvider
+from read_models import game_summary
+
+
+def make_games(count):
+    return [
+        game_summary(f"game{i:05d}", {
+            "pub_id": f"pub{i % 200}",
+            "host": f"gamer{i % 5000}",
+            "game_type": "Pool" if i % 2 else "Darts",
+            "max_seats": 4,
+            "participants": [f"gamer{(i + j) % 5000}" for j in range(i % 4)],
+            "expires": f"2030-01-{1 + i % 28:02d}T{i % 24:02d}:00:00",
+            "xcoord": 53.34 + (i % 100) / 1000,
+            "ycoord": -6.26 - (i % 100) / 1000,
+        })
+        for i in range(count)
+    ]
+
+
+def bench(provider_class, games, repeat):
+    app = Flask(__name__)
+    app.json = provider_class(app)
+    with app.app_context():
+        body = app.json.response(games).get_data()
+        dump = min(timeit.repeat(lambda: app.json.response(games), number=1, repeat=repeat))
+        load = min(timeit.repeat(lambda: app.json.loads(body), number=1, repeat=repeat))
+    return dump, load, len(body)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    games = make_games(count)
+
+    print(f"{count} games, best of {repeat}")
+    print(f"{'provider':<10} {'jsonify ms':>11} {'get_json ms':>12} {'bytes':>10}")
+    for name, provider in (("stdlib", DefaultJSONProvider), ("orjson", OrjsonProvider)):
+        dump, load, size = bench(provider, games, repeat)
+        print(f"{name:<10} {dump * 1000:>11.2f} {load * 1000:>12.2f} {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Rank a synthetic city of live games for one user with the "for you" scorer: the one-off
+cost of building the columns (once per replica snapshot) and the per-request scoring.
+
+Usage: python benchmarks/bench_recommend.py [games] [repeat]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from recommend import DEFAULT_WEIGHTS, GameColumns, score_games, top_rows
+
+GAME_TYPES = ["Pool", "Darts", "Poker", "Pub Quiz", "Chess", "Trivia", "Bingo", "Cards", "Karaoke", "Scrabble"]
+
+
+def make_games(count, rng):
+    now = datetime.now()
+    gamers = [f"gamer{i}" for i in range(count // 2)]
+    games = []
+    for i in range(count):
+        max_players = rng.randint(2, 12)
+        games.append({
+            "id": f"game{i}",
+            "xcoord": 53.35 + rng.uniform(-0.15, 0.15),
+            "ycoord": -6.26 + rng.uniform(-0.25, 0.25),
+            "start_time": (now + timedelta(minutes=rng.randint(-60, 7 * 24 * 60))).strftime("%Y-%m-%dT%H:%M:%S"),
+            "max_players": max_players,
+            "participants": rng.sample(gamers, rng.randint(1, max_players)),
+            "host": rng.choice(gamers),
+            "game_type": rng.choice(GAME_TYPES),
+        })
+    return games, gamers
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(1)
+    games, gamers = make_games(count, rng)
+
+    started = time.perf_counter()
+    columns = GameColumns(games)
+    print(f"columns for {len(columns)} games built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    friends = rng.sample(gamers, 200)
+    type_counts = {"Pool": 5, "Darts": 2}
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        score, _ = score_games(columns, DEFAULT_WEIGHTS, time.time(), location=(53.345, -6.264),
+                               friend_ids=friends, type_counts=type_counts, exclude=[gamers[0]])
+        rows = top_rows(score, 20)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"rank top 20: p50 {timings[len(timings) // 2] * 1000:.2f} ms  p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms  "
+          f"best: {columns.games[rows[0]]['id']}")
+
+
+if __name__ == "__main__":
+    main()
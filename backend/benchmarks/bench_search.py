@@ -0,0 +1,68 @@
+"""
+Build the full-text search index over synthetic games and pubs and time queries:
+common and rare words, two-word queries and search-as-you-type prefixes.
+
+Usage: python benchmarks/bench_search.py [documents] [repeat]
+"""
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from search import SearchIndex
+
+GAME_TYPES = ["Pool", "Darts", "Poker", "Pub Quiz", "Chess", "Trivia", "Bingo", "Cards", "Karaoke", "Scrabble"]
+WORDS = ("friendly competitive league beginners welcome night table tournament weekly prize "
+         "team casual music table round final cup open doubles singles ranked fun").split()
+PLACES = ["Temple Bar", "Rathmines", "Ranelagh", "Smithfield", "Stoneybatter", "Portobello", "Drumcondra",
+          "Phibsborough", "Clontarf", "Dun Laoghaire", "Howth", "Malahide", "Swords", "Tallaght", "Dundrum"]
+
+QUERIES = ["quiz", "poker night", "darts temple", "karaoke", "qu", "smith", "chess tournament", "zzz"]
+
+
+def make_docs(count, rng):
+    pubs = [(f"pub{i}", {"pub_name": f"The {rng.choice(WORDS).title()} {rng.choice(['Inn', 'Arms', 'Tavern', 'House'])} {i}",
+                         "address": f"{i} Main Street, {rng.choice(PLACES)}"}) for i in range(count // 50)]
+    games = []
+    for i in range(count - len(pubs)):
+        game_type = rng.choice(GAME_TYPES)
+        games.append((f"game{i}", {
+            "game_name": f"{rng.choice(WORDS).title()} {game_type} {rng.choice(['Night', 'Session', 'Cup', 'Social'])}",
+            "game_type": game_type,
+            "game_desc": " ".join(rng.choice(WORDS) for _ in range(8)),
+            "location": rng.choice(PLACES),
+            "expires": "2999-01-01T00:00:00",
+        }))
+    return games, pubs
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    games, pubs = make_docs(count, random.Random(1))
+
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.add_many("game", games)
+    index.add_many("pub", pubs)
+    print(f"indexed {len(index)} documents, {index.stats()['terms']} terms in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    for i in range(1000):
+        index.add("game", f"game{i}", games[i][1])
+    print(f"incremental re-index: {(time.perf_counter() - started):.3f} ms per document")
+
+    for query in QUERIES:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = index.search(query)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"{query!r:<20} p50 {timings[len(timings) // 2] * 1000:7.3f} ms  "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1000:7.3f} ms  top: {results[0]['doc'].get('game_name') or results[0]['doc'].get('pub_name') if results else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Throughput of the development server (python main.py) against gunicorn with
+gunicorn.conf.py, both serving the local in-memory Firestore backend
+(FIRESTORE_BACKEND=local), so the numbers measure the serving stack and not Firebase.
+
+Each client process keeps one keep-alive connection and loops over fetch_games,
+fetch_pubs and fetch_friends for the given duration.
+
+Usage: python benchmarks/bench_serving.py [concurrency] [seconds]
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+REQUESTS = [
+    ("GET", "/api/fetch_games", None),
+    ("GET", "/api/fetch_pubs", None),
+    ("POST", "/api/fetch_friends", {"gamerId": "gamer0"}),
+]
+
+
+def seed_data(gamers=500, games=300, pubs=100, friends=10):
+    rng = random.Random(1)
+    data = {"gamers": {}, "games": {}, "publicans": {}}
+    for i in range(gamers):
+        data["gamers"][f"gamer{i}"] = {
+            "gamerId": f"G{i:04d}",
+            "fullName": f"Gamer {i}",
+            "profile": f"0{i % 9 + 1}",
+            "friends_list": [f"G{rng.randrange(gamers):04d}" for _ in range(friends)],
+        }
+    for i in range(pubs):
+        data["publicans"][f"pub{i}"] = {"pub_name": f"Pub {i}", "address": f"{i} Main Street",
+                                        "xcoord": 53.3 + i / 1000, "ycoord": -6.2 - i / 1000}
+    for i in range(games):
+        data["games"][f"game{i}"] = {
+            "game_name": f"Game {i}", "pub_id": f"pub{i % pubs}", "host": f"gamer{i % gamers}",
+            "game_type": "Pool", "max_players": 4, "participants": [],
+            "expires": f"2999-01-01T{i % 24:02d}:00:00",
+        }
+    return data
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def client(port, seconds, results):
+    latencies = []
+    errors = 0
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        method, path, body = REQUESTS[i % len(REQUESTS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            headers = {"Content-Type": "application/json"} if body else {}
+            connection.request(method, path, json.dumps(body) if body else None, headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+            if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put((latencies, errors))
+
+
+def run_load(port, concurrency, seconds):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(port, seconds, results)) for _ in range(concurrency)]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        batch, batch_errors = results.get()
+        latencies.extend(batch)
+        errors += batch_errors
+    for process in processes:
+        process.join()
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "requests_per_second": round(count / seconds, 1),
+        "p50_ms": round(latencies[count // 2] * 1000, 2) if count else None,
+        "p99_ms": round(latencies[int(count * 0.99)] * 1000, 2) if count else None,
+        "errors": errors,
+    }
+
+
+def serve(command, port, env):
+    # Own process group, so the dev server's reloader child is stopped with it
+    process = subprocess.Popen(command, cwd=BACKEND, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    return process
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as data_file:
+        json.dump(seed_data(), data_file)
+    env = dict(os.environ, FIRESTORE_BACKEND="local", LOCAL_FIRESTORE_DATA=data_file.name,
+               LOG_LEVEL="WARNING")
+
+    servers = [
+        ("dev server", [sys.executable, "main.py"], 8080),
+        ("gunicorn", [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", "127.0.0.1:8081", "wsgi:app"], 8081),
+    ]
+    print(f"{os.cpu_count()} cores, {concurrency} keep-alive clients, {seconds:g}s per server")
+    try:
+        for name, command, port in servers:
+            process = serve(command, port, env)
+            try:
+                run_load(port, concurrency, 1)  # warm up
+                print(f"{name:<12} {run_load(port, concurrency, seconds)}")
+            finally:
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait(timeout=60)
+    finally:
+        os.remove(data_file.name)
+
+
+if __name__ == "__main__":
+    main()
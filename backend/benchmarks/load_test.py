@@ -0,0 +1,363 @@
+"""
+Peak-night load test. Replays a traffic model of the app's endpoint mix (browsing
+fetch_games / fetch_pubs, fetch_friends, fetch_profile, signups calling
+check_email_exists, and bursts of create_game when a quiz night is set up) as an open
+loop: requests arrive at a fixed Poisson rate whether or not earlier ones have finished,
+and each latency is measured from the moment the request was due, so a stalled server
+shows up as latency instead of quietly lowering the load.
+
+The offered rate is stepped up (doubling from --start-rate, or the --rates given) until
+the server saturates. Each step reports throughput, p50/p99 latency and errors against
+the SLO; the summary gives the throughput at saturation, the highest rate meeting the
+SLO and the knee of the throughput curve (the step with the most throughput per unit of
+latency, after which extra load mostly buys queueing).
+
+By default it starts gunicorn on a seeded in-memory Firestore (FIRESTORE_BACKEND=local)
+whose round trips are delayed by --latency ("median_ms,p99_ms", see
+local_firestore.LatencyModel). --url targets a server that is already running instead,
+e.g. one using the Firestore emulator (FIRESTORE_EMULATOR_HOST) seeded with --seed-file.
+--mix takes the endpoint mix from a /metrics scrape of production
+(http_requests_total by route) instead of DEFAULT_MIX.
+
+Usage: python benchmarks/load_test.py [--latency 8,60] [--rates 20,40,80] [--step-seconds 15]
+       [--slo-p99-ms 500] [--mix metrics.txt] [--url http://host:port] [--json report.json]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from bench_serving import serve
+
+# Arrivals per endpoint, relative; a create_game arrival is a burst of CREATE_BURST requests
+DEFAULT_MIX = {
+    "/api/fetch_games": 30,
+    "/api/fetch_pubs": 12,
+    "/api/fetch_friends": 20,
+    "/api/fetch_profile": 18,
+    "/api/check_email_exists": 6,
+    "/api/create_game": 2,
+}
+CREATE_BURST = (2, 6)
+# Share of check_email_exists calls for an address that is not registered yet (signups)
+NEW_EMAIL_SHARE = 0.8
+
+GAMERS = 2000
+PUBS = 150
+GAMES = 600
+FRIENDS = 25
+
+# A request still unanswered this long after it was due counts as an error
+REQUEST_TIMEOUT = 30
+# A step is saturated when it completes less than this share of the offered rate
+SATURATED = 0.9
+
+
+def seed_data(gamers=GAMERS, pubs=PUBS, games=GAMES, friends=FRIENDS):
+    rng = random.Random(1)
+    data = {"users": {}, "gamers": {}, "publicans": {}, "events": {}, "games": {}}
+    for i in range(gamers):
+        data["users"][f"gamer{i}"] = {"email": f"gamer{i}@example.com", "isPublican": False}
+        data["gamers"][f"gamer{i}"] = {
+            "gamerId": f"G{i:05d}", "fullName": f"Gamer {i}", "email": f"gamer{i}@example.com",
+            "profile": f"0{i % 9 + 1}", "friends_list": [f"G{rng.randrange(gamers):05d}" for _ in range(friends)],
+            "hosted_games": [],
+        }
+    for i in range(pubs):
+        data["publicans"][f"pub{i}"] = {"pub_name": f"Pub {i}", "address": f"{i} Main Street",
+                                        "xcoord": 53.3 + i / 1000, "ycoord": -6.2 - i / 1000,
+                                        "events": [f"event{i}"]}
+        # One long event per pub, so every create_game finds an event to go in
+        data["events"][f"event{i}"] = {"pub_id": f"pub{i}", "game_type": "Seat Based",
+                                       "start_time": "2999-01-01T12:00:00.000Z", "end_time": "2999-01-02T02:00:00.000Z",
+                                       "expires": "2999-01-02T02:00:00.000Z", "available_slots": {}}
+    for i in range(games):
+        data["games"][f"game{i}"] = {
+            "game_name": f"Game {i}", "pub_id": f"pub{i % pubs}", "host": f"gamer{i % gamers}",
+            "game_type": rng.choice(["Pool", "Darts", "Pub Quiz", "Poker"]), "max_players": 4,
+            "participants": [], "start_time": f"2999-01-01T{12 + i % 12:02d}:00:00",
+            "expires": f"2999-01-01T{12 + i % 12:02d}:59:00",
+        }
+    return data
+
+
+def mix_from_metrics(text):
+    """{route: requests} from a Prometheus scrape of /metrics, for the routes the model can call."""
+    mix = dict.fromkeys(DEFAULT_MIX, 0)
+    for match in re.finditer(r'^http_requests_total\{([^}]*)\} (\S+)$', text, re.MULTILINE):
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(1)))
+        if labels.get("route") in mix:
+            mix[labels["route"]] += float(match.group(2))
+    if not any(mix.values()):
+        raise ValueError("No http_requests_total samples for the modelled routes")
+    # The scrape counts create_game requests; the model draws bursts of them
+    mix["/api/create_game"] /= sum(CREATE_BURST) / 2
+    return mix
+
+
+def make_request(route, rng, gamers):
+    """(method, path, body) of one request to route."""
+    gamer = f"gamer{rng.randrange(gamers)}"
+    if route in ("/api/fetch_games", "/api/fetch_pubs"):
+        return "GET", route, None
+    if route in ("/api/fetch_friends", "/api/fetch_profile"):
+        return "POST", route, {"gamerId": gamer}
+    if route == "/api/check_email_exists":
+        email = f"new{rng.randrange(10 ** 9)}@example.com" if rng.random() < NEW_EMAIL_SHARE else f"{gamer}@example.com"
+        return "POST", route, {"email": email}
+    if route == "/api/create_game":
+        hour = rng.randrange(13, 24)
+        return "POST", route, {
+            "game_name": "Quiz night", "pub_id": f"pub{rng.randrange(PUBS)}", "host": gamer, "location": "Bar",
+            "max_players": 6, "game_code": f"{rng.randrange(10 ** 6):06d}", "updated_slots": {},
+            "game_type": "Pub Quiz", "start_time": f"2999-01-01T{hour:02d}:00:00.000Z",
+            "end_time": f"2999-01-01T{hour:02d}:45:00.000Z",
+        }
+    raise ValueError(f"No request model for {route}")
+
+
+def schedule(rate, seconds, mix, rng, gamers):
+    """[(due offset, route, request)] of a Poisson arrival process at rate arrivals per second."""
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    arrivals = []
+    due = rng.expovariate(rate)
+    while due < seconds:
+        route = rng.choices(routes, weights)[0]
+        count = rng.randint(*CREATE_BURST) if route == "/api/create_game" else 1
+        arrivals.extend((due, route, make_request(route, rng, gamers)) for _ in range(count))
+        due += rng.expovariate(rate)
+    return arrivals
+
+
+def sender(host, port, pending, results):
+    connection = http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT)
+    while True:
+        item = pending.get()
+        if item is None:
+            return
+        due, route, (method, path, body) = item
+        status = None
+        try:
+            if time.perf_counter() - due < REQUEST_TIMEOUT:
+                headers = {"Content-Type": "application/json"} if body is not None else {}
+                connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                if response.getheader("Connection", "").lower() == "close":
+                    connection.close()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT)
+        results.append((route, status, time.perf_counter() - due))
+
+
+def generate(url, arrivals, connections, start_at, out):
+    """One load generator process: sends its arrivals on time over a pool of keep-alive connections."""
+    address = urlsplit(url)
+    pending = queue.Queue()
+    results = []
+    threads = [threading.Thread(target=sender, args=(address.hostname, address.port, pending, results), daemon=True)
+               for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for offset, route, request in arrivals:
+        due = start_at + offset
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # Latency runs from when the request was due, so queueing here counts against the server
+        pending.put((due, route, request))
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join(REQUEST_TIMEOUT * 2)
+    out.put((results, time.perf_counter() - start_at))
+
+
+def ok(status):
+    # Every modelled request is valid, so any non-2xx answer (or none) is an error
+    return status is not None and 200 <= status < 300
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def summarize(results, offered, seconds, elapsed, slo_p99_ms, slo_error_rate):
+    latencies = sorted(latency for _, status, latency in results if ok(status))
+    errors = sum(1 for _, status, _ in results if not ok(status))
+    completed = len(latencies)
+    routes = {}
+    for route, status, latency in results:
+        routes.setdefault(route, []).append((status, latency))
+    step = {
+        "offered_rps": round(offered, 1),
+        "throughput_rps": round(completed / max(elapsed, seconds), 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        "mean_ms": round(sum(latencies) / completed * 1000, 1) if latencies else None,
+        "requests": len(results),
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "routes": {},
+    }
+    for route, samples in sorted(routes.items()):
+        answered = sorted(latency for status, latency in samples if ok(status))
+        step["routes"][route] = {
+            "requests": len(samples),
+            "p99_ms": round(percentile(answered, 0.99) * 1000, 1) if answered else None,
+            "errors": len(samples) - len(answered),
+        }
+    step["meets_slo"] = bool(latencies) and step["p99_ms"] <= slo_p99_ms and step["error_rate"] <= slo_error_rate
+    step["saturated"] = step["throughput_rps"] < SATURATED * step["offered_rps"]
+    return step
+
+
+def run_step(url, rate, seconds, mix, processes, connections, seed, slo_p99_ms, slo_error_rate):
+    rng = random.Random(seed)
+    arrivals = schedule(rate, seconds, mix, rng, GAMERS)
+    # Requests are dealt round-robin, so each generator sends a thinned Poisson stream
+    shares = [arrivals[i::processes] for i in range(processes)]
+    out = multiprocessing.Queue()
+    start_at = time.perf_counter() + 0.5
+    workers = [multiprocessing.Process(target=generate, args=(url, share, connections, start_at, out))
+               for share in shares]
+    for worker in workers:
+        worker.start()
+    results, elapsed = [], 0.0
+    for _ in workers:
+        batch, worker_elapsed = out.get()
+        results.extend(batch)
+        elapsed = max(elapsed, worker_elapsed)
+    for worker in workers:
+        worker.join()
+    return summarize(results, len(arrivals) / seconds, seconds, elapsed, slo_p99_ms, slo_error_rate)
+
+
+def knee(steps):
+    """The step with the most throughput per unit of mean latency (Kleinrock's power), or None."""
+    candidates = [step for step in steps if step["mean_ms"]]
+    return max(candidates, key=lambda step: step["throughput_rps"] / step["mean_ms"], default=None)
+
+
+def report(steps, slo_p99_ms, slo_error_rate):
+    within = [step for step in steps if step["meets_slo"]]
+    best = knee(steps)
+    return {
+        "slo": {"p99_ms": slo_p99_ms, "error_rate": slo_error_rate},
+        "steps": steps,
+        "saturation_throughput_rps": max((step["throughput_rps"] for step in steps), default=0.0),
+        "max_rps_within_slo": max((step["throughput_rps"] for step in within), default=None),
+        "knee_offered_rps": best["offered_rps"] if best else None,
+        "knee_throughput_rps": best["throughput_rps"] if best else None,
+    }
+
+
+def print_step(step):
+    flag = "ok " if step["meets_slo"] else "SLO"
+    print(f"{flag} offered {step['offered_rps']:7.1f}/s  done {step['throughput_rps']:7.1f}/s  "
+          f"p50 {step['p50_ms']} ms  p99 {step['p99_ms']} ms  errors {step['error_rate']:.2%}", flush=True)
+
+
+def print_report(summary):
+    print()
+    print(f"saturation throughput   {summary['saturation_throughput_rps']}/s")
+    print(f"max within SLO          {summary['max_rps_within_slo']}/s "
+          f"(p99 <= {summary['slo']['p99_ms']} ms, errors <= {summary['slo']['error_rate']:.1%})")
+    print(f"knee                    offered {summary['knee_offered_rps']}/s, done {summary['knee_throughput_rps']}/s")
+    last = next((step for step in reversed(summary["steps"]) if step["meets_slo"]), summary["steps"][-1])
+    print(f"\nper route at offered {last['offered_rps']}/s:")
+    for route, stats in last["routes"].items():
+        print(f"  {route:<26} {stats['requests']:6d} requests  p99 {stats['p99_ms']} ms  {stats['errors']} errors")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Open-loop peak-night load test with an SLO report")
+    parser.add_argument("--url", help="server to load; by default gunicorn is started on a local Firestore")
+    parser.add_argument("--latency", default="8,60", help="local Firestore round trip: median_ms[,p99_ms]")
+    parser.add_argument("--rates", help="comma-separated offered rates (arrivals/s) instead of doubling")
+    parser.add_argument("--start-rate", type=float, default=10.0)
+    parser.add_argument("--max-rate", type=float, default=2000.0)
+    parser.add_argument("--step-seconds", type=float, default=15.0)
+    parser.add_argument("--processes", type=int, default=2, help="load generator processes")
+    parser.add_argument("--connections", type=int, default=32, help="keep-alive connections per process")
+    parser.add_argument("--slo-p99-ms", type=float, default=500.0)
+    parser.add_argument("--slo-error-rate", type=float, default=0.01)
+    parser.add_argument("--mix", help="a /metrics scrape to take the endpoint mix from")
+    parser.add_argument("--seed-file", help="write the seed data to this JSON file (for --url servers) and exit")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.seed_file:
+        with open(args.seed_file, "w") as seed_file:
+            json.dump(seed_data(), seed_file)
+        return
+    mix = DEFAULT_MIX
+    if args.mix:
+        with open(args.mix) as scrape:
+            mix = mix_from_metrics(scrape.read())
+    rates = [float(rate) for rate in args.rates.split(",")] if args.rates else None
+
+    server = data_path = None
+    url = args.url
+    if url is None:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as data_file:
+            json.dump(seed_data(), data_file)
+        data_path = data_file.name
+        env = dict(os.environ, FIRESTORE_BACKEND="local", LOCAL_FIRESTORE_DATA=data_path,
+                   LOCAL_FIRESTORE_LATENCY_MS=args.latency, LOG_LEVEL="WARNING",
+                   WRITE_BEHIND_PATH=os.path.join(tempfile.gettempdir(), f"niteout-load-test-{os.getpid()}.sqlite3"))
+        server = serve([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", "127.0.0.1:8090",
+                        "wsgi:app"], 8090, env)
+        url = "http://127.0.0.1:8090"
+
+    share = {route: round(weight / sum(mix.values()), 3) for route, weight in mix.items()}
+    print(f"{os.cpu_count()} cores, {args.step_seconds:g}s per step, mix {share}", flush=True)
+    steps = []
+    try:
+        # Warm up (listeners, caches) before the first measured step
+        run_step(url, args.start_rate, 2, mix, 1, args.connections, 0, args.slo_p99_ms, args.slo_error_rate)
+        rate = rates.pop(0) if rates else args.start_rate
+        while rate is not None:
+            step = run_step(url, rate, args.step_seconds, mix, args.processes, args.connections, len(steps) + 1,
+                            args.slo_p99_ms, args.slo_error_rate)
+            steps.append(step)
+            print_step(step)
+            if rates is not None:
+                rate = rates.pop(0) if rates else None
+            elif step["saturated"] or rate * 2 > args.max_rate:
+                rate = None
+            else:
+                rate *= 2
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=60)
+        if data_path is not None:
+            os.remove(data_path)
+
+    summary = report(steps, args.slo_p99_ms, args.slo_error_rate)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summary, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify, request
+
+import firestore_accounting
+from read_models import area_key, game_summary, now_string, pub_listing, read_area_games
+
+# Firestore "in" filters accept at most 30 values
+IN_QUERY_LIMIT = 30
+
+logger = logging.getLogger(__name__)
+
+
+def friend_listing(gamer_id, data, hosting):
+    """Same shape as a fetch_friends entry, plus the live games the friend hosts."""
+    if data is None:
+        return {"gamerId": gamer_id, "fullName": "Unknown User", "profile": "03", "hosting": []}
+    return {
+        "gamerId": gamer_id,
+        "fullName": data.get("fullName", "Unknown"),
+        "profile": data.get("profile", "01"),
+        "statusMessage": data.get("statusMessage", ""),
+        "hosting": hosting,
+    }
+
+
+class Bootstrap:
+    """
+    Summary:
+        Everything the home screen needs in one call: profile, friend summaries, live games
+        and pubs. Independent reads are issued in parallel and shared between sections (the
+        gamers document feeds both the profile and the friend list, and friends' hosted games
+        come from the games already fetched), so the response takes about as long as the
+        slowest chain of reads instead of the sum of five requests.
+
+    Args:
+        db: Firestore client
+        executor: thread pool the reads run on
+        replica: optional GamesReplica used for the live games when it is ready
+    """
+
+    def __init__(self, db, executor, replica=None):
+        self.db = db
+        self.executor = executor
+        self.replica = replica
+
+    def _submit(self, timings, name, fn, *args):
+        # Run inside a copy of the request's context so Firestore op accounting still applies
+        context = contextvars.copy_context()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return context.run(fn, *args)
+            finally:
+                timings[name] = (time.perf_counter() - started) * 1000
+
+        return self.executor.submit(timed)
+
+    def _get(self, collection, doc_id):
+        doc = self.db.collection(collection).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def _games(self, area):
+        if area:
+            return read_area_games(self.db, area)
+        if self.replica is not None and self.replica.ready():
+            return list(self.replica.snapshot().games)
+        query = self.db.collection("games").where("expires", ">", now_string())
+        return [game_summary(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    def _pubs(self):
+        return [pub_listing(doc.id, doc.to_dict()) for doc in self.db.collection("publicans").stream()]
+
+    def _friend_docs(self, friend_ids):
+        """Resolve gamerId values with one "in" query per 30 friends instead of one query each."""
+        found = {}
+        for start in range(0, len(friend_ids), IN_QUERY_LIMIT):
+            chunk = friend_ids[start:start + IN_QUERY_LIMIT]
+            for doc in self.db.collection("gamers").where("gamerId", "in", chunk).stream():
+                data = doc.to_dict()
+                found[data.get("gamerId")] = (doc.id, data)
+        return found
+
+    def load(self, gamer_id, area=None):
+        """
+        Returns:
+            (dict, dict): the payload, or None when the user does not exist, and the
+            duration in ms of each part
+        """
+        timings = {}
+        errors = {}
+        firestore_accounting.current_ops()
+
+        user_future = self._submit(timings, "user", self._get, "users", gamer_id)
+        gamer_future = self._submit(timings, "gamer", self._get, "gamers", gamer_id)
+        games_future = self._submit(timings, "games", self._games, area)
+        pubs_future = self._submit(timings, "pubs", self._pubs)
+
+        def result(name, future, default=None):
+            try:
+                return future.result()
+            except Exception as e:
+                logger.exception("Bootstrap %s failed for %s", name, gamer_id)
+                errors[name] = str(e)
+                return default
+
+        gamer = result("gamer", gamer_future)
+        friend_ids = list((gamer or {}).get("friends_list") or [])
+        friends_future = self._submit(timings, "friends", self._friend_docs, friend_ids) if friend_ids else None
+
+        user = result("user", user_future)
+        publican_future = None
+        if user and user.get("isPublican") and user.get("userIdToDisplay"):
+            publican_future = self._submit(timings, "publican", self._get, "publican", user["userIdToDisplay"])
+
+        games = result("games", games_future, [])
+        pubs = result("pubs", pubs_future, [])
+        friend_docs = result("friends", friends_future, {}) if friends_future else {}
+        publican = result("publican", publican_future) if publican_future else None
+
+        if user is None and gamer is None and not errors:
+            return None, timings
+
+        profile = dict(user or {})
+        profile.update(publican if user and user.get("isPublican") else gamer or {})
+
+        hosted = {}
+        for game in games:
+            hosted.setdefault(game.get("host"), []).append(game["id"])
+        friends = []
+        for friend_id in friend_ids:
+            doc_id, data = friend_docs.get(friend_id, (None, None))
+            friends.append(friend_listing(friend_id, data, hosted.get(doc_id, [])))
+
+        payload = {"profile": profile, "friends": friends, "games": games, "pubs": pubs}
+        if errors:
+            payload["errors"] = errors
+        return payload, timings
+
+
+def server_timing(timings):
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+
+def init_app(app, db, replica=None):
+    """
+    Summary:
+        Add POST /api/bootstrap. Takes {"gamerId", and optionally "area" or "xcoord"/"ycoord"
+        to limit games to one area}.
+
+    Returns:
+        .JSON + HTTP Status: {"profile", "friends", "games", "pubs"} with HTTP status 200
+        (a section that failed is empty and named in "errors"), 400 without a gamer ID or
+        404 if the user does not exist. Per-part read times are in the Server-Timing header.
+    """
+    executor = ThreadPoolExecutor(max_workers=app.config.get("BOOTSTRAP_MAX_WORKERS", 16),
+                                  thread_name_prefix="bootstrap")
+    app.extensions["bootstrap_executor"] = executor
+    bootstrap = Bootstrap(db, executor, replica)
+
+    @app.route("/api/bootstrap", methods=["POST"])
+    def bootstrap_route():
+        data = request.get_json(silent=True) or {}
+        gamer_id = data.get("gamerId")
+        if not gamer_id:
+            return jsonify({"error": "Gamer ID is required"}), 400
+        area = data.get("area") or area_key(data.get("xcoord"), data.get("ycoord"))
+
+        payload, timings = bootstrap.load(gamer_id, area)
+        if payload is None:
+            return jsonify({"error": "User not found"}), 404
+        response = jsonify(payload)
+        response.headers["Server-Timing"] = server_timing(timings)
+        return response, 200
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+
+import firebase_admin
+from firebase_admin import credentials, firestore, initialize_app
+from google.cloud import storage
+
+from tracked_firestore import TrackedClient
+
+CREDENTIALS_PATH = os.environ.get("FIREBASE_CREDENTIALS", "serviceAccountKey.json")
+STORAGE_BUCKET = "niteout-storage-49dc5"
+
+# "local" serves from an in-memory LocalFirestore loaded from LOCAL_FIRESTORE_DATA (a JSON
+# file of {collection: {doc_id: data}}), e.g. to benchmark the server without Firebase;
+# LOCAL_FIRESTORE_LATENCY_MS ("median" or "median,p99") delays each of its round trips
+FIRESTORE_BACKEND = os.environ.get("FIRESTORE_BACKEND", "firebase")
+
+_lock = threading.RLock()
+
+
+def _reset_lock():
+    # A lock held by another thread at fork time would never be released in the child
+    global _lock
+    _lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_reset_lock)
+
+
+def firebase_app():
+    """The default Firebase app, initialized from the service account key on first use."""
+    with _lock:
+        if not firebase_admin._apps:
+            return initialize_app(credentials.Certificate(CREDENTIALS_PATH), {"storageBucket": STORAGE_BUCKET})
+        return firebase_admin.get_app()
+
+
+def create_firestore():
+    # Not firestore.client(): that caches one client per Firebase app, which a forked
+    # worker would share (gRPC channels are not fork-safe)
+    app = firebase_app()
+    return firestore.Client(credentials=app.credential.get_credential(), project=app.project_id)
+
+
+def create_local_firestore():
+    from local_firestore import LatencyModel, LocalFirestore
+
+    data = {}
+    path = os.environ.get("LOCAL_FIRESTORE_DATA")
+    if path:
+        with open(path) as source:
+            data = json.load(source)
+    return LocalFirestore(data, latency=LatencyModel.parse(os.environ.get("LOCAL_FIRESTORE_LATENCY_MS")))
+
+
+class LazyFirestore:
+    """
+    Summary:
+        Stands in for the Firestore client. The real client (wrapped in a TrackedClient so
+        `listeners` see every round trip) is only created on first use, and again in every
+        process it is used in, so nothing is connected at import time or inherited by a fork.
+
+    Args:
+        factory: creates the underlying client (tests pass one that returns a FakeFirestore)
+    """
+
+    def __init__(self, factory=create_firestore):
+        self.factory = factory
+        self.listeners = []
+        self._client = None
+        self._pid = None
+
+    def configure(self, factory):
+        """Use `factory` from now on, dropping any client already created."""
+        with _lock:
+            self.factory = factory
+            self._client = None
+
+    def get(self):
+        if self._client is None or self._pid != os.getpid():
+            with _lock:
+                if self._client is None or self._pid != os.getpid():
+                    client = TrackedClient(self.factory())
+                    # Shared, so listeners added after the client exists still see every call
+                    client.listeners = self.listeners
+                    self._client = client
+                    self._pid = os.getpid()
+        return self._client
+
+    @property
+    def created(self):
+        return self._client is not None and self._pid == os.getpid()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+firestore_client = LazyFirestore(create_local_firestore if FIRESTORE_BACKEND == "local" else create_firestore)
+
+_buckets = {}
+
+
+def bucket():
+    """The Storage bucket for uploads, with a client created per process on first use."""
+    pid = os.getpid()
+    with _lock:
+        if pid not in _buckets:
+            app = firebase_app()
+            client = storage.Client(credentials=app.credential.get_credential(), project=app.project_id)
+            _buckets.clear()
+            _buckets[pid] = client.bucket(STORAGE_BUCKET)
+        return _buckets[pid]
@@ -0,0 +1,125 @@
+import gzip
+import threading
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain", "text/css", "application/javascript"}
+
+# Below this many bytes the encoding overhead outweighs the saved transfer time
+DEFAULT_MIN_SIZE = 1024
+
+# Per-response compression has to be cheap; cached payloads are compressed once, so harder
+LEVELS = {"br": 5, "gzip": 6}
+CACHED_LEVELS = {"br": 9, "gzip": 9}
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Summary:
+        Pick the best supported content coding from an Accept-Encoding header, honouring
+        q-values (q=0 refuses a coding). Brotli wins over gzip at equal preference.
+
+    Returns:
+        String: "br", "gzip" or None for identity
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best = None
+    best_weight = 0.0
+    for coding in available_encodings():
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(body, encoding, levels=LEVELS):
+    if encoding == "br":
+        return brotli.compress(body, quality=levels["br"])
+    return gzip.compress(body, compresslevel=levels["gzip"], mtime=0)
+
+
+class Precompressed:
+    """
+    Summary:
+        A cached response body together with its compressed copies. Each encoding is
+        compressed on first use and then reused for every later hit.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        if encoding is None:
+            return self.body
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    data = self._encoded[encoding] = compress(self.body, encoding, CACHED_LEVELS)
+        return data
+
+
+def precompressed_response(app, payload, mimetype="application/json", min_size=None):
+    """Build a response for a Precompressed payload in the encoding the client accepts."""
+    if min_size is None:
+        min_size = app.config.get("COMPRESS_MIN_SIZE", DEFAULT_MIN_SIZE)
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if len(payload.body) < min_size:
+        encoding = None
+    response = app.response_class(payload.encoded(encoding), mimetype=mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_app(app):
+    """Compress JSON and text responses of at least COMPRESS_MIN_SIZE bytes with br or gzip."""
+    min_size = app.config.get("COMPRESS_MIN_SIZE", DEFAULT_MIN_SIZE)
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or response.direct_passthrough
+                or response.is_streamed
+                or "Content-Encoding" in response.headers
+                or not 200 <= response.status_code < 300
+                or response.status_code == 204):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
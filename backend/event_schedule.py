@@ -0,0 +1,277 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from firebase_admin import firestore
+from flask import jsonify, request
+
+from intervals import IntervalTree
+from read_models import parse_iso
+
+logger = logging.getLogger(__name__)
+
+
+def to_timestamp(value):
+    """
+    Seconds since the epoch for an ISO time ("2025-03-01T19:00:00.000Z" from the app,
+    "2025-03-01T19:00:00" local time from the backend) or a datetime, or None.
+    """
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return parse_iso(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def event_interval(data):
+    """(start, end) timestamps of an events document, or None when they are missing or inverted."""
+    start, end = to_timestamp(data.get("start_time")), to_timestamp(data.get("end_time"))
+    if start is None or end is None or start >= end:
+        return None
+    return start, end
+
+
+class EventSchedule:
+    """
+    Summary:
+        Per-pub interval trees of the events that have not ended, fed by one Firestore
+        listener on "events": its first snapshot builds them and every later change
+        moves just that event. Answers "the event at this pub covering [start, end]"
+        (Firestore cannot serve a query with inequalities on two fields) and "events at
+        this pub overlapping [start, end)" in O(log n + k). Like GamesReplica, the
+        listener starts on first use and ready() is False until it has delivered.
+
+    Args:
+        db: Firestore client
+        retry_seconds: minimum time between attempts to restart a dead listener
+    """
+
+    def __init__(self, db, retry_seconds=5):
+        self.db = db
+        self.retry_seconds = retry_seconds
+        self._trees = {}  # pub ID -> IntervalTree of event ID -> event data
+        self._pubs = {}  # event ID -> pub ID, for events in a tree
+        self._seen = set()  # every event ID applied, including those not indexed
+        self._lock = threading.Lock()
+        self._watch = None
+        self._received = False
+        self._last_start = 0.0
+
+    def start(self):
+        self.stop()
+        self._last_start = time.monotonic()
+        self._received = False
+        self._watch = self.db.collection("events").on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def _listening(self):
+        return self._watch is not None and self._watch.is_active
+
+    def ready(self):
+        if self._listening():
+            return self._received
+        if self._last_start and time.monotonic() - self._last_start < self.retry_seconds:
+            return False
+        if self._last_start:
+            logger.warning("Event schedule listener is down, restarting it")
+        try:
+            self.start()
+        except Exception:
+            logger.exception("Error starting event schedule listener")
+        return self._listening() and self._received
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            if change.type.name == "REMOVED":
+                self.remove(change.document.id)
+            else:
+                self.apply(change.document.id, change.document.to_dict())
+        self._received = True
+
+    def apply(self, event_id, data):
+        """Index (or move) an events document."""
+        with self._lock:
+            self._remove(event_id)
+            self._seen.add(event_id)
+            interval = event_interval(data)
+            # Events that have ended can no longer hold a game or clash with a new event
+            if interval is None or not data.get("pub_id") or interval[1] <= time.time():
+                return
+            tree = self._trees.setdefault(data["pub_id"], IntervalTree())
+            tree.add(*interval, event_id, data)
+            self._pubs[event_id] = data["pub_id"]
+
+    def remove(self, event_id):
+        with self._lock:
+            self._remove(event_id)
+            self._seen.discard(event_id)
+
+    def _remove(self, event_id):
+        pub_id = self._pubs.pop(event_id, None)
+        if pub_id is None:
+            return
+        tree = self._trees[pub_id]
+        tree.remove(event_id)
+        if not len(tree):
+            del self._trees[pub_id]
+
+    def known(self, event_id):
+        with self._lock:
+            return event_id in self._seen
+
+    def _query(self, pub_id, method, start, end):
+        with self._lock:
+            tree = self._trees.get(pub_id)
+            if tree is None:
+                return []
+            return [(event_id, data) for _, _, event_id, data in getattr(tree, method)(start, end)]
+
+    def covering(self, pub_id, start, end):
+        """[(event ID, data)] of the pub's events containing [start, end], earliest start first."""
+        return self._query(pub_id, "covering", start, end)
+
+    def overlapping(self, pub_id, start, end):
+        """[(event ID, data)] of the pub's events sharing any time with [start, end)."""
+        return self._query(pub_id, "overlapping", start, end)
+
+    def metric_samples(self):
+        with self._lock:
+            return [
+                ("event_schedule_pubs", (), len(self._trees)),
+                ("event_schedule_events", (), len(self._pubs)),
+            ]
+
+
+def covering_event(db, schedule, pub_id, start, end):
+    """
+    Summary:
+        The event at pub_id covering [start, end] (timestamps): from the schedule when it
+        is ready, otherwise by reading the pub's events and filtering them here, since
+        Firestore cannot filter start_time and end_time together.
+
+    Returns:
+        (str, dict): the event ID and data, or (None, None)
+    """
+    if schedule is not None and schedule.ready():
+        found = schedule.covering(pub_id, start, end)
+        return found[0] if found else (None, None)
+    candidates = []
+    for doc in db.collection("events").where("pub_id", "==", pub_id).stream():
+        data = doc.to_dict()
+        interval = event_interval(data)
+        if interval and interval[0] <= start and interval[1] >= end:
+            candidates.append((interval[0], doc.id, data))
+    if not candidates:
+        return None, None
+    _, event_id, data = min(candidates, key=lambda candidate: candidate[:2])
+    return event_id, data
+
+
+def take_slots(event, start_time, end_time, max_players):
+    """
+    Summary:
+        The event's available_slots after a game of max_players from start_time to
+        end_time (ISO times whose clock times match the "HH:MM-HH:MM" slot keys) takes its
+        room: seats for Seat Based events, whole tables for Table Based ones.
+
+    Returns:
+        dict: the new available_slots, or None when a slot the game covers lacks room
+    """
+    start, end = parse_iso(start_time).time(), parse_iso(end_time).time()
+    if event.get("game_type") == "Table Based":
+        needed = -(-int(max_players) // int(event["table_capacity"]))
+    else:
+        needed = int(max_players)
+    slots = dict(event.get("available_slots") or {})
+    for slot_key, slot_value in slots.items():
+        slot_start, slot_end = (datetime.strptime(part.strip(), "%H:%M").time() for part in slot_key.split("-"))
+        if slot_start >= start and slot_end <= end:
+            if slot_value < needed:
+                return None
+            slots[slot_key] = slot_value - needed
+    return slots
+
+
+EVENT_FIELDS = ("game_type", "start_time", "end_time", "expires", "pub_id")
+OPTIONAL_EVENT_FIELDS = ("pub_details", "available_slots", "num_seats", "num_tables", "table_capacity")
+
+
+def init_app(app, db):
+    """
+    Summary:
+        Add POST /api/create_event. Takes the events document fields (game_type,
+        start_time, end_time, expires, pub_id, and optionally pub_details,
+        available_slots, num_seats, num_tables, table_capacity), writes the event and adds
+        it to the publican's events in one transaction, and rejects it if it overlaps
+        one of the pub's events.
+
+        Overlaps are checked against the schedule; events the publican document lists but
+        the schedule has not seen yet (created by another process moments ago, or any event
+        while the schedule is still loading) are read inside the transaction, and two
+        creations for one pub at the same time conflict on the publican document, so the
+        second is retried and sees the first.
+
+    Returns:
+        .JSON + HTTP Status: {"message", "event_id"} with HTTP status 201, 400 for missing
+        fields or invalid times, 404 if the pub does not exist, or 409 with "conflicts"
+        (the overlapping event IDs)
+    """
+    schedule = EventSchedule(db)
+    app.extensions["event_schedule"] = schedule
+
+    @app.route("/api/create_event", methods=["POST"])
+    def create_event():
+        data = request.get_json(silent=True) or {}
+        if not all(data.get(field) for field in EVENT_FIELDS):
+            return jsonify({"error": "Missing required fields."}), 400
+        interval = event_interval(data)
+        if interval is None:
+            return jsonify({"error": "start_time and end_time must be ISO times, start before end"}), 400
+        # Until the schedule has loaded it knows no events, so every one of the pub's is read below
+        schedule.ready()
+
+        event = {field: data[field] for field in EVENT_FIELDS + OPTIONAL_EVENT_FIELDS if field in data}
+        pub_id = event["pub_id"]
+        pub_ref = db.collection("publicans").document(pub_id)
+        event_ref = db.collection("events").document()
+
+        @firestore.transactional
+        def add_event(transaction):
+            pub = pub_ref.get(transaction=transaction)
+            if not pub.exists:
+                return None
+            conflicts = [event_id for event_id, _ in schedule.overlapping(pub_id, *interval)]
+            unseen = [event_id for event_id in pub.to_dict().get("events") or [] if not schedule.known(event_id)]
+            if unseen:
+                refs = [db.collection("events").document(event_id) for event_id in unseen]
+                for doc in db.get_all(refs, transaction=transaction):
+                    other = event_interval(doc.to_dict() or {}) if doc.exists else None
+                    if other and other[0] < interval[1] and other[1] > interval[0]:
+                        conflicts.append(doc.id)
+            if conflicts:
+                return conflicts
+            transaction.set(event_ref, event)
+            transaction.update(pub_ref, {"events": firestore.ArrayUnion([event_ref.id])})
+            return []
+
+        try:
+            conflicts = add_event(db.transaction())
+        except Exception as e:
+            logger.exception("Error creating event")
+            return jsonify({"error": f"Failed to create event: {str(e)}"}), 500
+        if conflicts is None:
+            return jsonify({"error": "Pub not found"}), 404
+        if conflicts:
+            return jsonify({"error": "Event overlaps existing events at this pub", "conflicts": conflicts}), 409
+
+        # Visible to this process's next request; the listener brings it to the others
+        schedule.apply(event_ref.id, event)
+        return jsonify({"message": "Event created successfully!", "event_id": event_ref.id}), 201
+
+    return schedule
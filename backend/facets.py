@@ -0,0 +1,416 @@
+import heapq
+import logging
+import threading
+import time
+
+import numpy as np
+from flask import jsonify, request
+
+from read_models import area_key, game_summary, is_live, now_string, open_seats
+
+# Start hour of each part of the day; a game belongs to the last one starting at or before
+# its start_time hour (night wraps round past midnight)
+DAYPARTS = (("night", 0), ("morning", 5), ("afternoon", 12), ("evening", 17), ("night", 22))
+DAYPART_NAMES = ("morning", "afternoon", "evening", "night")
+
+# Facets a game is indexed under, and the fetch_games query parameter for each
+FACETS = ("type", "pub", "daypart", "open", "area")
+
+# Batches larger than this set their bits in bool arrays and convert each touched bitset once
+BULK_LOAD = 100
+
+TRUE_VALUES = {"1", "true", "yes"}
+FALSE_VALUES = {"0", "false", "no"}
+
+logger = logging.getLogger(__name__)
+
+
+if hasattr(int, "bit_count"):
+    def popcount(bits):
+        return bits.bit_count()
+else:
+    # int.bit_count is Python 3.10+
+    def popcount(bits):
+        return bin(bits).count("1")
+
+
+def daypart(start_time):
+    """The part of the day a "YYYY-MM-DDTHH:mm" start time falls in, or None."""
+    try:
+        hour = int(start_time[11:13])
+    except (TypeError, ValueError):
+        return None
+    name = None
+    for part, start_hour in DAYPARTS:
+        if hour >= start_hour:
+            name = part
+    return name
+
+
+def facet_values(game):
+    """{facet: value} for a game summary; facets without a value are left out."""
+    values = {
+        "type": game.get("game_type"),
+        "pub": game.get("pub_id"),
+        "daypart": daypart(game.get("start_time")),
+        "open": "yes" if open_seats(game) else "no",
+        "area": area_key(game.get("xcoord"), game.get("ycoord")),
+    }
+    return {facet: value for facet, value in values.items() if value is not None}
+
+
+def parse_filters(args):
+    """
+    Summary:
+        Read facet filters from query parameters. A parameter may be repeated or hold
+        comma-separated values; values of one facet are OR-ed and facets are AND-ed, so
+        ?type=Pool,Darts&open=1 means (Pool or Darts) and has open spots.
+
+    Returns:
+        dict: {facet: set of values}, or None when no facet parameter is present
+
+    Raises:
+        ValueError: for an unknown daypart or open value
+    """
+    filters = {}
+    for facet in FACETS:
+        values = {value.strip() for raw in args.getlist(facet) for value in raw.split(",") if value.strip()}
+        if not values:
+            continue
+        if facet == "daypart":
+            unknown = values - set(DAYPART_NAMES)
+            if unknown:
+                raise ValueError(f"Unknown daypart {', '.join(sorted(unknown))}, expected {', '.join(DAYPART_NAMES)}")
+        if facet == "open":
+            lowered = {value.lower() for value in values}
+            if lowered - TRUE_VALUES - FALSE_VALUES:
+                raise ValueError("open must be true or false")
+            values = {"yes" if value in TRUE_VALUES else "no" for value in lowered}
+        filters[facet] = values
+    return filters or None
+
+
+def matches(values, filters, skip=None):
+    """Whether a game's facet_values pass filters, leaving out the skip facet's filter."""
+    return all(values.get(facet) in wanted for facet, wanted in (filters or {}).items() if facet != skip)
+
+
+def count_facets(games, filters=None):
+    """FacetIndex.facet_counts worked out game by game, for games not in an index."""
+    counts = {facet: {} for facet in FACETS}
+    total = 0
+    for game in games:
+        values = facet_values(game)
+        total += matches(values, filters)
+        for facet, value in values.items():
+            if matches(values, filters, skip=facet):
+                counts[facet][value] = counts[facet].get(value, 0) + 1
+    return total, counts
+
+
+class FacetIndex:
+    """
+    Summary:
+        Bitmap index over the live games. Every game gets an ordinal (a bit position,
+        reused after the game goes), and every facet value one bitset, held as a Python
+        int, with the bits of the games that have it. Any AND/OR combination of filters
+        is then a few bitwise operations on whole bitsets, and a facet count is a
+        popcount.
+
+        Games are added, changed and removed one at a time, so the index follows writes
+        incrementally. No change event fires when a game expires, so expired games are
+        dropped before each read. One lock guards it.
+    """
+
+    def __init__(self):
+        self._ordinals = {}  # game ID -> ordinal
+        self._games = []  # ordinal -> game summary, or None when the ordinal is free
+        self._values = {}  # game ID -> {facet: value}
+        self._bitmaps = {facet: {} for facet in FACETS}  # facet -> {value: bitset}
+        self._live = 0  # bitset of every indexed game
+        self._free = []  # min-heap of free ordinals, so bitsets stay as short as possible
+        self._expiry = []  # min-heap of (expires, game ID)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def add(self, game_id, data):
+        """Index (or re-index) a games document."""
+        self.add_many([(game_id, data)])
+
+    def add_many(self, games):
+        now = now_string()
+        # The last version of each game wins
+        games = dict(games)
+        with self._lock:
+            # OR-ing one bit into a long Python int copies it, so a bulk load (e.g. the
+            # listener's first snapshot) collects each bitset's new ordinals and sets them at once
+            pending = {} if len(games) > BULK_LOAD else None
+            for game_id, data in games.items():
+                game = game_summary(game_id, data)
+                if not is_live(game, now):
+                    self._remove(game_id)
+                    continue
+                self._add(game_id, game, pending)
+            for (facet, value), ordinals in (pending or {}).items():
+                flags = np.zeros(len(self._games), dtype=bool)
+                flags[ordinals] = True
+                bits = int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+                if facet is None:
+                    self._live |= bits
+                else:
+                    bitmaps = self._bitmaps[facet]
+                    bitmaps[value] = bitmaps.get(value, 0) | bits
+
+    def remove(self, game_id):
+        with self._lock:
+            self._remove(game_id)
+
+    def _add(self, game_id, game, pending=None):
+        ordinal = self._ordinals.get(game_id)
+        if ordinal is None:
+            ordinal = heapq.heappop(self._free) if self._free else len(self._games)
+            if ordinal == len(self._games):
+                self._games.append(None)
+            self._ordinals[game_id] = ordinal
+            if pending is None:
+                self._live |= 1 << ordinal
+            else:
+                pending.setdefault((None, None), []).append(ordinal)
+        previous = self._games[ordinal]
+        if previous is None or previous["expires"] != game["expires"]:
+            heapq.heappush(self._expiry, (game["expires"], game_id))
+        self._games[ordinal] = game
+
+        old = self._values.get(game_id, {})
+        new = facet_values(game)
+        bit = 1 << ordinal
+        for facet, value in old.items():
+            if new.get(facet) != value:
+                self._clear(facet, value, bit)
+        for facet, value in new.items():
+            if old.get(facet) == value:
+                continue
+            if pending is None:
+                bitmaps = self._bitmaps[facet]
+                bitmaps[value] = bitmaps.get(value, 0) | bit
+            else:
+                pending.setdefault((facet, value), []).append(ordinal)
+        self._values[game_id] = new
+
+    def _clear(self, facet, value, bit):
+        bitmaps = self._bitmaps[facet]
+        bits = bitmaps[value] & ~bit
+        if bits:
+            bitmaps[value] = bits
+        else:
+            del bitmaps[value]
+
+    def _remove(self, game_id):
+        ordinal = self._ordinals.pop(game_id, None)
+        if ordinal is None:
+            return
+        bit = 1 << ordinal
+        for facet, value in self._values.pop(game_id).items():
+            self._clear(facet, value, bit)
+        self._live &= ~bit
+        self._games[ordinal] = None
+        heapq.heappush(self._free, ordinal)
+
+    def _purge_expired(self):
+        now = now_string()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, game_id = heapq.heappop(self._expiry)
+            ordinal = self._ordinals.get(game_id)
+            # Skip entries left behind by a game that was removed or got a new expiry
+            if ordinal is not None and self._games[ordinal]["expires"] == expires:
+                self._remove(game_id)
+
+    def _match(self, filters, skip=None):
+        bits = self._live
+        for facet, values in (filters or {}).items():
+            if facet == skip:
+                continue
+            bitmaps = self._bitmaps[facet]
+            either = 0
+            for value in values:
+                either |= bitmaps.get(value, 0)
+            bits &= either
+        return bits
+
+    def _rows(self, bits):
+        """Game summaries at the set bits of bits, in ordinal order."""
+        if not bits:
+            return []
+        packed = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+        ordinals = np.flatnonzero(np.unpackbits(packed, bitorder="little"))
+        return [self._games[ordinal] for ordinal in ordinals.tolist()]
+
+    def filter(self, filters):
+        """Live games matching filters (see parse_filters); every live game for None."""
+        with self._lock:
+            self._purge_expired()
+            return self._rows(self._match(filters))
+
+    def facet_counts(self, filters=None):
+        """
+        Summary:
+            Matching games per value of every facet. A facet's counts apply the other
+            facets' filters but not its own, so they show what choosing another value of
+            that facet would return.
+
+        Returns:
+            (int, dict): the number of games matching filters, and {facet: {value: count}}
+        """
+        with self._lock:
+            self._purge_expired()
+            counts = {}
+            for facet, bitmaps in self._bitmaps.items():
+                base = self._match(filters, skip=facet)
+                counts[facet] = {value: count for value, bits in bitmaps.items()
+                                 if (count := popcount(bits & base))}
+            return popcount(self._match(filters)), counts
+
+    def stats(self):
+        return {"games": len(self._ordinals),
+                "bitmaps": sum(len(bitmaps) for bitmaps in self._bitmaps.values()),
+                "ordinals": len(self._games)}
+
+
+class FacetIndexer:
+    """
+    Summary:
+        Keeps a FacetIndex in sync with the live games through one Firestore listener: its
+        first snapshot builds the index and every later change (a game created, joined,
+        left or deleted) re-indexes just that game. The first snapshot after a restart
+        builds a fresh index, so games deleted while the listener was down are dropped.
+        Like GamesReplica, the listener starts on first use and ready() is False until it
+        has delivered.
+
+        Until then filter() and facet_counts() check the live games one by one, taken
+        from the replica when it is ready and otherwise read from Firestore.
+
+    Args:
+        db: Firestore client
+        replica: GamesReplica or None
+        retry_seconds: minimum time between attempts to restart a dead listener
+    """
+
+    def __init__(self, db, replica=None, retry_seconds=5):
+        self.db = db
+        self.replica = replica
+        self.retry_seconds = retry_seconds
+        self.index = FacetIndex()
+        self._watch = None
+        self._received = False
+        self._start_lock = threading.Lock()
+        self._last_start = 0.0
+
+    def start(self):
+        self.stop()
+        self._last_start = time.monotonic()
+        self._received = False
+        query = self.db.collection("games").where("expires", ">", now_string())
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def _listening(self):
+        return self._watch is not None and self._watch.is_active
+
+    def ready(self):
+        if self._listening():
+            return self._received
+        # One thread starts the listener; the others must not open (and leak) a second one
+        with self._start_lock:
+            if self._listening():
+                return self._received
+            if self._last_start and time.monotonic() - self._last_start < self.retry_seconds:
+                return False
+            if self._last_start:
+                logger.warning("Facet index listener is down, restarting it")
+            try:
+                self.start()
+            except Exception:
+                logger.exception("Error starting facet index listener")
+            return self._listening() and self._received
+
+    def _on_snapshot(self, docs, changes, read_time):
+        if not self._received:
+            # The first snapshot after a (re)start holds every live game: build a new index
+            # from it and swap it in, so reads never see a half-built one
+            index = FacetIndex()
+            index.add_many([(doc.id, doc.to_dict()) for doc in docs])
+            self.index = index
+            self._received = True
+            return
+        updated = []
+        for change in changes:
+            if change.type.name == "REMOVED":
+                self.index.remove(change.document.id)
+            else:
+                updated.append((change.document.id, change.document.to_dict()))
+        if updated:
+            self.index.add_many(updated)
+        self._received = True
+
+    def live_games(self):
+        """Summaries of the live games, from the replica or else one Firestore query."""
+        if self.replica is not None and self.replica.ready():
+            return self.replica.snapshot().games
+        now = now_string()
+        query = self.db.collection("games").where("expires", ">", now)
+        games = (game_summary(doc.id, doc.to_dict()) for doc in query.stream())
+        return [game for game in games if is_live(game, now)]
+
+    def filter(self, filters):
+        """Live games matching filters, from the index once it is ready."""
+        if self.ready():
+            return self.index.filter(filters)
+        return [game for game in self.live_games() if matches(facet_values(game), filters)]
+
+    def facet_counts(self, filters=None):
+        """See FacetIndex.facet_counts; counted game by game until the index is ready."""
+        if self.ready():
+            return self.index.facet_counts(filters)
+        return count_facets(self.live_games(), filters)
+
+    def metric_samples(self):
+        stats = self.index.stats()
+        return [
+            ("facet_index_games", (), stats["games"]),
+            ("facet_index_bitmaps", (), stats["bitmaps"]),
+        ]
+
+
+def init_app(app, db, replica=None):
+    """
+    Summary:
+        Add GET /api/game_facets, the number of live games per facet value, with the same
+        filter parameters as fetch_games (type, pub, daypart, open, area).
+
+    Returns:
+        .JSON + HTTP Status: {"total", "facets": {facet: {value: count}}} with HTTP status
+        200, or 400 for an invalid filter
+    """
+    indexer = FacetIndexer(db, replica)
+    app.extensions["facets"] = indexer
+
+    @app.route("/api/game_facets", methods=["GET"])
+    def game_facets():
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            total, counts = indexer.facet_counts(filters)
+        except Exception as e:
+            logger.exception("Error counting game facets")
+            return jsonify({"error": f"Error counting game facets: {str(e)}"}), 500
+        return jsonify({"total": total, "facets": counts}), 200
+
+    return indexer
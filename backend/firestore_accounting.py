@@ -0,0 +1,88 @@
+import logging
+import os
+import traceback
+
+from flask import current_app, g, has_request_context, request
+
+HEADER = "X-Firestore-Ops"
+
+logger = logging.getLogger(__name__)
+
+# Frames from these files are skipped when looking for the code that issued a query
+_INTERNAL_FILES = (os.path.abspath(__file__), os.path.abspath(os.path.join(os.path.dirname(__file__), "tracked_firestore.py")))
+
+
+class RequestOps:
+    """Firestore operations issued while handling one request."""
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.round_trips = 0
+        self.shapes = {}
+        self.warned = set()
+
+    def header_value(self):
+        return f"reads={self.reads};writes={self.writes};queries={self.queries};round_trips={self.round_trips}"
+
+
+def call_site():
+    """Return 'file:line in function' of the innermost frame outside the Firestore wrappers."""
+    for frame in reversed(traceback.extract_stack()):
+        if os.path.abspath(frame.filename) not in _INTERNAL_FILES:
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+def current_ops():
+    if not has_request_context():
+        return None
+    ops = g.get("firestore_ops")
+    if ops is None:
+        ops = g.firestore_ops = RequestOps()
+    return ops
+
+
+def record_call(call, seconds):
+    """TrackedClient listener adding a round trip to the current request's counts."""
+    ops = current_ops()
+    if ops is None:
+        return
+    ops.round_trips += 1
+    ops.reads += call.reads
+    ops.writes += call.writes
+    if call.op == "query":
+        ops.queries += 1
+    if call.op in ("query", "get"):
+        threshold = current_app.config.get("FIRESTORE_N_PLUS_ONE_THRESHOLD", 5)
+        count = ops.shapes.get(call.shape, 0) + 1
+        ops.shapes[call.shape] = count
+        if count > threshold and call.shape not in ops.warned:
+            ops.warned.add(call.shape)
+            logger.warning("Possible N+1 in %s: %s issued more than %d times, last at %s",
+                           request.path, call.shape, threshold, call_site(),
+                           extra={"route": request.path, "shape": call.shape})
+
+
+def init_app(app, client):
+    """
+    Summary:
+        Count the reads, writes, queries and round trips every request makes through
+        `client` (a TrackedClient), add them to the X-Firestore-Ops response header and log
+        a sample of them. When a request repeats one query shape more than FIRESTORE_N_PLUS_ONE_THRESHOLD
+        times (a query or document read inside a loop) a warning with the call site is logged.
+    """
+    sample_rate = app.config.get("FIRESTORE_OPS_LOG_SAMPLE_RATE", 1.0)
+
+    # Several apps (tests, the factory) can share one client; count each call once
+    if record_call not in client.listeners:
+        client.listeners.append(record_call)
+
+    @app.after_request
+    def _report_ops(response):
+        ops = g.pop("firestore_ops", None) or RequestOps()
+        response.headers[HEADER] = ops.header_value()
+        logger.info("Firestore ops for %s %s: %s", request.method, request.path, ops.header_value(),
+                    extra={"sample_rate": sample_rate})
+        return response
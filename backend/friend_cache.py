@@ -0,0 +1,246 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from bootstrap import IN_QUERY_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Fields of a gamers document shown in a friend list; a change to anything else (e.g. the
+# friend's own friends_list) leaves cached summaries valid
+SUMMARY_FIELDS = ("gamerId", "fullName", "profile", "statusMessage")
+
+# Listeners one cache keeps open, each on up to IN_QUERY_LIMIT cached gamers; entries past
+# them are served as if the listener were down
+MAX_LISTENERS = 100
+
+
+def friend_summary(gamer_id, data):
+    """A fetch_friends entry for a friend's gamers document (None when it does not exist)."""
+    if data is None:
+        return {"gamerId": gamer_id, "fullName": "Unknown User", "profile": "03"}
+    return {
+        "gamerId": gamer_id,
+        "fullName": data.get("fullName", "Unknown"),
+        "profile": data.get("profile", "01"),
+        "statusMessage": data.get("statusMessage", ""),
+    }
+
+
+class FriendSummaryCache:
+    """
+    Summary:
+        Bounded LRU cache of friend summaries keyed by gamerId, so repeated fetch_friends
+        calls skip the friend lookups. Entries are dropped precisely: by the profile routes
+        when they write a gamer, and by listeners for writes made anywhere else (other
+        workers, the console). Only the cached gamers are listened to, IN_QUERY_LIMIT per
+        listener ("gamerId in [...]"): gamers cached by one lookup get their listener at the
+        next, whose first snapshot drops any entry that changed in between, and a listener
+        is closed once none of its gamers is cached. An entry is served for up to `ttl`
+        seconds while its listener is live, and only for `stale_seconds` otherwise.
+
+        Readers take a token() before reading Firestore and pass it to put(), so a read that
+        raced with an invalidation does not put the old data back.
+
+    Args:
+        db: Firestore client
+        max_entries: entries kept before the least recently used is evicted
+        ttl: maximum age of an entry while the listener is live
+        stale_seconds: maximum age of an entry while it is not
+        listen: listen to the cached gamers
+        retry_seconds: minimum time between attempts to restart a dead listener
+    """
+
+    def __init__(self, db, max_entries=10000, ttl=300, stale_seconds=5, listen=True, retry_seconds=5):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.listen = listen
+        self.retry_seconds = retry_seconds
+        self._entries = OrderedDict()  # gamerId -> (doc_id, summary, stored_at)
+        self._doc_keys = {}  # doc_id -> gamerId of its cached entry
+        self._invalidated = OrderedDict()  # gamerId / doc_id -> sequence number
+        self._sequence = itertools.count(1)
+        self._last_sequence = 0
+        self._lock = threading.Lock()
+        self._chunks = {}  # listener number -> [gamerIds, watch or None, last start]
+        self._chunk_of = {}  # gamerId -> number of the listener covering it
+        self._unwatched = OrderedDict()  # cached gamerIds no listener covers yet
+        self._chunk_numbers = itertools.count()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def listen_cached(self):
+        """Close listeners with no cached gamer left, restart dead ones, and cover newly cached gamers."""
+        now = time.monotonic()
+        closing, starting = [], []
+        with self._lock:
+            for number, chunk in list(self._chunks.items()):
+                gamer_ids, watch, last_start = chunk
+                if not any(gamer_id in self._entries for gamer_id in gamer_ids):
+                    del self._chunks[number]
+                    for gamer_id in gamer_ids:
+                        del self._chunk_of[gamer_id]
+                    closing.append(watch)
+                elif (watch is None or not watch.is_active) and now - last_start >= self.retry_seconds:
+                    if watch is not None:
+                        logger.warning("Friend cache listener is down, restarting it")
+                    chunk[2] = now
+                    starting.append(number)
+            pending = [gamer_id for gamer_id in self._unwatched if gamer_id in self._entries]
+            self._unwatched.clear()
+            for i in range(0, len(pending), IN_QUERY_LIMIT):
+                if len(self._chunks) >= MAX_LISTENERS:
+                    break
+                number = next(self._chunk_numbers)
+                self._chunks[number] = [pending[i:i + IN_QUERY_LIMIT], None, now]
+                for gamer_id in pending[i:i + IN_QUERY_LIMIT]:
+                    self._chunk_of[gamer_id] = number
+                starting.append(number)
+            to_start = [(number, list(self._chunks[number][0])) for number in starting]
+
+        for watch in closing:
+            if watch is not None:
+                watch.unsubscribe()
+        # Outside the lock: the first snapshot may invalidate entries
+        for number, gamer_ids in to_start:
+            try:
+                watch = self.db.collection("gamers").where("gamerId", "in", gamer_ids).on_snapshot(self._on_snapshot)
+            except Exception:
+                logger.exception("Error starting friend cache listener")
+                continue
+            with self._lock:
+                chunk = self._chunks.get(number)
+                if chunk is None:
+                    watch.unsubscribe()
+                else:
+                    chunk[1] = watch
+
+    def stop(self):
+        with self._lock:
+            watches = [watch for _, watch, _ in self._chunks.values() if watch is not None]
+            self._chunks.clear()
+            self._chunk_of.clear()
+            self._unwatched.clear()
+        for watch in watches:
+            watch.unsubscribe()
+
+    def _watched(self, gamer_id):
+        number = self._chunk_of.get(gamer_id)
+        if number is None:
+            return False
+        watch = self._chunks[number][1]
+        return watch is not None and watch.is_active
+
+    def listeners(self):
+        with self._lock:
+            return sum(1 for _, watch, _ in self._chunks.values() if watch is not None and watch.is_active)
+
+    def token(self):
+        """Call before reading Firestore; pass the result to put()."""
+        with self._lock:
+            return self._last_sequence
+
+    def get_many(self, gamer_ids):
+        """Returns ({gamerId: summary} for the fresh entries, [gamerIds to read])."""
+        if self.listen:
+            self.listen_cached()
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for gamer_id in gamer_ids:
+                entry = self._entries.get(gamer_id)
+                max_age = self.ttl if self.listen and self._watched(gamer_id) else self.stale_seconds
+                if entry is not None and now - entry[2] <= max_age:
+                    self._entries.move_to_end(gamer_id)
+                    found[gamer_id] = entry[1]
+                else:
+                    missing.append(gamer_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put(self, token, doc_id, data):
+        """Cache the summary of a gamers document read after token() was taken."""
+        gamer_id = data.get("gamerId")
+        if gamer_id is None:
+            return
+        with self._lock:
+            if max(self._invalidated.get(gamer_id, 0), self._invalidated.get(doc_id, 0)) > token:
+                return
+            self._store(gamer_id, doc_id, friend_summary(gamer_id, data))
+            if self.listen and gamer_id not in self._chunk_of:
+                self._unwatched[gamer_id] = None
+
+    def _store(self, gamer_id, doc_id, summary):
+        self._entries[gamer_id] = (doc_id, summary, time.monotonic())
+        self._entries.move_to_end(gamer_id)
+        self._doc_keys[doc_id] = gamer_id
+        while len(self._entries) > self.max_entries:
+            _, (evicted_doc_id, _, _) = self._entries.popitem(last=False)
+            self._doc_keys.pop(evicted_doc_id, None)
+            self.evictions += 1
+
+    def _mark(self, key):
+        sequence = next(self._sequence)
+        self._last_sequence = sequence
+        self._invalidated[key] = sequence
+        self._invalidated.move_to_end(key)
+        # Only reads still in flight need the marks, so a bounded history is enough
+        while len(self._invalidated) > self.max_entries:
+            self._invalidated.popitem(last=False)
+
+    def invalidate(self, doc_id, gamer_id=None):
+        """Drop the entry for a gamers document, by its document ID and/or gamerId."""
+        with self._lock:
+            keys = {self._doc_keys.pop(doc_id, None), gamer_id}
+            self._mark(doc_id)
+            for key in keys - {None}:
+                self._mark(key)
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._doc_keys.pop(entry[0], None)
+                    self.invalidations += 1
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            doc_id = change.document.id
+            with self._lock:
+                cached_key = self._doc_keys.get(doc_id)
+                entry = self._entries.get(cached_key) if cached_key is not None else None
+            if entry is None:
+                continue
+            data = change.document.to_dict() if change.type.name != "REMOVED" else None
+            if data is not None and data.get("gamerId") == cached_key and \
+                    friend_summary(cached_key, data) == entry[1]:
+                # Only non-summary fields changed
+                continue
+            self.invalidate(doc_id, cached_key)
+
+    def metric_samples(self):
+        return [
+            ("friend_cache_entries", (), len(self._entries)),
+            ("friend_cache_listeners", (), self.listeners()),
+            ("friend_cache_requests_total", (("result", "hit"),), self.hits),
+            ("friend_cache_requests_total", (("result", "miss"),), self.misses),
+            ("friend_cache_evictions_total", (), self.evictions),
+            ("friend_cache_invalidations_total", (), self.invalidations),
+        ]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "listeners": self.listeners(),
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
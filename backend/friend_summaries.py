@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from bootstrap import IN_QUERY_LIMIT
+from friend_cache import SUMMARY_FIELDS, friend_summary
+
+# Map on each gamers document: {friend's gamerId: {"fullName", "profile", "statusMessage"}}
+SUMMARIES_FIELD = "friend_summaries"
+DISPLAY_FIELDS = tuple(field for field in SUMMARY_FIELDS if field != "gamerId")
+
+# Firestore allows at most 500 operations per batch
+BATCH_LIMIT = 500
+# Jobs for the same gamer never run at the same time (so an older read is never written
+# after a newer one); gamers share this many locks
+LOCK_STRIPES = 64
+
+logger = logging.getLogger(__name__)
+
+
+def stored_summary(data):
+    """The display fields of a gamers document, as kept in its friends' friend_summaries."""
+    return {field: data[field] for field in DISPLAY_FIELDS if field in data}
+
+
+# Stored for a friend whose gamers document does not exist (until a fan-out or repair finds one)
+MISSING_SUMMARY = stored_summary(friend_summary(None, None))
+
+
+def summary_path(gamer_id):
+    # Plain dotted path: gamer IDs are generated alphanumerics
+    return f"{SUMMARIES_FIELD}.{gamer_id}"
+
+
+def expected_summaries(data, summaries_by_id):
+    """
+    What a gamer's friend_summaries should hold, given {gamerId: stored summary}. Friends
+    without a gamers document get the "Unknown User" summary fetch_friends shows for them,
+    so their entry counts as present and reads stop asking for a repair.
+    """
+    return {friend_id: summaries_by_id.get(friend_id, MISSING_SUMMARY)
+            for friend_id in data.get("friends_list") or []}
+
+
+def denormalized_friends(data):
+    """
+    Summary:
+        Build the fetch_friends list from a gamers document's own friend_summaries.
+
+    Returns:
+        (list, list): the friend entries (None where a summary is missing) and the
+        gamerIds of the friends without a summary
+    """
+    summaries = data.get(SUMMARIES_FIELD) or {}
+    friends = []
+    missing = []
+    for friend_id in data.get("friends_list") or []:
+        stored = summaries.get(friend_id)
+        if stored is None:
+            missing.append(friend_id)
+            friends.append(None)
+        else:
+            friends.append(friend_summary(friend_id, stored))
+    return friends, missing
+
+
+class FriendSummaryFanOut:
+    """
+    Summary:
+        Copies a gamer's display fields into the friend_summaries of everyone who has them
+        as a friend, after a profile change. Runs on a small thread pool so the request
+        only queues the work; a gamer queued twice before its fan-out starts is fanned out
+        once, with the latest data (it is read when the job runs, not when it is queued).
+        Followers are updated with chunked batch writes of at most 500 documents.
+
+        The same pool rebuilds a single gamer's own friend_summaries (repair_one) when a
+        read finds entries missing.
+
+    Args:
+        db: Firestore client
+        max_workers: fan-outs running at the same time
+        batch_size: documents written per batch commit
+    """
+
+    def __init__(self, db, max_workers=2, batch_size=BATCH_LIMIT):
+        self.db = db
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="friend-fanout")
+        self._queued = set()
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._doc_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.fanned_out = 0
+        self.failures = 0
+
+    def submit(self, doc_id):
+        """Queue a fan-out for the gamers document doc_id."""
+        return self._queue(self.fan_out, doc_id)
+
+    def submit_repair(self, doc_id):
+        """Queue a rebuild of doc_id's own friend_summaries."""
+        return self._queue(self.repair_one, doc_id)
+
+    def _queue(self, job, doc_id):
+        key = (job.__name__, doc_id)
+        with self._lock:
+            if key in self._queued:
+                return None
+            self._queued.add(key)
+            future = self._executor.submit(self._run, key, job, doc_id)
+            self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return future
+
+    def flush(self, timeout=None):
+        """Wait for the jobs queued so far to finish."""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout)
+
+    def _run(self, key, job, doc_id):
+        with self._doc_locks[hash(doc_id) % LOCK_STRIPES]:
+            with self._lock:
+                self._queued.discard(key)
+            try:
+                return job(doc_id)
+            except Exception:
+                self.failures += 1
+                logger.exception("Friend summary %s failed for %s", job.__name__, doc_id)
+                return None
+
+    def fan_out(self, doc_id):
+        """Write doc_id's current summary into every follower's document. Returns the count."""
+        started = time.perf_counter()
+        doc = self.db.collection("gamers").document(doc_id).get()
+        if not doc.exists:
+            return 0
+        data = doc.to_dict()
+        gamer_id = data.get("gamerId")
+        if not gamer_id:
+            return 0
+
+        update = {summary_path(gamer_id): stored_summary(data)}
+        query = self.db.collection("gamers").where("friends_list", "array_contains", gamer_id)
+        written = 0
+        batch = self.db.batch()
+        pending = 0
+        for follower in query.stream():
+            batch.update(follower.reference, update)
+            pending += 1
+            if pending == self.batch_size:
+                batch.commit()
+                written += pending
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+            written += pending
+
+        self.fanned_out += 1
+        logger.info("Friend summaries fanned out", extra={
+            "gamer": doc_id, "followers": written,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)})
+        return written
+
+    def repair_one(self, doc_id):
+        """Rebuild one gamer's friend_summaries from their friends' documents."""
+        ref = self.db.collection("gamers").document(doc_id)
+        doc = ref.get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        friend_ids = list(dict.fromkeys(data.get("friends_list") or []))
+        summaries_by_id = {}
+        for start in range(0, len(friend_ids), IN_QUERY_LIMIT):
+            query = self.db.collection("gamers").where("gamerId", "in", friend_ids[start:start + IN_QUERY_LIMIT])
+            for friend in query.stream():
+                friend_data = friend.to_dict()
+                summaries_by_id[friend_data.get("gamerId")] = stored_summary(friend_data)
+        expected = expected_summaries(data, summaries_by_id)
+        if (data.get(SUMMARIES_FIELD) or {}) != expected:
+            ref.update({SUMMARIES_FIELD: expected})
+        return expected
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class FriendSummaryRepair:
+    """
+    Summary:
+        Scheduled job that fixes drift in the denormalized friend summaries (a missed or
+        failed fan-out, friends added or removed by other clients): one scan of gamers
+        builds every gamer's expected friend_summaries, and only documents whose stored
+        map differs are rewritten, in batches.
+
+    Args:
+        db: Firestore client
+        batch_size: documents written per batch commit
+    """
+
+    def __init__(self, db, batch_size=BATCH_LIMIT):
+        self.db = db
+        self.batch_size = batch_size
+        self.last_run = None
+
+    def repair(self):
+        started = time.perf_counter()
+        docs = [(doc.reference, doc.to_dict()) for doc in self.db.collection("gamers").stream()]
+        summaries_by_id = {data["gamerId"]: stored_summary(data) for _, data in docs if data.get("gamerId")}
+
+        repaired = 0
+        batch = self.db.batch()
+        pending = 0
+        for ref, data in docs:
+            expected = expected_summaries(data, summaries_by_id)
+            if (data.get(SUMMARIES_FIELD) or {}) == expected:
+                continue
+            batch.update(ref, {SUMMARIES_FIELD: expected})
+            pending += 1
+            if pending == self.batch_size:
+                batch.commit()
+                repaired += pending
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+            repaired += pending
+
+        self.last_run = {
+            "scanned": len(docs),
+            "repaired": repaired,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        logger.info("Friend summaries repaired", extra=self.last_run)
+        return self.last_run
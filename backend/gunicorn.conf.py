@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+
+# Production serving: gunicorn -c gunicorn.conf.py wsgi:app  (run from backend/)
+# Every setting can be overridden from the environment.
+
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+
+# Requests spend most of their time waiting on Firestore, so each worker process also
+# runs a few threads; processes give CPU parallelism (JSON, images), threads cover I/O waits
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Tells the app how many workers share the host, so per-worker pools (uploads.py) split its cores
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Import the app once in the master and fork it. Safe because create_app opens no
+# connections and starts no threads: Firestore/Storage clients are created per worker.
+preload_app = True
+
+# Idle keep-alive connections are parked in the worker's poller (not a thread), so keep
+# them open longer than the usual 60s load balancer / proxy idle timeout; a shorter
+# server timeout makes the proxy reuse connections the server is closing
+keepalive = int(os.environ.get("KEEPALIVE_SECONDS", 65))
+worker_connections = 1000
+
+# SIGTERM: stop accepting, let in-flight requests finish for up to graceful_timeout,
+# then run worker_exit (drains queued uploads, stops the scheduler and hands its job
+# leases over, stops the replica)
+timeout = 30
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+
+accesslog = os.environ.get("ACCESS_LOG")
+
+
+def post_worker_init(worker):
+    # Create this worker's own Firestore client (and gRPC channel) before the first request
+    import clients
+    clients.firestore_client.get()
+
+    # Every worker schedules the jobs; each job's lease lets exactly one of them run it,
+    # and another worker takes over when the leader dies (SCHEDULER_LEASE, see leader.py)
+    if os.environ.get("RUN_SCHEDULER") == "1":
+        from main import start_scheduler
+        start_scheduler(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from flask import Flask
+    from main import shutdown_app
+
+    # wsgi is missing (or an error app) when the worker failed to load the app
+    app = getattr(worker, "wsgi", None)
+    if isinstance(app, Flask):
+        shutdown_app(app)
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+
+from PIL import Image, ImageOps
+from werkzeug.security import safe_join
+
+# Widths the app can ask for; any requested width is snapped up to one of these so the
+# number of variants per image stays bounded
+VARIANT_WIDTHS = {"thumb": 160, "small": 320, "medium": 640, "large": 1280}
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Variants are only cacheable forever when the URL names the source version (?v=)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def snap_width(requested):
+    widths = sorted(VARIANT_WIDTHS.values())
+    for width in widths:
+        if requested <= width:
+            return width
+    return widths[-1]
+
+
+def negotiate_format(accept_header, requested=None):
+    """Pick WebP when the client accepts it (or asked for it), JPEG otherwise."""
+    if requested in FORMATS:
+        return requested
+    if accept_header and "image/webp" in accept_header:
+        return "webp"
+    return "jpeg"
+
+
+class ImageVariants:
+    """
+    Summary:
+        Resized WebP/JPEG variants of the images in `folder`, generated on first request
+        and stored under `cache_folder` with names that include a hash of the source bytes,
+        so a replaced source image never serves an old variant.
+    """
+
+    def __init__(self, folder, cache_folder=None):
+        self.folder = folder
+        self.cache_folder = cache_folder or os.path.join(folder, ".variants")
+        self._versions = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def source_path(self, filename):
+        path = safe_join(self.folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        return path
+
+    def version(self, filename):
+        """Content hash of the source image, recomputed only when the file changes."""
+        path = self.source_path(filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+            key = (path, stat.st_mtime_ns, stat.st_size)
+            version = self._versions.get(path)
+            if version is None or version[0] != key:
+                digest = hashlib.sha256()
+                with open(path, "rb") as source:
+                    for chunk in iter(lambda: source.read(65536), b""):
+                        digest.update(chunk)
+                version = (key, digest.hexdigest()[:16])
+                self._versions[path] = version
+        except FileNotFoundError:
+            # Removed since the check above
+            return None
+        return version[1]
+
+    def variant(self, filename, width, fmt):
+        """
+        Return (path, etag, mimetype) of the variant, generating it if needed; None if there
+        is no source (or it is removed meanwhile). Raises PIL's UnidentifiedImageError when
+        the source is not an image PIL can read.
+        """
+        version = self.version(filename)
+        if version is None:
+            return None
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        name = f"{stem}.{version}.w{width}.{fmt}"
+        path = os.path.join(self.cache_folder, name)
+        if not os.path.exists(path):
+            with self._lock_for(name):
+                if not os.path.exists(path):
+                    source = self.source_path(filename)
+                    if source is None:
+                        return None
+                    try:
+                        self._generate(source, path, width, fmt)
+                    except FileNotFoundError:
+                        return None
+        return path, f"{version}-w{width}-{fmt}", FORMATS[fmt][1]
+
+    def _lock_for(self, name):
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _generate(self, source, target, width, fmt):
+        os.makedirs(self.cache_folder, exist_ok=True)
+        pil_format, _, options = FORMATS[fmt]
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[-1])
+                image = background
+            # Write then rename so concurrent readers never see a half-written file
+            temp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            image.save(temp, pil_format, **options)
+        os.replace(temp, target)
@@ -0,0 +1,164 @@
+import random
+
+
+class _Node:
+    __slots__ = ("start", "end", "key", "value", "priority", "left", "right", "max_end")
+
+    def __init__(self, start, end, key, value):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.value = value
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+    def update(self):
+        self.max_end = self.end
+        if self.left is not None and self.left.max_end > self.max_end:
+            self.max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > self.max_end:
+            self.max_end = self.right.max_end
+
+
+def _rotate_right(node):
+    top = node.left
+    node.left = top.right
+    top.right = node
+    node.update()
+    top.update()
+    return top
+
+
+def _rotate_left(node):
+    top = node.right
+    node.right = top.left
+    top.left = node
+    node.update()
+    top.update()
+    return top
+
+
+class IntervalTree:
+    """
+    Summary:
+        Intervals [start, end) with a unique key each, in a treap (a binary search tree
+        kept balanced by random priorities) ordered by (start, key). Every node also
+        holds the largest end in its subtree, so a query skips whole subtrees that end
+        too early and stops at the first start that is too late: covering and
+        overlapping queries take O(log n + k) for k results, and adding or removing an
+        interval O(log n). Start and end may be any comparable values (timestamps,
+        "HH:MM" strings).
+
+        Not thread-safe; callers hold their own lock.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._starts = {}  # key -> start, to find a node from its key
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __contains__(self, key):
+        return key in self._starts
+
+    def add(self, start, end, key, value=None):
+        """Add an interval, replacing any with the same key."""
+        self.remove(key)
+        self._root = self._insert(self._root, _Node(start, end, key, value))
+        self._starts[key] = start
+
+    def _insert(self, node, new):
+        if node is None:
+            return new
+        if (new.start, new.key) < (node.start, node.key):
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = _rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = _rotate_left(node)
+        node.update()
+        return node
+
+    def remove(self, key):
+        """Remove the interval with key; returns its value, or None if there is none."""
+        if key not in self._starts:
+            return None
+        removed = []
+        self._root = self._delete(self._root, (self._starts.pop(key), key), removed)
+        return removed[0].value
+
+    def _delete(self, node, target, removed):
+        position = (node.start, node.key)
+        if target < position:
+            node.left = self._delete(node.left, target, removed)
+        elif target > position:
+            node.right = self._delete(node.right, target, removed)
+        else:
+            removed.append(node)
+            return self._join(node.left, node.right)
+        node.update()
+        return node
+
+    def _join(self, left, right):
+        # Merge two treaps where every position in left comes before every one in right
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self._join(left.right, right)
+            left.update()
+            return left
+        right.left = self._join(left, right.left)
+        right.update()
+        return right
+
+    def _find(self, start_limit, end_limit, strict):
+        """
+        (start, end, key, value) of the intervals with start < start_limit and end >
+        end_limit (<= and >= when not strict), in (start, key) order.
+        """
+        found = []
+        stack = []
+        node = self._root
+        while True:
+            # Walk left, skipping subtrees that end too early
+            while node is not None and (node.max_end > end_limit if strict else node.max_end >= end_limit):
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return found
+            node = stack.pop()
+            if not (node.start < start_limit if strict else node.start <= start_limit):
+                # Every later node in order starts at least as late
+                return found
+            if node.end > end_limit if strict else node.end >= end_limit:
+                found.append((node.start, node.end, node.key, node.value))
+            node = node.right
+
+    def covering(self, start, end):
+        """Intervals that contain all of [start, end]."""
+        return self._find(start, end, strict=False)
+
+    def overlapping(self, start, end):
+        """Intervals that share any time with [start, end) (touching ends do not count)."""
+        return self._find(end, start, strict=True)
+
+    def items(self):
+        """Every (start, end, key, value), in (start, key) order."""
+        found = []
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            found.append((node.start, node.end, node.key, node.value))
+            node = node.right
+        return found
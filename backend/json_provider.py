@@ -0,0 +1,106 @@
+import re
+from datetime import date, datetime
+
+import orjson
+from flask.json.provider import JSONProvider
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import DocumentReference, GeoPoint
+
+# Timestamps with an explicit offset, which revive() turns back into datetimes
+TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,9})?(Z|[+-]\d{2}:\d{2})")
+
+
+def default(obj):
+    """Encode the types orjson does not handle natively (it rejects datetime subclasses)."""
+    if isinstance(obj, DatetimeWithNanoseconds):
+        return obj.rfc3339() if obj.tzinfo is not None else obj.isoformat()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, GeoPoint):
+        return {"latitude": obj.latitude, "longitude": obj.longitude}
+    # TrackedDocument wraps the real reference
+    ref = getattr(obj, "_wrapped", obj)
+    if isinstance(ref, DocumentReference):
+        return ref.path
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj, indent=False, sort_keys=False):
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, default=default, option=option)
+
+
+def revive(value):
+    """
+    Summary:
+        Turn decoded JSON back into Firestore types: RFC 3339 timestamps with an offset
+        become DatetimeWithNanoseconds and {"latitude", "longitude"} objects become GeoPoints.
+        Document references are sent as plain path strings and are left as strings.
+
+        Only for values known to hold those types. Request bodies are never revived: the
+        app sends times as toISOString() strings ("...Z") and the documents store them as
+        strings, which the backend compares as strings.
+    """
+    if isinstance(value, str):
+        if len(value) >= 20 and TIMESTAMP.fullmatch(value):
+            try:
+                return DatetimeWithNanoseconds.from_rfc3339(value.replace("+00:00", "Z"))
+            except ValueError:
+                pass
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        return value
+    if isinstance(value, list):
+        return [revive(item) for item in value]
+    if isinstance(value, dict):
+        if (len(value) == 2 and isinstance(value.get("latitude"), (int, float))
+                and isinstance(value.get("longitude"), (int, float))):
+            return GeoPoint(value["latitude"], value["longitude"])
+        return {key: revive(item) for key, item in value.items()}
+    return value
+
+
+def loads_bytes(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return orjson.loads(data)
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Summary:
+        Flask JSON provider backed by orjson, used by jsonify and request.get_json.
+        Datetimes (including Firestore's DatetimeWithNanoseconds) are sent as RFC 3339
+        strings, GeoPoints as {"latitude", "longitude"} and document references as their
+        path. Decoding is plain JSON: strings stay strings (see revive).
+    """
+
+    mimetype = "application/json"
+    sort_keys = False
+    compact = None
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj, indent=kwargs.get("indent"), sort_keys=kwargs.get("sort_keys", self.sort_keys)).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads_bytes(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # Build the body as bytes directly, skipping the str round trip
+        body = dumps_bytes(obj, indent=indent, sort_keys=self.sort_keys) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.json_provider_class = OrjsonProvider
+    app.json = OrjsonProvider(app)
@@ -0,0 +1,206 @@
+import fcntl
+import logging
+import os
+import socket
+import time
+import uuid
+
+from firebase_admin import firestore
+
+import metrics
+
+# Scheduled jobs start in every worker; a lease per job decides which one actually runs it.
+# "firestore" leases work across hosts, "file" leases (flock) only between the workers of
+# one host, and "none" runs every job in every process that schedules it.
+LEASE_COLLECTION = "scheduler_leases"
+
+logger = logging.getLogger(__name__)
+
+
+def holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class FirestoreLease:
+    """
+    Summary:
+        A lease held in the scheduler_leases/<name> document: {"holder", "expires_at"}.
+        acquire() takes the lease in a transaction if it is free, expired or already ours,
+        and pushes its expiry ttl seconds ahead; a leader that dies simply stops renewing,
+        and the first worker to try after the expiry takes over. Expiries are wall-clock
+        epoch seconds, so hosts need roughly synchronized clocks (well within the TTL).
+
+    Args:
+        db: Firestore client
+        name: lease (job) name, used as the document ID
+        ttl: seconds the lease stays valid after each acquire
+    """
+
+    def __init__(self, db, name, ttl, holder=None):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or holder_id()
+
+    def _ref(self):
+        return self.db.collection(LEASE_COLLECTION).document(self.name)
+
+    def acquire(self):
+        """Take or renew the lease. Returns True while this process is the leader."""
+        ref = self._ref()
+
+        @firestore.transactional
+        def claim(transaction):
+            now = time.time()
+            snapshot = ref.get(transaction=transaction)
+            lease = snapshot.to_dict() if snapshot.exists else None
+            if lease and lease.get("holder") != self.holder and lease.get("expires_at", 0) > now:
+                return False
+            transaction.set(ref, {"holder": self.holder, "expires_at": now + self.ttl})
+            return True
+
+        return claim(self.db.transaction())
+
+    def release(self):
+        """Give the lease up (on shutdown) so another worker can take over without waiting."""
+        ref = self._ref()
+
+        @firestore.transactional
+        def drop(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and (snapshot.to_dict() or {}).get("holder") == self.holder:
+                transaction.delete(ref)
+
+        drop(self.db.transaction())
+
+
+class FileLease:
+    """
+    Summary:
+        A lease held as an exclusive flock on <directory>/<name>.lock, for the workers of a
+        single host. The kernel drops the lock when the holding process exits, so there is
+        no TTL: another worker takes over on its next attempt.
+
+    Args:
+        directory: where the lock files are created
+        name: lease (job) name
+    """
+
+    def __init__(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+        self.path = os.path.join(directory, f"{safe_name}.lock")
+        self.name = name
+        self._file = None
+        self._pid = None
+
+    def acquire(self):
+        if self._file is not None and self._pid == os.getpid():
+            return True
+        # A descriptor inherited through fork shares the parent's lock; it is not ours
+        self._file = None
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        self._pid = os.getpid()
+        return True
+
+    def release(self):
+        if self._file is not None and self._pid == os.getpid():
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._file = None
+
+
+class NoLease:
+    """Always the leader: every process that schedules the job runs it."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class LeaderJob:
+    """
+    Summary:
+        Wraps a scheduled job so it only runs in the process holding its lease. Each tick
+        renews the lease before running; ticks where another process leads are skipped.
+        Runs are recorded in /metrics as scheduled_job_runs_total{job, result} (ok, error,
+        skipped or lease_error) and scheduled_job_duration_seconds{job}.
+
+    Args:
+        lease: FirestoreLease, FileLease or NoLease for this job
+        name: job name used in logs and metric labels
+        func: the job itself
+    """
+
+    def __init__(self, lease, name, func):
+        self.lease = lease
+        self.name = name
+        self.func = func
+
+    def _count(self, result):
+        metrics.registry.inc("scheduled_job_runs_total", (("job", self.name), ("result", result)))
+
+    def __call__(self):
+        try:
+            leader = self.lease.acquire()
+        except Exception:
+            logger.exception("Could not acquire the lease for job %s", self.name)
+            self._count("lease_error")
+            return None
+        if not leader:
+            self._count("skipped")
+            return None
+
+        started = time.perf_counter()
+        result = "error"
+        try:
+            value = self.func()
+            result = "ok"
+            return value
+        except Exception:
+            logger.exception("Scheduled job %s failed", self.name)
+            return None
+        finally:
+            seconds = time.perf_counter() - started
+            metrics.registry.observe("scheduled_job_duration_seconds", (("job", self.name),), seconds)
+            self._count(result)
+            logger.info("Scheduled job %s finished", self.name,
+                        extra={"job": self.name, "result": result, "duration_ms": round(seconds * 1000, 1)})
+
+
+def lease_factory(kind, db=None, directory=None):
+    """Returns make_lease(name, ttl) for the configured lease kind."""
+    if kind == "firestore":
+        return lambda name, ttl: FirestoreLease(db, name, ttl)
+    if kind == "file":
+        return lambda name, ttl: FileLease(directory, name)
+    if kind == "none":
+        return lambda name, ttl: NoLease(name)
+    raise ValueError(f"Unknown scheduler lease kind: {kind}")
+
+
+def add_job(scheduler, make_lease, job_id, func, minutes):
+    """
+    Summary:
+        Schedule func every `minutes` under a lease. The lease lasts two intervals, so the
+        leader keeps it while it is alive and another worker takes over about one missed
+        run after it dies.
+
+    Returns:
+        LeaderJob: the wrapped job (its lease is released on shutdown)
+    """
+    job = LeaderJob(make_lease(job_id, minutes * 60 * 2), job_id, func)
+    # max_instances=1 (the default) also keeps a slow run from overlapping the next tick
+    scheduler.add_job(id=job_id, func=job, trigger='interval', minutes=minutes)
+    return job
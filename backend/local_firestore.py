@@ -0,0 +1,423 @@
+import copy
+import enum
+import itertools
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1.transforms import (
+    ArrayRemove, ArrayUnion, Increment, Sentinel, DELETE_FIELD
+)
+
+# In-memory stand-in for the parts of the Firestore client used by the backend, used by
+# the tests and, with FIRESTORE_BACKEND=local, to run the server for benchmarks.
+# Every call that would be a network round trip is counted in `round_trips`, and can be
+# slowed by an injected latency (see LatencyModel) to mimic a real network.
+# One lock guards the store so request threads can share a client.
+
+_ids = itertools.count(1)
+
+ChangeType = enum.Enum("ChangeType", ["ADDED", "MODIFIED", "REMOVED"])
+DocumentChange = namedtuple("DocumentChange", ["type", "document"])
+
+
+class LatencyModel:
+    """
+    Summary:
+        Round-trip delays drawn from a log-normal distribution, the usual shape of network
+        and database latency: most calls take about the median and a long tail reaches p99.
+
+    Args:
+        median_ms: median delay
+        p99_ms: 99th percentile delay (the median when not given, i.e. a fixed delay)
+        seed: seeds the random draws, for repeatable runs
+    """
+
+    def __init__(self, median_ms, p99_ms=None, seed=None):
+        self.median = median_ms / 1000
+        p99 = (p99_ms if p99_ms is not None else median_ms) / 1000
+        if p99 < self.median:
+            raise ValueError("p99 latency must not be below the median")
+        # 2.326 is the 99th percentile of the standard normal distribution
+        self.sigma = math.log(p99 / self.median) / 2.326 if self.median else 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec):
+        """A model from "median_ms" or "median_ms,p99_ms" (e.g. "8,60"), or None for an empty spec."""
+        if not spec:
+            return None
+        values = [float(value) for value in spec.split(",")]
+        if len(values) > 2:
+            raise ValueError(f"Expected median_ms[,p99_ms], got {spec!r}")
+        return cls(*values)
+
+    def __call__(self):
+        if not self.sigma:
+            return self.median
+        with self._lock:
+            return self.median * math.exp(self._random.gauss(0, self.sigma))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _apply_value(current, value):
+    if isinstance(value, ArrayUnion):
+        result = list(current or [])
+        for item in value.values:
+            if item not in result:
+                result.append(item)
+        return result
+    if isinstance(value, ArrayRemove):
+        return [item for item in (current or []) if item not in value.values]
+    if isinstance(value, Increment):
+        return (current or 0) + value.value
+    if isinstance(value, Sentinel):
+        return _now()
+    return copy.deepcopy(value)
+
+
+def _set_path(data, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    if value is DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = _apply_value(data.get(parts[-1]), value)
+
+
+def _merge(current, value):
+    for key, sub_value in value.items():
+        if isinstance(sub_value, dict) and isinstance(current.get(key), dict):
+            _merge(current[key], sub_value)
+        else:
+            current[key] = _apply_value(current.get(key), sub_value)
+
+
+def _get_path(data, path):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _matches(data, field, op, value):
+    current = _get_path(data, field)
+    try:
+        if op == "==":
+            return current == value
+        if op == "!=":
+            return current is not None and current != value
+        if op == "in":
+            return current in value
+        if op == "not-in":
+            return current is not None and current not in value
+        if op == "array_contains":
+            return isinstance(current, list) and value in current
+        if op == "array_contains_any":
+            return isinstance(current, list) and any(v in current for v in value)
+        if current is None:
+            return False
+        if op == "<":
+            return current < value
+        if op == "<=":
+            return current <= value
+        if op == ">":
+            return current > value
+        if op == ">=":
+            return current >= value
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class LocalSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = copy.deepcopy(data) if data is not None else None
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return _get_path(self._data or {}, field)
+
+
+class LocalDocumentReference:
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self._collection = collection_name
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    @property
+    def parent(self):
+        return LocalCollectionReference(self._client, self._collection)
+
+    def _store(self):
+        return self._client._collections.setdefault(self._collection, {})
+
+    def get(self, transaction=None):
+        # Reads in a transaction need no extra isolation: the transaction holds the lock
+        self._client._count(reads=1)
+        return self._client._read(self)
+
+    def set(self, data, merge=False):
+        self._client._count(writes=1)
+        self._client._write(self, "set", data, merge)
+
+    def update(self, data):
+        self._client._count(writes=1)
+        self._client._write(self, "update", data)
+
+    def delete(self):
+        self._client._count(writes=1)
+        self._client._write(self, "delete")
+
+
+class LocalQuery:
+    def __init__(self, client, collection_name, filters=(), orders=(), limit=None):
+        self._client = client
+        self._collection = collection_name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+
+    def where(self, field, op, value):
+        return LocalQuery(self._client, self._collection,
+                         self._filters + ((field, op, value),), self._orders, self._limit)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return LocalQuery(self._client, self._collection, self._filters,
+                         self._orders + ((field, direction),), self._limit)
+
+    def limit(self, count):
+        return LocalQuery(self._client, self._collection, self._filters, self._orders, count)
+
+    def _results(self):
+        with self._client._lock:
+            store = self._client._collections.get(self._collection, {})
+            results = [
+                LocalSnapshot(LocalDocumentReference(self._client, self._collection, doc_id), data)
+                for doc_id, data in store.items()
+                if all(_matches(data, *f) for f in self._filters)
+            ]
+        for field, direction in reversed(self._orders):
+            results.sort(key=lambda snap: (snap.get(field) is None, snap.get(field)),
+                         reverse=direction == "DESCENDING")
+        if self._limit is not None:
+            results = results[:self._limit]
+        return results
+
+    def stream(self):
+        results = self._results()
+        self._client._count(queries=1, reads=max(len(results), 1))
+        return iter(results)
+
+    def get(self):
+        return list(self.stream())
+
+    def _accepts(self, data):
+        return data is not None and all(_matches(data, *f) for f in self._filters)
+
+    def on_snapshot(self, callback):
+        watch = LocalWatch(self, callback)
+        self._client._watches.append(watch)
+        results = self._results()
+        watch.push([DocumentChange(ChangeType.ADDED, snap) for snap in results])
+        return watch
+
+
+class LocalWatch:
+    """Listener that is called synchronously with every write to its query."""
+
+    def __init__(self, query, callback):
+        self.query = query
+        self.callback = callback
+        self.is_active = True
+
+    def push(self, changes):
+        if self.is_active:
+            # Billed a read per document delivered, and one for an empty first snapshot
+            self.query._client._count_listened(max(len(changes), 1))
+            self.callback([change.document for change in changes], changes, _now())
+
+    def notify(self, ref, before, after):
+        was_in, is_in = self.query._accepts(before), self.query._accepts(after)
+        if is_in:
+            change = ChangeType.MODIFIED if was_in else ChangeType.ADDED
+            self.push([DocumentChange(change, LocalSnapshot(ref, after))])
+        elif was_in:
+            self.push([DocumentChange(ChangeType.REMOVED, LocalSnapshot(ref, before))])
+
+    def unsubscribe(self):
+        self.is_active = False
+
+
+class LocalCollectionReference(LocalQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return LocalDocumentReference(self._client, self._collection, doc_id or f"doc{next(_ids)}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return _now(), ref
+
+
+class LocalWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref, "set", data, merge))
+
+    def update(self, ref, data):
+        self._ops.append((ref, "update", data, False))
+
+    def delete(self, ref):
+        self._ops.append((ref, "delete", None, False))
+
+    def commit(self):
+        self._client._count(commits=1, writes=len(self._ops))
+        for ref, op, data, merge in self._ops:
+            self._client._write(ref, op, data, merge)
+        self._ops = []
+
+
+class LocalTransaction(LocalWriteBatch):
+    """
+    Transaction driven by firestore.transactional, which calls the private _begin/_commit/
+    _rollback/_clean_up hooks. The store lock is held from _begin to commit or rollback,
+    so transactions are serialized and never need to be retried.
+    """
+
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._lock.acquire()
+        self._id = next(_ids)
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._finish()
+
+    def _rollback(self):
+        self._finish()
+
+    def _finish(self):
+        if self._id is not None:
+            self._client._lock.release()
+        self._clean_up()
+
+
+class LocalFirestore:
+    def __init__(self, data=None, latency=None):
+        self._collections = {}
+        self._watches = []
+        self._lock = threading.RLock()
+        # Called for the delay (in seconds) of each round trip, e.g. a LatencyModel
+        self.latency = latency
+        self.counts = {"reads": 0, "writes": 0, "queries": 0, "commits": 0, "round_trips": 0}
+        for collection_name, docs in (data or {}).items():
+            self._collections[collection_name] = copy.deepcopy(docs)
+
+    def _count(self, **amounts):
+        with self._lock:
+            for kind, amount in amounts.items():
+                self.counts[kind] += amount
+            self.counts["round_trips"] += 1
+        # Outside the lock, so concurrent calls wait in parallel as they would on the network
+        # (a transaction still holds the store lock while it waits)
+        if self.latency is not None:
+            time.sleep(self.latency())
+
+    def _count_listened(self, reads):
+        # Listeners stream in the background: reads, but no round trip of the caller's
+        with self._lock:
+            self.counts["reads"] += reads
+
+    def reset_counts(self):
+        for key in self.counts:
+            self.counts[key] = 0
+
+    def _read(self, ref):
+        with self._lock:
+            data = ref._store().get(ref.id)
+            return LocalSnapshot(ref, data)
+
+    def _write(self, ref, op, data=None, merge=False):
+        with self._lock:
+            store = ref._store()
+            before = store.get(ref.id)
+            self._apply_write(store, ref, op, data, merge)
+            for watch in self._watches:
+                if watch.query._collection == ref._collection:
+                    watch.notify(ref, before, store.get(ref.id))
+
+    def _apply_write(self, store, ref, op, data, merge):
+        if op == "delete":
+            store.pop(ref.id, None)
+            return
+        if op == "update" and ref.id not in store:
+            raise KeyError(f"No document to update: {ref.path}")
+        current = store.get(ref.id, {}) if (merge or op == "update") else {}
+        current = copy.deepcopy(current)
+        for key, value in data.items():
+            if op == "update":
+                _set_path(current, key, value)
+            elif merge and isinstance(value, dict) and isinstance(current.get(key), dict):
+                _merge(current[key], value)
+            else:
+                current[key] = _apply_value(current.get(key), value)
+        store[ref.id] = current
+
+    def collection(self, name):
+        return LocalCollectionReference(self, name)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def transaction(self):
+        return LocalTransaction(self)
+
+    def get_all(self, refs, transaction=None):
+        refs = list(refs)
+        self._count(reads=len(refs))
+        return [self._read(ref) for ref in refs]
+
+    def docs(self, collection_name):
+        """Return the raw stored documents of a collection (test helper)."""
+        with self._lock:
+            return copy.deepcopy(self._collections.get(collection_name, {}))
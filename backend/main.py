@@ -1,59 +1,310 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, current_app, request, jsonify, send_file, send_from_directory
 from flask_apscheduler import APScheduler
 from Gamer import Gamer
 from Publican import Publican
 from game import Game, SeatBasedGame, TableBasedGame
+from read_models import ReadModelRefresher, game_summary, now_string, pub_listing, read_area_games, read_pub_summary
+from sweeper import GameSweeper
+from replica import GamesReplica
+import clients
+import metrics
+import firestore_accounting
+import compression
+import json_provider
+import batch_api
+import bootstrap
+from bootstrap import IN_QUERY_LIMIT
+import search
+import recommend
+import facets
+import event_schedule
+import write_behind
+from event_schedule import covering_event, take_slots, to_timestamp
+import leader
+from structured_logging import configure_logging
+from images import IMMUTABLE_MAX_AGE, VARIANT_WIDTHS, ImageVariants, negotiate_format, snap_width
+from uploads import UploadJobs
+from singleflight import FlightTimeout, SingleFlight
+from friend_cache import SUMMARY_FIELDS, FriendSummaryCache, friend_summary
+from friend_summaries import FriendSummaryFanOut, FriendSummaryRepair, denormalized_friends
 from datetime import datetime, timedelta
+from functools import partial
 from werkzeug.utils import secure_filename
-from firebase_admin import credentials, firestore, storage, initialize_app
+from PIL import UnidentifiedImageError
+from firebase_admin import firestore
 from flask import jsonify, request
-import moment
 
 import os
+import shutil
+import tempfile
 import time
-import firebase_admin
+import logging
 class Config:
     SCHEDULER_API_ENABLED = True
+    # Run the scheduled jobs in this process; with several workers each job only runs in the
+    # worker holding its lease (see leader.py)
+    RUN_SCHEDULER = os.environ.get("RUN_SCHEDULER") == "1"
+    # "firestore" (across hosts), "file" (flock, workers of one host) or "none"
+    SCHEDULER_LEASE = os.environ.get("SCHEDULER_LEASE", "firestore")
+    SCHEDULER_LEASE_DIR = os.environ.get("SCHEDULER_LEASE_DIR", "/tmp/niteout-scheduler")
+    READ_MODEL_REFRESH_MINUTES = 5
+    SWEEP_INTERVAL_MINUTES = 10
+    # Debug payloads (e.g. whole friend documents) are only formatted when LOG_LEVEL=DEBUG
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    UPLOAD_FOLDER = 'backend/assets'
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    # Archive expired games to this .jsonl.gz file instead of the games_archive collection
+    GAMES_ARCHIVE_PATH = os.environ.get("GAMES_ARCHIVE_PATH")
+    # Serve fetch_games and game lookups from a listener-fed in-memory replica
+    GAMES_REPLICA = os.environ.get("GAMES_REPLICA") == "1"
+    # Warn when one request repeats the same query shape more often than this
+    FIRESTORE_N_PLUS_ONE_THRESHOLD = 5
+    # Fraction of per-request Firestore op summaries that are logged
+    FIRESTORE_OPS_LOG_SAMPLE_RATE = 0.05
+    # JSON/text bodies smaller than this are sent uncompressed
+    COMPRESS_MIN_SIZE = 1024
+    # /api/batch limits: sub-requests per batch, and threads shared by all batches
+    BATCH_MAX_REQUESTS = 10
+    BATCH_MAX_WORKERS = 8
+    # Threads for the parallel reads behind /api/bootstrap
+    BOOTSTRAP_MAX_WORKERS = 16
+    # Seconds a request waits on an identical in-flight read before giving up (504), with
+    # per-route overrides, e.g. {"fetch_games": 5}
+    SINGLE_FLIGHT_TIMEOUT = 10
+    SINGLE_FLIGHT_TIMEOUTS = {}
+    # Friend summaries cached per process for fetch_friends: kept up to FRIEND_CACHE_TTL
+    # seconds while listeners on the cached gamers invalidate them, FRIEND_CACHE_STALE_SECONDS without
+    FRIEND_CACHE_SIZE = 10000
+    FRIEND_CACHE_TTL = 300
+    FRIEND_CACHE_STALE_SECONDS = 5
+    FRIEND_CACHE_LISTENER = os.environ.get("FRIEND_CACHE_LISTENER", "1") == "1"
+    # Threads copying changed profiles into friends' friend_summaries, and how often the
+    # scheduled job rebuilds any that drifted
+    FRIEND_SUMMARY_FANOUT_WORKERS = 2
+    FRIEND_SUMMARY_REPAIR_MINUTES = 60
+    # In-memory full-text index behind /api/search, fed by games and publicans listeners
+    SEARCH_INDEX = os.environ.get("SEARCH_INDEX", "1") == "1"
+    # In-memory bitmap index behind the fetch_games filters and /api/game_facets
+    FACET_INDEX = os.environ.get("FACET_INDEX", "1") == "1"
+    # Overrides for the "for you" ranking weights (see recommend.DEFAULT_WEIGHTS),
+    # e.g. {"distance": 5.0, "history": 0}
+    RECOMMEND_WEIGHTS = {}
+    # Side-effect writes the response does not wait for (a host's hosted_games, the login
+    # merge-set) are queued in this SQLite file and committed in batches in the background
+    WRITE_BEHIND_PATH = os.environ.get("WRITE_BEHIND_PATH",
+                                       os.path.join(tempfile.gettempdir(), "niteout-write-behind.sqlite3"))
+    WRITE_BEHIND_BATCH_SIZE = 500
+    WRITE_BEHIND_FLUSH_SECONDS = 0.2
+
+logger = logging.getLogger(__name__)
 
-# Initialize Flask App
-app = Flask(__name__)
-app.config.from_object(Config())
-app.config['UPLOAD_FOLDER'] = 'backend/assets'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
-scheduler = APScheduler()
-scheduler.init_app(app)
-scheduler.start()
+# Created on first use in each process (see clients.py); every round trip is timed into /metrics
+db_firestore = clients.firestore_client
+if metrics.firestore_listener not in db_firestore.listeners:
+    db_firestore.listeners.append(metrics.firestore_listener)
 
+api = Blueprint('api', __name__)
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    default_app = initialize_app(cred, {
-        'storageBucket': 'niteout-storage-49dc5'
-    })
-else:
-    default_app = firebase_admin.get_app()
+"""
+Summary:
+    Builds the Flask app. Nothing here connects to Firebase or starts threads: clients are
+    created lazily in each process, and the scheduled jobs only run when RUN_SCHEDULER is
+    set, so the app can be created before a pre-fork server forks its workers.
+
+Args:
+    dict config: settings that override Config (optional)
+
+Returns:
+    Flask: the configured app
+"""
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_object(Config())
+    if config:
+        app.config.update(config)
+
+    # Tests keep pytest's own log capturing
+    if not app.testing:
+        configure_logging(app.config['LOG_LEVEL'])
+    # jsonify / request.get_json go through orjson and understand Firestore types
+    json_provider.init_app(app)
+
+    # Registered first so it runs last, after every other hook has touched the response
+    compression.init_app(app)
+    metrics.init_app(app)
+    firestore_accounting.init_app(app, db_firestore)
+    # Several API calls in one round trip, e.g. everything the app loads at startup
+    batch_api.init_app(app)
+
+    # Resolved the same way send_from_directory resolves UPLOAD_FOLDER (relative to the app)
+    app.extensions['image_variants'] = ImageVariants(os.path.join(app.root_path, app.config['UPLOAD_FOLDER']))
+    # Validation, thumbnailing and storage run in the background; requests only spool the file
+    app.extensions['upload_jobs'] = UploadJobs(db_firestore)
+    # Identical reads arriving together (e.g. everyone opening the games list) share one call
+    single_flight = SingleFlight(app.config['SINGLE_FLIGHT_TIMEOUT'], app.config['SINGLE_FLIGHT_TIMEOUTS'])
+    metrics.registry.add_collector(single_flight.metric_samples)
+    app.extensions['single_flight'] = single_flight
+
+    games_replica = None
+    if app.config['GAMES_REPLICA']:
+        # The listener starts on first use, in the process serving the request
+        games_replica = GamesReplica(db_firestore)
+        metrics.registry.add_collector(games_replica.metric_samples)
+    app.extensions['games_replica'] = games_replica
+
+    # The cache's listeners cover only the gamers it holds, and start on the lookups after they are cached
+    friend_cache = FriendSummaryCache(db_firestore, max_entries=app.config['FRIEND_CACHE_SIZE'],
+                                      ttl=app.config['FRIEND_CACHE_TTL'],
+                                      stale_seconds=app.config['FRIEND_CACHE_STALE_SECONDS'],
+                                      listen=app.config['FRIEND_CACHE_LISTENER'])
+    metrics.registry.add_collector(friend_cache.metric_samples)
+    app.extensions['friend_cache'] = friend_cache
+    # Profile changes are copied into friends' documents in the background
+    app.extensions['friend_fanout'] = FriendSummaryFanOut(db_firestore, app.config['FRIEND_SUMMARY_FANOUT_WORKERS'])
+
+    # The file and flusher thread are opened by the first request in each process
+    write_queue = write_behind.init_app(app, db_firestore, app.config['WRITE_BEHIND_PATH'],
+                                        batch_size=app.config['WRITE_BEHIND_BATCH_SIZE'],
+                                        flush_interval=app.config['WRITE_BEHIND_FLUSH_SECONDS'])
+    metrics.registry.add_collector(write_queue.metric_samples)
+
+    # Home screen data (profile, friends, live games, pubs) in one call with parallel reads
+    bootstrap.init_app(app, db_firestore, games_replica)
+    # Per-pub interval trees of events (game placement, POST /api/create_event); the events
+    # listener starts on first use
+    schedule = event_schedule.init_app(app, db_firestore)
+    metrics.registry.add_collector(schedule.metric_samples)
+    # Ranked "for you" games, scored with NumPy over every live game
+    recommend.init_app(app, db_firestore, games_replica)
+
+    if app.config['SEARCH_INDEX']:
+        # Built from the listeners' first snapshots on the first search in each process
+        search_indexer = search.init_app(app, db_firestore)
+        metrics.registry.add_collector(search_indexer.metric_samples)
+
+    if app.config['FACET_INDEX']:
+        # Built from the listener's first snapshot on the first filtered read in each process;
+        # until then filtered reads check the replica's (or Firestore's) games one by one
+        facet_indexer = facets.init_app(app, db_firestore, games_replica)
+        metrics.registry.add_collector(facet_indexer.metric_samples)
+
+    app.register_blueprint(api)
+
+    if app.config['RUN_SCHEDULER']:
+        start_scheduler(app)
+    return app
+
+def start_scheduler(app):
+    scheduler = APScheduler()
+    scheduler.init_app(app)
+    make_lease = leader.lease_factory(app.config['SCHEDULER_LEASE'], db_firestore, app.config['SCHEDULER_LEASE_DIR'])
+
+    # Incrementally update the precomputed read models (active games per area, pub summaries);
+    # its games listener starts on the first run, so only the leader holds one
+    read_model_refresher = ReadModelRefresher(db_firestore)
+    refresh_job = leader.add_job(scheduler, make_lease, 'Scheduled Task', read_model_refresher.refresh,
+                                 app.config['READ_MODEL_REFRESH_MINUTES'])
+
+    # Move expired games out of the hot games collection
+    game_sweeper = GameSweeper(db_firestore, archive_path=app.config['GAMES_ARCHIVE_PATH'])
+    metrics.registry.add_collector(game_sweeper.metric_samples)
+    sweep_job = leader.add_job(scheduler, make_lease, 'Expired Game Sweeper', game_sweeper.sweep,
+                               app.config['SWEEP_INTERVAL_MINUTES'])
+
+    # Rebuild denormalized friend summaries that drifted from the friends' profiles
+    friend_summary_repair = FriendSummaryRepair(db_firestore)
+    repair_job = leader.add_job(scheduler, make_lease, 'Friend Summary Repair', friend_summary_repair.repair,
+                                app.config['FRIEND_SUMMARY_REPAIR_MINUTES'])
+
+    scheduler.start()
+    app.extensions['scheduler'] = scheduler
+    app.extensions['read_model_refresher'] = read_model_refresher
+    app.extensions['scheduler_jobs'] = [refresh_job, sweep_job, repair_job]
+    return scheduler
 
-bucket = storage.bucket('niteout-storage-49dc5', app=default_app)
-db_firestore = firestore.client()
+"""
+Summary:
+    Stops the app's background work when its process exits: the scheduler (letting a
+    running job finish, then handing its job leases over), the read model, replica,
+    friend cache, search, facet and event listeners, and the upload and fan-out pools, which first
+    finish the work already queued, and finally the write-behind queue, which commits the
+    writes that are due (anything left stays in its file for the next run)
+"""
+def shutdown_app(app):
+    scheduler = app.extensions.get('scheduler')
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=True)
+    for job in app.extensions.get('scheduler_jobs', []):
+        try:
+            job.lease.release()
+        except Exception:
+            logger.exception("Could not release the lease for job %s", job.name)
+    if app.extensions.get('read_model_refresher') is not None:
+        app.extensions['read_model_refresher'].stop()
+    if app.extensions.get('games_replica') is not None:
+        app.extensions['games_replica'].stop()
+    app.extensions['friend_cache'].stop()
+    for name in ('search', 'facets', 'event_schedule'):
+        if app.extensions.get(name) is not None:
+            app.extensions[name].stop()
+    app.extensions['upload_jobs'].shutdown(wait=True)
+    for name in ('friend_fanout', 'batch_executor', 'bootstrap_executor'):
+        app.extensions[name].shutdown(wait=True)
+    app.extensions['write_behind'].shutdown()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/images/<filename>')
-def serve_image(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
+"""
+Summary:
+    Serves an uploaded image, optionally as a resized variant
 
+Args:
+    size / w: variant width ("thumb", "small", "medium", "large" or pixels)
+    format: force "webp" or "jpeg"; otherwise negotiated from the Accept header
+    v: source version; when it matches the current one the response is cacheable forever
 
-# Define a function to perform the refresh
-def refresh_data():
-    # Include logic to refresh or update data here
-    print("Data refreshed at interval")
+Returns:
+    The image with an ETag (content hash); supports If-None-Match and Range requests.
+    404 if there is no such image, 415 if a variant is asked of a file that is not an image
+"""
+@api.route('/images/<filename>')
+def serve_image(filename):
+    image_variants = current_app.extensions['image_variants']
+    version = image_variants.version(filename)
+    if version is None:
+        return jsonify({"error": "Image not found"}), 404
+
+    # Without a matching version the client must revalidate (cheap 304 via the ETag)
+    immutable = request.args.get("v") == version
+    max_age = IMMUTABLE_MAX_AGE if immutable else None
+
+    width = VARIANT_WIDTHS.get(request.args.get("size")) or request.args.get("w", type=int)
+    if width:
+        fmt = negotiate_format(request.headers.get("Accept"), request.args.get("format"))
+        try:
+            variant = image_variants.variant(filename, snap_width(width), fmt)
+        except UnidentifiedImageError:
+            return jsonify({"error": "File is not an image that can be resized"}), 415
+        # The source can be removed between the version check and rendering
+        if variant is None:
+            return jsonify({"error": "Image not found"}), 404
+        path, etag, mimetype = variant
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True, max_age=max_age)
+        response.vary.add("Accept")
+    else:
+        path = image_variants.source_path(filename)
+        if path is None:
+            return jsonify({"error": "Image not found"}), 404
+        response = send_file(path, etag=version, conditional=True, max_age=max_age)
+
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    return response
 
-# Schedule the function to run every 10 minutes
-scheduler.add_job(id='Scheduled Task', func=refresh_data, trigger='interval', minutes=30)
 
 
 """
@@ -65,41 +316,80 @@ Returns:
     data of all gamers and HTTP status 200 if successful
 """
 
-@app.route("/api/create_game", methods=["POST"])
+@api.route("/api/create_game", methods=["POST"])
 def create_game():
     try:
         game_data = request.get_json()
 
         required_fields = [
             "game_name", "start_time", "end_time", "pub_id", "host",
-            "location", "max_players", "event_id", "game_code",
-            "updated_slots", "game_type"
+            "location", "max_players", "game_code", "game_type"
         ]
         if not all(field in game_data for field in required_fields):
             return jsonify({"error": "Missing required fields."}), 400
-
-        batch = db_firestore.batch()
+        # The app picked the event and worked out its slots; otherwise the server does both
+        if game_data.get("event_id") and "updated_slots" not in game_data:
+            return jsonify({"error": "Missing required fields."}), 400
 
         game_doc_ref = db_firestore.collection("games").document()
-        batch.set(game_doc_ref, game_data)
-
-        event_doc_ref = db_firestore.collection("events").document(game_data["event_id"])
-
-        batch.update(event_doc_ref, {"available_slots": game_data["updated_slots"]})
-
-        host_doc_ref = db_firestore.collection("gamers").document(game_data["host"])
-        batch.update(host_doc_ref, {"hosted_games": firestore.ArrayUnion([game_doc_ref.id])})
 
-        batch.commit()
+        if game_data.get("event_id"):
+            batch = db_firestore.batch()
+            batch.set(game_doc_ref, {**game_data, "updated_at": firestore.SERVER_TIMESTAMP})
+            event_doc_ref = db_firestore.collection("events").document(game_data["event_id"])
+            batch.update(event_doc_ref, {"available_slots": game_data["updated_slots"]})
+            batch.commit()
+        else:
+            # The game goes in the pub's event covering its whole time, taking room from its slots
+            start, end = to_timestamp(game_data["start_time"]), to_timestamp(game_data["end_time"])
+            if start is None or end is None:
+                return jsonify({"error": "start_time and end_time must be ISO times."}), 400
+            event_id, _ = covering_event(db_firestore, current_app.extensions['event_schedule'],
+                                         game_data["pub_id"], start, end)
+            if event_id is None:
+                return jsonify({"error": "No events found during specified time for this pub"}), 404
+            game_data.pop("updated_slots", None)
+            game_data["event_id"] = event_id
+            event_doc_ref = db_firestore.collection("events").document(event_id)
+
+            # Slots are read and written in one transaction, so two games cannot take the same room
+            @firestore.transactional
+            def place_game(transaction):
+                event_doc = event_doc_ref.get(transaction=transaction)
+                if not event_doc.exists:
+                    return None
+                slots = take_slots(event_doc.to_dict(), game_data["start_time"], game_data["end_time"],
+                                   game_data["max_players"])
+                if slots is None:
+                    return False
+                transaction.set(game_doc_ref, {**game_data, "updated_at": firestore.SERVER_TIMESTAMP})
+                transaction.update(event_doc_ref, {"available_slots": slots})
+                return True
+
+            placed = place_game(db_firestore.transaction())
+            if placed is None:
+                return jsonify({"error": "No events found during specified time for this pub"}), 404
+            if not placed:
+                return jsonify({"error": "Not enough room available"}), 400
+
+        # The host's list of hosted games is not needed for the response; it is committed in the background
+        current_app.extensions['write_behind'].update(
+            "gamers", game_data["host"], {"hosted_games": firestore.ArrayUnion([game_doc_ref.id])})
+
+        # Searchable and filterable right away in this process; the listeners bring it to the others
+        if current_app.extensions.get('search') is not None:
+            current_app.extensions['search'].index.add("game", game_doc_ref.id, game_data)
+        if current_app.extensions.get('facets') is not None:
+            current_app.extensions['facets'].index.add(game_doc_ref.id, game_data)
 
         return jsonify({"message": "Game created successfully!", "gameId": game_doc_ref.id}), 201 
 
     except Exception as e:
-        print(f"Error creating game: {e}")
+        logger.exception("Error creating game")
         return jsonify({"error": str(e)}), 500
 
 #  To store Gamer UID
-@app.route("/api/store_gamer_id", methods=["POST"])
+@api.route("/api/store_gamer_id", methods=["POST"])
 def store_gamer_id():
     data = request.get_json()
     gamer_id = data.get("gamerId")
@@ -109,9 +399,17 @@ def store_gamer_id():
         return jsonify({"error": "Gamer ID and email required"}), 400
 
     try:
-        # Store or update the gamer ID in the database
-        gamers_ref = db_firestore.collection("gamers").document(gamer_id)
-        gamers_ref.set({"gamerId": gamer_id, "email": email}, merge=True)
+        write_behind = current_app.extensions['write_behind']
+        gamer = {"gamerId": gamer_id, "email": email}
+        if write_behind.recently_set("gamers", gamer_id):
+            # Stored through this process in the last few minutes, so the document exists: a
+            # repeat login is written in the background, or not at all when it is identical
+            write_behind.set("gamers", gamer_id, gamer, skip_recent_duplicate=True)
+        else:
+            # Possibly a first login, creating the document that fetch_user_info, fetch_friends
+            # and bootstrap read next, so it is written before responding
+            db_firestore.collection("gamers").document(gamer_id).set(gamer, merge=True)
+            write_behind.remember("gamers", gamer_id, gamer)
 
         return jsonify({"message": "Gamer ID stored successfully"}), 200
 
@@ -120,7 +418,7 @@ def store_gamer_id():
     
 
 
-@app.route("/api/get_location", methods=["GET"])
+@api.route("/api/get_location", methods=["GET"])
 def get_location():
     try:
         # Placeholder response since location is usually retrieved client-side
@@ -128,143 +426,211 @@ def get_location():
     except Exception as e:
         return jsonify({"error": f"Error retrieving location: {str(e)}"}), 500
 
-@app.route("/api/fetch_pubs", methods=["GET"])
+"""
+Summary:
+    Runs fn once for all concurrent requests to the same route with the same parameters,
+    sharing its result (which must not be mutated). See singleflight.py.
+"""
+def single_flight(name, params, fn):
+    return current_app.extensions['single_flight'].do(name, params, fn)
+
+def flight_timeout(e):
+    return jsonify({"error": str(e)}), 504
+
+@api.route("/api/fetch_pubs", methods=["GET"])
 def fetch_pubs():
-    try:
+    def load():
         pubs_ref = db_firestore.collection("publicans")
-        pubs = [
-            {
-                "id": doc.id,
-                "pub_name": doc.to_dict().get("pub_name"),
-                "address": doc.to_dict().get("address"),
-                "xcoord": doc.to_dict().get("xcoord"),
-                "ycoord": doc.to_dict().get("ycoord"),
-                "BER": doc.to_dict().get("BER"),
-                "pub_image_url": doc.to_dict().get("pub_image_url"),
-            }
-            for doc in pubs_ref.stream()
-        ]
-        return jsonify(pubs), 200
+        return [pub_listing(doc.id, doc.to_dict()) for doc in pubs_ref.stream()]
+
+    try:
+        return jsonify(single_flight("fetch_pubs", {}, load)), 200
+    except FlightTimeout as e:
+        return flight_timeout(e)
     except Exception as e:
         return jsonify({"error": f"Error fetching pubs: {str(e)}"}), 500
 
-@app.route("/api/fetch_games", methods=["GET"])
+@api.route("/api/fetch_games", methods=["GET"])
 def fetch_games():
     try:
-        now = moment.now().format("YYYY-MM-DDTHH:mm:ss")
-        games_ref = db_firestore.collection("games")
-        query = games_ref.where("expires", ">", now)
-        games = [
-            {
-                "id": doc.id,
-                "game_name": doc.to_dict().get("game_name"),
-                "location": doc.to_dict().get("location"),
-                "xcoord": doc.to_dict().get("xcoord"),
-                "ycoord": doc.to_dict().get("ycoord"),
-                "start_time": doc.to_dict().get("start_time"),
-                "end_time": doc.to_dict().get("end_time"),
-                "expires": doc.to_dict().get("expires"),
-                "max_players": doc.to_dict().get("max_players"),
-                "participants": doc.to_dict().get("participants"),
-                "host": doc.to_dict().get("host"),
-                "game_desc": doc.to_dict().get("game_desc"),
-                "game_type": doc.to_dict().get("game_type"),
-                "pub_id": doc.to_dict().get("pub_id"),
-            }
-            for doc in query.stream()
-        ]
-        return jsonify(games), 200
+        # Filters (?type=Pool,Darts&daypart=evening&open=1, see facets.py) are answered by
+        # the bitmap index, whatever their combination; area on its own uses the read model
+        try:
+            filters = facets.parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if filters is not None and set(filters) != {"area"}:
+            facet_indexer = current_app.extensions.get('facets')
+            if facet_indexer is None:
+                return jsonify({"error": "Game filters are disabled"}), 400
+            return jsonify(facet_indexer.filter(filters)), 200
+
+        # A single precomputed document per area instead of a collection scan
+        area = request.args.get("area")
+        if area:
+            return jsonify(single_flight("fetch_games", {"area": area}, partial(read_area_games, db_firestore, area))), 200
+
+        # Pre-serialized (and precompressed) body from the in-memory replica; query Firestore while it is down
+        games_replica = current_app.extensions['games_replica']
+        if games_replica and games_replica.ready():
+            return compression.precompressed_response(current_app, games_replica.snapshot().payload), 200
+
+        def load():
+            now = now_string()
+            games_ref = db_firestore.collection("games")
+            query = games_ref.where("expires", ">", now)
+            return [game_summary(doc.id, doc.to_dict()) for doc in query.stream()]
+
+        return jsonify(single_flight("fetch_games", {}, load)), 200
+    except FlightTimeout as e:
+        return flight_timeout(e)
     except Exception as e:
         return jsonify({"error": f"Error fetching games: {str(e)}"}), 500
 
-@app.route("/api/fetch_user_info", methods=["POST"])
+@api.route("/api/fetch_game/<string:game_id>", methods=["GET"])
+def fetch_game(game_id):
+    try:
+        games_replica = current_app.extensions['games_replica']
+        if games_replica and games_replica.ready():
+            game = games_replica.get(game_id)
+            if game:
+                return jsonify(game), 200
+
+        doc = db_firestore.collection("games").document(game_id).get()
+        if not doc.exists:
+            return jsonify({"error": "Game not found"}), 404
+        return jsonify(game_summary(doc.id, doc.to_dict())), 200
+    except Exception as e:
+        return jsonify({"error": f"Error fetching game: {str(e)}"}), 500
+
+@api.route("/api/replica_stats", methods=["GET"])
+def replica_stats():
+    games_replica = current_app.extensions['games_replica']
+    if not games_replica:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **games_replica.stats()}), 200
+
+@api.route("/api/fetch_pub_summary/<string:pub_id>", methods=["GET"])
+def fetch_pub_summary(pub_id):
+    try:
+        return jsonify(read_pub_summary(db_firestore, pub_id)), 200
+    except Exception as e:
+        return jsonify({"error": f"Error fetching pub summary: {str(e)}"}), 500
+
+@api.route("/api/fetch_user_info", methods=["POST"])
 def fetch_user_info():
     data = request.get_json()
     gamer_id = data.get("gamerId")
-    try:
+
+    def load():
         doc_ref = db_firestore.collection("gamers").document(gamer_id)
         doc = doc_ref.get()
-        if doc.exists:
-            user_data = doc.to_dict()
+        return doc.to_dict() if doc.exists else None
+
+    try:
+        user_data = single_flight("fetch_user_info", {"gamerId": gamer_id}, load)
+        if user_data is not None:
             return jsonify(user_data), 200
         return jsonify({"error": "User not found"}), 404
+    except FlightTimeout as e:
+        return flight_timeout(e)
     except Exception as e:
         return jsonify({"error": f"Error fetching user info: {str(e)}"}), 500
     
-@app.route("/api/fetch_friends", methods=["POST"])
+@api.route("/api/fetch_friends", methods=["POST"])
 def fetch_friends():
     data = request.get_json()
     gamer_id = data.get("gamerId")
     try:
-        print(f"Starting to fetch friends for gamer ID: {gamer_id}")
+        logger.debug("Starting to fetch friends for gamer ID: %s", gamer_id)
 
         # Fetch the user's document to get the friends list
         gamer_ref = db_firestore.collection("gamers").document(gamer_id)
         gamer_doc = gamer_ref.get()
 
         if not gamer_doc.exists:
-            print(f"No gamer document found with ID: {gamer_id}")
+            logger.info("No gamer document found with ID: %s", gamer_id)
             return jsonify({"error": "User not found"}), 404
 
         user_data = gamer_doc.to_dict()
         friends_list = user_data.get("friends_list", [])
 
         if not friends_list:
-            print("No friends found in the list.")
+            logger.debug("No friends found in the list.")
             return jsonify([]), 200
 
-        # Fetch details for each friend ID in the friends list
-        fetched_friend_details = []
+        # Friends' display fields are copied into the gamer's own document when they
+        # change, so usually this one read is all it takes
+        fetched_friend_details, missing = denormalized_friends(user_data)
+        if not missing:
+            return jsonify(fetched_friend_details), 200
+        # Friends without a copy yet (e.g. just added): rebuild the copies in the background
+        current_app.extensions['friend_fanout'].submit_repair(gamer_id)
+
+        # Meanwhile summaries of recently seen friends come from the cache; the rest are
+        # read with one "in" query per 30 friends
+        friend_cache = current_app.extensions['friend_cache']
+        summaries, missing = friend_cache.get_many(missing)
+        logger.debug("Friend summaries cached: %d, to read: %d", len(summaries), len(missing))
         gamers_ref = db_firestore.collection("gamers")
-
-        for friend_id in friends_list:
-            print(f"Processing friend ID: {friend_id}")
-            friend_data = None
-
-            # Use a query to find the document where gamerId matches
+        token = friend_cache.token()
+        missing = list(dict.fromkeys(missing))
+        for start in range(0, len(missing), IN_QUERY_LIMIT):
+            chunk = missing[start:start + IN_QUERY_LIMIT]
             try:
-                query = gamers_ref.where("gamerId", "==", friend_id).limit(1)
-                results = query.stream()
-
-                for doc in results:
+                for doc in gamers_ref.where("gamerId", "in", chunk).stream():
                     friend_data = doc.to_dict()
-                    if friend_data:
-                        print(f"Found friend data: {friend_data}")
-                        break
-
-                if not friend_data:
-                    print(f"No data found for friend ID: {friend_id}")
-
+                    logger.debug("Found friend data: %s", friend_data)
+                    friend_cache.put(token, doc.id, friend_data)
+                    summaries[friend_data.get("gamerId")] = friend_summary(friend_data.get("gamerId"), friend_data)
             except Exception as e:
-                print(f"Error fetching friend data: {str(e)}")
+                logger.exception("Error fetching friend data for %s", chunk)
 
-            profile = friend_data.get("profile", "01") if friend_data else "01"
-            print(f"Profile for friend ID {friend_id}: {profile}")
-            
-            # Add friend to result if found
-            if friend_data:
-                fetched_friend_details.append({
-                    "gamerId": friend_id,
-                    "fullName": friend_data.get("fullName", "Unknown"),
-                    "profile": profile,
-                    "statusMessage": friend_data.get("statusMessage", "")
-                })
-            else:
-                fetched_friend_details.append({
-                    "gamerId": friend_id,
-                    "fullName": "Unknown User",
-                    "profile": "03"
-                })
-
-        print(f"Final fetched friend details: {fetched_friend_details}")
+        for i, friend_id in enumerate(friends_list):
+            if fetched_friend_details[i] is not None:
+                continue
+            if friend_id not in summaries:
+                logger.info("No data found for friend ID: %s", friend_id)
+            fetched_friend_details[i] = summaries.get(friend_id) or friend_summary(friend_id, None)
+
+        logger.debug("Final fetched friend details: %s", fetched_friend_details)
         return jsonify(fetched_friend_details), 200
 
     except Exception as e:
-        print(f"Error fetching friends: {str(e)}")
+        logger.exception("Error fetching friends")
         return jsonify({"error": f"Failed to load friends data: {str(e)}"}), 500
     
 
-@app.route('/api/fetch_profile', methods=['POST'])
+def load_profile(gamer_id):
+    # Get user from users collection
+    user_ref = db_firestore.collection('users').document(gamer_id)
+    user_doc = user_ref.get()
+    
+    if not user_doc.exists:
+        return None
+    
+    user_data = user_doc.to_dict()
+    is_publican = user_data.get('isPublican', False)
+    
+    # Get additional data based on user type
+    if is_publican:
+        publican_id = user_data.get('userIdToDisplay')
+        if publican_id:
+            publican_ref = db_firestore.collection('publican').document(publican_id)
+            publican_doc = publican_ref.get()
+            if publican_doc.exists:
+                publican_data = publican_doc.to_dict()
+                user_data.update(publican_data)
+    else:
+        gamer_ref = db_firestore.collection('gamers').document(gamer_id)
+        gamer_doc = gamer_ref.get()
+        if gamer_doc.exists:
+            gamer_data = gamer_doc.to_dict()
+            user_data.update(gamer_data)
+    
+    return user_data
+
+@api.route('/api/fetch_profile', methods=['POST'])
 def fetch_profile():
     try:
         data = request.json
@@ -273,43 +639,19 @@ def fetch_profile():
         if not gamer_id:
             return jsonify({"error": "Gamer ID is required"}), 400
         
-        # Get user from users collection
-        user_ref = db_firestore.collection('users').document(gamer_id)
-        user_doc = user_ref.get()
-        
-        if not user_doc.exists:
+        user_data = single_flight("fetch_profile", {"gamerId": gamer_id}, partial(load_profile, gamer_id))
+        if user_data is None:
             return jsonify({"error": "User not found"}), 404
         
-        user_data = user_doc.to_dict()
-        is_publican = user_data.get('isPublican', False)
-        
-        # Get additional data based on user type
-        if is_publican:
-            publican_id = user_data.get('userIdToDisplay')
-            if publican_id:
-                publican_ref = db_firestore.collection('publican').document(publican_id)
-                publican_doc = publican_ref.get()
-                if publican_doc.exists:
-                    publican_data = publican_doc.to_dict()
-                    user_data.update(publican_data)
-        else:
-            gamer_ref = db_firestore.collection('gamers').document(gamer_id)
-            gamer_doc = gamer_ref.get()
-            if gamer_doc.exists:
-                gamer_data = gamer_doc.to_dict()
-                user_data.update(gamer_data)
-        
-        # Format created_at date if it exists
-        if 'createdAt' in user_data and user_data['createdAt']:
-            user_data['createdAt'] = user_data['createdAt'].isoformat()
-            
         return jsonify(user_data)
     
+    except FlightTimeout as e:
+        return flight_timeout(e)
     except Exception as e:
-        print(f"Error fetching profile: {str(e)}")
+        logger.exception("Error fetching profile")
         return jsonify({"error": "Server error while fetching user data"}), 500
 
-@app.route('/api/update_profile', methods=['POST'])
+@api.route('/api/update_profile', methods=['POST'])
 def update_profile():
     try:
         data = request.json
@@ -333,14 +675,17 @@ def update_profile():
             target_ref = db_firestore.collection('gamers').document(gamer_id)
         
         target_ref.update({field: value})
+        if not (is_publican and user_id_to_display) and field in SUMMARY_FIELDS:
+            current_app.extensions['friend_cache'].invalidate(gamer_id)
+            current_app.extensions['friend_fanout'].submit(gamer_id)
         
         return jsonify({"success": True, "message": f"{field} updated successfully"})
     
     except Exception as e:
-        print(f"Error updating profile: {str(e)}")
+        logger.exception("Error updating profile")
         return jsonify({"error": f"Failed to update {field}"}), 500
 
-@app.route('/api/check_email_exists', methods=['POST'])
+@api.route('/api/check_email_exists', methods=['POST'])
 def check_email_exists():
     try:
         data = request.json
@@ -359,10 +704,10 @@ def check_email_exists():
         return jsonify({"exists": exists})
     
     except Exception as e:
-        print(f"Error checking email: {str(e)}")
+        logger.exception("Error checking email")
         return jsonify({"error": "Server error while checking email"}), 500
 
-@app.route('/api/check_pub_name_exists', methods=['POST'])
+@api.route('/api/check_pub_name_exists', methods=['POST'])
 def check_pub_name_exists():
     try:
         data = request.json
@@ -381,10 +726,10 @@ def check_pub_name_exists():
         return jsonify({"exists": exists})
     
     except Exception as e:
-        print(f"Error checking pub name: {str(e)}")
+        logger.exception("Error checking pub name")
         return jsonify({"error": "Server error while checking pub name"}), 500
 
-@app.route('/api/update_profile_picture', methods=['POST'])
+@api.route('/api/update_profile_picture', methods=['POST'])
 def update_profile_picture():
     try:
         data = request.json
@@ -415,14 +760,105 @@ def update_profile_picture():
         else:
             gamer_ref = db_firestore.collection('gamers').document(gamer_id)
             gamer_ref.update({"profile": profile})
+            current_app.extensions['friend_cache'].invalidate(gamer_id)
+            current_app.extensions['friend_fanout'].submit(gamer_id)
         
         return jsonify({"success": True, "message": "Profile picture updated successfully"})
     
     except Exception as e:
-        print(f"Error updating profile picture: {str(e)}")
+        logger.exception("Error updating profile picture")
         return jsonify({"error": "Failed to update profile picture"}), 500
 
 
+"""
+Summary:
+    Function that uploads a local file to Firebase Storage and returns its public URL
+
+Args:
+    String local_path: path of the file to upload
+    String storage_path: where to store the file in the bucket
+
+Returns:
+    String: Complete URL to the uploaded file from database
+"""
+def generate_url(local_path, storage_path):
+    blob = clients.bucket().blob(storage_path)
+    blob.upload_from_filename(local_path)
+    blob.make_public()
+    return blob.public_url
+
+def store_in_bucket(local_path, name, kind):
+    folder = "pub_images" if kind == "image" else "pub_image_thumbnails"
+    return generate_url(local_path, f"{folder}/{name}")
+
+def store_in_upload_folder(folder, local_path, name, kind):
+    os.makedirs(folder, exist_ok=True)
+    filename = secure_filename(name)
+    shutil.copyfile(local_path, os.path.join(folder, filename))
+    return f"/images/{filename}"
+
+def queue_image_upload(store, on_complete=None):
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "File type not allowed"}), 400
+
+    stem = os.path.splitext(secure_filename(file.filename))[0]
+    job_id = current_app.extensions['upload_jobs'].submit(file, f"{stem}_{int(time.time())}", store, on_complete)
+    return jsonify({"message": "Upload accepted", "jobId": job_id,
+                    "statusUrl": f"/api/upload_status/{job_id}"}), 202
+
+"""
+Summary:
+    API "POST" call that accepts an image for the local image folder (served at /images)
+
+Returns:
+    .JSON + HTTP Status: HTTP status 202 with a job ID to poll at /api/upload_status/<job_id>,
+    or 400 for "BAD REQUEST" when the file is missing or not an allowed type
+"""
+@api.route('/api/upload', methods=['POST'])
+def upload_file():
+    # Stores run on a background thread, outside the app context
+    folder = current_app.extensions['image_variants'].folder
+    return queue_image_upload(partial(store_in_upload_folder, folder))
+
+"""
+Summary:
+    API "POST" call that accepts a new pub image; once processed it is uploaded to
+    Firebase Storage and the publican's pub_image_url is updated
+
+Returns:
+    .JSON + HTTP Status: HTTP status 202 with a job ID, 404 if the publican does not exist
+"""
+@api.route('/api/update_pub_image/<string:publican_id>', methods=['POST'])
+def update_pub_image(publican_id):
+    try:
+        publican_ref = db_firestore.collection('publicans').document(publican_id)
+        if not publican_ref.get().exists:
+            return jsonify({"error": "Publican not found"}), 404
+
+        def save_urls(result):
+            publican_ref.update({
+                "pub_image_url": result["url"],
+                "pub_image_thumbnail_url": result["thumbnail_url"],
+            })
+
+        return queue_image_upload(store_in_bucket, save_urls)
+    except Exception as e:
+        logger.exception("Error queueing pub image upload")
+        return jsonify({"error": f"Failed to update pub image: {str(e)}"}), 500
+
+@api.route('/api/upload_status/<string:job_id>', methods=['GET'])
+def upload_status(job_id):
+    job = current_app.extensions['upload_jobs'].status(job_id)
+    if job is None:
+        return jsonify({"error": "Upload job not found"}), 404
+    return jsonify(job), 200
+
+
 # @app.route("/gamer", methods=["GET"])
 # def get_gamer():
 #     gamer_ref = db_firestore.collection('gamers')
@@ -1211,4 +1647,6 @@ def update_profile_picture():
 
 ## Running this file as main
 if __name__ == "__main__":
+    # With the reloader, only the restarted child (WERKZEUG_RUN_MAIN) runs the jobs
+    app = create_app({"RUN_SCHEDULER": os.environ.get("WERKZEUG_RUN_MAIN") == "true"})
     app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+
+from flask import g, request
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shard:
+    """Accumulators owned by one thread; only that thread ever writes to them."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, (bucket_counts, total) in list(other.histograms.items()):
+            entry = self.histograms.get(key)
+            if entry is None:
+                self.histograms[key] = [list(bucket_counts), total]
+            else:
+                entry[0] = [a + b for a, b in zip(entry[0], bucket_counts)]
+                entry[1] += total
+
+
+class MetricsRegistry:
+    """
+    Summary:
+        Counters, gauges and histograms kept in per-thread shards, so recording a sample
+        is a couple of dict operations with no lock. Shards are only merged when /metrics
+        is scraped. Shards of threads that have exited are folded into one retired shard.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        self._families = {}
+        self._collectors = []
+
+    def describe(self, name, metric_type, help_text):
+        self._families[name] = (metric_type, help_text)
+
+    def add_collector(self, collector):
+        """Register a callable returning [(name, labels, value)] gauge samples read at scrape time."""
+        self._collectors.append(collector)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._retire_dead_shards()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead_shards(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._retired.merge(shard)
+        self._shards = live
+
+    def inc(self, name, labels=(), value=1):
+        """Add to a counter, or to a gauge when value is negative (per-thread sums are merged)."""
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            entry = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def collect(self):
+        """Merge all shards into {name: {labels: value}} and {name: {labels: (buckets, sum)}}."""
+        merged = _Shard()
+        with self._shards_lock:
+            self._retire_dead_shards()
+            merged.merge(self._retired)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            merged.merge(shard)
+
+        counters = {}
+        histograms = {}
+        for (name, labels), value in merged.counters.items():
+            counters.setdefault(name, {})[labels] = value
+        for (name, labels), (bucket_counts, total) in merged.histograms.items():
+            histograms.setdefault(name, {})[labels] = (bucket_counts, total)
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                counters.setdefault(name, {})[labels] = value
+        return counters, histograms
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        counters, histograms = self.collect()
+        lines = []
+        for name in sorted(set(counters) | set(histograms)):
+            metric_type, help_text = self._families.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(counters.get(name, {}).items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            for labels, (bucket_counts, total) in sorted(histograms.get(name, {}).items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), bucket_counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+registry.describe("http_requests_total", "counter", "HTTP requests by route, method and status code.")
+registry.describe("http_request_duration_seconds", "histogram", "HTTP request latency by route and method.")
+registry.describe("http_requests_in_flight", "gauge", "HTTP requests currently being handled.")
+registry.describe("firestore_call_duration_seconds", "histogram", "Firestore call latency by operation and collection.")
+registry.describe("games_replica_games", "gauge", "Live games held by the in-memory replica.")
+registry.describe("games_replica_snapshot_bytes", "gauge", "Size of the replica's pre-serialized snapshot.")
+registry.describe("games_replica_lag_ms", "gauge", "Delay between a change's read time and it being applied.")
+registry.describe("games_replica_ready", "gauge", "1 while the replica's listener is live.")
+registry.describe("single_flight_calls_total", "counter", "Backend calls run by the single-flight layer, by route.")
+registry.describe("single_flight_shared_total", "counter", "Requests served by another request's in-flight call, by route.")
+registry.describe("single_flight_timeouts_total", "counter", "Requests that gave up waiting on a shared call, by route.")
+registry.describe("single_flight_coalescing_ratio", "gauge", "Share of requests served by another request's call, by route.")
+registry.describe("friend_cache_entries", "gauge", "Friend summaries held by the per-process cache.")
+registry.describe("friend_cache_listeners", "gauge", "Live listeners on the gamers the friend cache holds.")
+registry.describe("friend_cache_requests_total", "counter", "Friend summary lookups by result (hit or miss).")
+registry.describe("friend_cache_evictions_total", "counter", "Friend summaries evicted to stay within the cache size.")
+registry.describe("friend_cache_invalidations_total", "counter", "Friend summaries dropped because the friend changed.")
+registry.describe("search_index_documents", "gauge", "Games and pubs held by the full-text search index.")
+registry.describe("search_index_terms", "gauge", "Distinct terms in the full-text search index.")
+registry.describe("facet_index_games", "gauge", "Live games held by the facet bitmap index.")
+registry.describe("facet_index_bitmaps", "gauge", "Facet values with a bitset in the facet index.")
+registry.describe("event_schedule_pubs", "gauge", "Pubs with upcoming events in the event schedule.")
+registry.describe("event_schedule_events", "gauge", "Events that have not ended, held by the event schedule.")
+registry.describe("write_behind_queue_depth", "gauge", "Writes waiting in the write-behind queue.")
+registry.describe("write_behind_oldest_age_seconds", "gauge", "Age of the oldest write waiting in the write-behind queue.")
+registry.describe("write_behind_dead_letters", "gauge", "Write-behind writes that exhausted their retries.")
+registry.describe("write_behind_enqueued_total", "counter", "Writes handed to the write-behind queue, by result (queued, coalesced or skipped as a recent duplicate).")
+registry.describe("write_behind_writes_total", "counter", "Write-behind commits by result (ok, retry or dead).")
+registry.describe("write_behind_flush_seconds", "histogram", "Time from a write being queued to it being committed.")
+registry.describe("write_behind_batch_seconds", "histogram", "Latency of write-behind batch commits.")
+registry.describe("game_sweeper_games_total", "counter", "Expired games moved out of the games collection.")
+registry.describe("game_sweeper_lag_seconds", "gauge", "Age of the oldest expired game found by the last sweep.")
+registry.describe("game_sweeper_games_per_second", "gauge", "Games moved per second by the last sweep.")
+registry.describe("scheduled_job_runs_total", "counter", "Scheduled job ticks by job and result (ok, error, skipped, lease_error).")
+registry.describe("scheduled_job_duration_seconds", "histogram", "Run time of scheduled jobs in the leader process.")
+
+
+def firestore_listener(call, seconds):
+    """TrackedClient listener recording the latency of every Firestore round trip."""
+    registry.observe("firestore_call_duration_seconds", (("collection", call.collection), ("op", call.op)), seconds)
+
+
+def init_app(app):
+    """Record per-route latency, status codes and in-flight requests, and serve them at /metrics."""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_in_flight = True
+        registry.inc("http_requests_in_flight")
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            registry.observe("http_request_duration_seconds",
+                             (("method", request.method), ("route", route)),
+                             time.perf_counter() - start)
+            registry.inc("http_requests_total",
+                         (("method", request.method), ("route", route), ("status", str(response.status_code))))
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        if g.pop("metrics_in_flight", False):
+            registry.inc("http_requests_in_flight", value=-1)
+
+    @app.route("/metrics")
+    def metrics():
+        return app.response_class(registry.render(), mimetype=None, content_type=CONTENT_TYPE)
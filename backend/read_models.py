@@ -0,0 +1,322 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Fields of a game that the app's list views need (same shape as fetch_games)
+GAME_FIELDS = (
+    "game_name", "location", "xcoord", "ycoord", "start_time", "end_time", "expires",
+    "max_players", "participants", "host", "game_desc", "game_type", "pub_id",
+)
+
+# Fields of a pub in the pub list (same shape as fetch_pubs)
+PUB_FIELDS = ("pub_name", "address", "xcoord", "ycoord", "BER", "pub_image_url")
+
+# Size of an "area" grid cell in degrees (0.1 deg is roughly 11km x 7km in Ireland)
+AREA_SIZE = 0.1
+
+ACTIVE_GAMES = "active_games"
+PUB_SUMMARIES = "pub_summaries"
+READ_MODELS_META = "read_models_meta"
+
+# Writes committed just before a run can carry a server timestamp slightly older than
+# the watermark, so every run re-reads a small overlap window (upserts are idempotent).
+WATERMARK_OVERLAP = timedelta(seconds=10)
+
+# Firestore allows at most 500 operations per batch
+BATCH_LIMIT = 500
+
+logger = logging.getLogger(__name__)
+
+
+def now_string():
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def parse_iso(value):
+    """
+    A datetime for an ISO time: "2025-03-01T19:00:00.000Z" from the app (toISOString) or
+    "2025-03-01T19:00:00" local time from the backend. Raises TypeError or ValueError.
+    """
+    # Before Python 3.11 fromisoformat rejects a "Z" suffix
+    if isinstance(value, str) and value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+
+def game_summary(game_id, data):
+    summary = {"id": game_id}
+    for field in GAME_FIELDS:
+        summary[field] = data.get(field)
+    return summary
+
+
+def pub_listing(pub_id, data):
+    listing = {"id": pub_id}
+    for field in PUB_FIELDS:
+        listing[field] = data.get(field)
+    return listing
+
+
+def area_key(xcoord, ycoord):
+    """Return the grid cell ID for a coordinate pair, or None if it is not numeric."""
+    try:
+        x = math.floor(float(xcoord) / AREA_SIZE)
+        y = math.floor(float(ycoord) / AREA_SIZE)
+    except (TypeError, ValueError):
+        return None
+    return f"{x}_{y}"
+
+
+def open_seats(game):
+    max_players = game.get("max_players") or 0
+    try:
+        return max(0, int(max_players) - len(game.get("participants") or []))
+    except (TypeError, ValueError):
+        return 0
+
+
+def is_live(game, now):
+    expires = game.get("expires")
+    return bool(expires) and expires > now
+
+
+class ReadModelRefresher:
+    """
+    Summary:
+        Keeps the precomputed read models in sync with the games collection:
+        one "active_games" document per area holding the compact list of live games,
+        and one "pub_summaries" document per pub with upcoming game and seat counts.
+
+        A listener on the live games collects every change between runs, including
+        the app's joins, leaves and deletes that never touch updated_at, so each run
+        only rewrites the documents those games belong to (plus documents holding a game
+        that has expired since they were built). The first run after the listener
+        (re)starts rebuilds every document. While the listener is down, runs read the
+        games whose updated_at is newer than the stored watermark instead.
+
+    Args:
+        db: Firestore client
+        retry_seconds: minimum time between attempts to restart a dead listener
+    """
+
+    def __init__(self, db, retry_seconds=5):
+        self.db = db
+        self.retry_seconds = retry_seconds
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._watch = None
+        self._received = False
+        self._rebuild = False
+        self._dirty = {}
+        self._last_start = 0.0
+
+    def start(self):
+        self.stop()
+        self._last_start = time.monotonic()
+        self._received = False
+        query = self.db.collection("games").where("expires", ">", now_string())
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def _listening(self):
+        return self._watch is not None and self._watch.is_active
+
+    def _tracking(self):
+        """True when the listener has every change since its first snapshot."""
+        if self._listening():
+            return self._received
+        if not self._last_start or time.monotonic() - self._last_start >= self.retry_seconds:
+            if self._last_start:
+                logger.warning("Read model listener is down, restarting it")
+            try:
+                self.start()
+            except Exception:
+                logger.exception("Error starting read model listener")
+        return self._listening() and self._received
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            if not self._received:
+                # Changes made while the listener was down are unknown: rebuild on the next run
+                self._rebuild = True
+                self._dirty = {}
+                self._received = True
+                return
+            for change in changes:
+                # Removed games keep their last data, which says which documents hold them
+                removed = change.type.name == "REMOVED"
+                self._dirty[change.document.id] = (removed, change.document.to_dict() or {})
+
+    def _meta_ref(self):
+        return self.db.collection(READ_MODELS_META).document("refresher")
+
+    def _changed_games(self, watermark, now):
+        games_ref = self.db.collection("games")
+        if watermark is None:
+            # First run: build everything that is still live
+            query = games_ref.where("expires", ">", now)
+        else:
+            query = games_ref.where("updated_at", ">", watermark - WATERMARK_OVERLAP)
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    def _expiring_docs(self, collection_name, now):
+        query = self.db.collection(collection_name).where("next_expiry", "<=", now)
+        return {doc.id: doc.to_dict() for doc in query.stream()}
+
+    def _load_docs(self, collection_name, doc_ids, loaded):
+        missing = [doc_id for doc_id in doc_ids if doc_id not in loaded]
+        if missing:
+            refs = [self.db.collection(collection_name).document(doc_id) for doc_id in missing]
+            for snapshot in self.db.get_all(refs):
+                loaded[snapshot.id] = snapshot.to_dict() if snapshot.exists else None
+        return loaded
+
+    def _collect(self, watermark, now, run_at):
+        """Return (changed games, removed games, rebuild, new watermark) for one run."""
+        tracking = self._tracking()
+        with self._lock:
+            rebuild, dirty = self._rebuild, self._dirty
+            self._rebuild, self._dirty = False, {}
+        if tracking and rebuild:
+            return self._changed_games(None, now), [], True, run_at
+        if tracking:
+            changed = [(game_id, data) for game_id, (removed, data) in dirty.items() if not removed]
+            removed = [(game_id, data) for game_id, (removed, data) in dirty.items() if removed]
+            return changed, removed, False, run_at
+
+        changed = self._changed_games(watermark, now)
+        new_watermark = watermark
+        for _, data in changed:
+            updated_at = data.get("updated_at")
+            if updated_at is not None and (new_watermark is None or updated_at > new_watermark):
+                new_watermark = updated_at
+        # A full build with no updated_at on any game still covers everything up to now
+        return changed, [], False, new_watermark or run_at
+
+    def refresh(self):
+        started = time.perf_counter()
+        now = now_string()
+        run_at = datetime.now(timezone.utc)
+
+        meta = self._meta_ref().get()
+        watermark = meta.to_dict().get("games_watermark") if meta.exists else None
+
+        changed, removed, rebuild, new_watermark = self._collect(watermark, now, run_at)
+        try:
+            writes = self._writes(changed, removed, rebuild, now)
+            self._commit(writes)
+        except Exception:
+            # The collected changes are gone, so the next run starts over from every game
+            with self._lock:
+                self._rebuild = True
+            raise
+        if new_watermark != watermark:
+            self._meta_ref().set({"games_watermark": new_watermark}, merge=True)
+
+        self.last_run = {
+            "changed_games": len(changed) + len(removed),
+            "changed_docs": len(writes),
+            "rebuilt": rebuild,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        logger.info("Read models refreshed", extra=self.last_run)
+        return self.last_run
+
+    def _writes(self, changed, removed, rebuild, now):
+        # None marks a game to drop from the document it was in
+        area_changes = {}
+        pub_changes = {}
+        updates = [(game_id, data, data) for game_id, data in changed]
+        updates += [(game_id, data, None) for game_id, data in removed]
+        for game_id, data, entry in updates:
+            area = area_key(data.get("xcoord"), data.get("ycoord"))
+            if area:
+                area_changes.setdefault(area, {})[game_id] = entry
+            if data.get("pub_id"):
+                pub_changes.setdefault(data["pub_id"], {})[game_id] = entry
+
+        if rebuild:
+            # Every existing document is rebuilt from scratch, which drops deleted games
+            areas = {doc.id: None for doc in self.db.collection(ACTIVE_GAMES).stream()}
+            pubs = {doc.id: None for doc in self.db.collection(PUB_SUMMARIES).stream()}
+        else:
+            areas = self._expiring_docs(ACTIVE_GAMES, now)
+            pubs = self._expiring_docs(PUB_SUMMARIES, now)
+        areas = self._load_docs(ACTIVE_GAMES, area_changes, areas)
+        pubs = self._load_docs(PUB_SUMMARIES, pub_changes, pubs)
+
+        writes = []
+        for area, doc in areas.items():
+            games = dict((doc or {}).get("games", {}))
+            for game_id, data in area_changes.get(area, {}).items():
+                if data is None:
+                    games.pop(game_id, None)
+                else:
+                    games[game_id] = game_summary(game_id, data)
+            writes.append((ACTIVE_GAMES, area, self._area_doc(area, games, now)))
+
+        for pub_id, doc in pubs.items():
+            seats = dict((doc or {}).get("games", {}))
+            for game_id, data in pub_changes.get(pub_id, {}).items():
+                if data is None:
+                    seats.pop(game_id, None)
+                else:
+                    seats[game_id] = {"open_seats": open_seats(data), "expires": data.get("expires")}
+            writes.append((PUB_SUMMARIES, pub_id, self._pub_doc(pub_id, seats, now)))
+        return writes
+
+    def _area_doc(self, area, games, now):
+        live = {game_id: game for game_id, game in games.items() if is_live(game, now)}
+        return {
+            "area": area,
+            "games": live,
+            "count": len(live),
+            "next_expiry": min((g["expires"] for g in live.values()), default=None),
+            "refreshed_at": now,
+        }
+
+    def _pub_doc(self, pub_id, seats, now):
+        live = {game_id: entry for game_id, entry in seats.items() if is_live(entry, now)}
+        return {
+            "pub_id": pub_id,
+            "games": live,
+            "upcoming_games": len(live),
+            "open_seats": sum(entry["open_seats"] for entry in live.values()),
+            "next_expiry": min((e["expires"] for e in live.values()), default=None),
+            "refreshed_at": now,
+        }
+
+    def _commit(self, writes):
+        for start in range(0, len(writes), BATCH_LIMIT):
+            batch = self.db.batch()
+            for collection_name, doc_id, data in writes[start:start + BATCH_LIMIT]:
+                batch.set(self.db.collection(collection_name).document(doc_id), data)
+            batch.commit()
+
+
+def read_area_games(db, area):
+    """Return the live games of one area from its precomputed document."""
+    doc = db.collection(ACTIVE_GAMES).document(area).get()
+    if not doc.exists:
+        return []
+    now = now_string()
+    return [game for game in doc.to_dict().get("games", {}).values() if is_live(game, now)]
+
+
+def read_pub_summary(db, pub_id):
+    doc = db.collection(PUB_SUMMARIES).document(pub_id).get()
+    if not doc.exists:
+        return {"pub_id": pub_id, "upcoming_games": 0, "open_seats": 0}
+    now = now_string()
+    live = [entry for entry in doc.to_dict().get("games", {}).values() if is_live(entry, now)]
+    return {
+        "pub_id": pub_id,
+        "upcoming_games": len(live),
+        "open_seats": sum(entry["open_seats"] for entry in live),
+    }
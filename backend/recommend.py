@@ -0,0 +1,352 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from flask import current_app, jsonify, request
+
+from bootstrap import IN_QUERY_LIMIT
+from read_models import game_summary, now_string, parse_iso
+
+# Relative importance of each signal; override any of them with the RECOMMEND_WEIGHTS setting
+DEFAULT_WEIGHTS = {
+    "distance": 3.0,   # close to the user
+    "start": 1.0,      # starting soon
+    "capacity": 0.5,   # plenty of free seats
+    "friends": 2.0,    # friends already playing
+    "history": 1.5,    # a type of game the user has joined before
+}
+
+# A game this far away scores 1/e of one next door; same for hours until it starts
+DISTANCE_SCALE_KM = 5.0
+START_SCALE_HOURS = 12.0
+# Friends attending needed for the full friends score
+FRIENDS_SATURATION = 3
+# Most recent joined games used for the user's type preferences
+HISTORY_LIMIT = 50
+# Columns are rebuilt from a newer replica snapshot at most this often (a 50k-game
+# rebuild takes a few hundred ms; scores from a slightly older snapshot are fine)
+REBUILD_SECONDS = 2.0
+# Without the replica, columns built from one Firestore read are reused for this long, or
+# until the first of their games expires
+QUERY_CACHE_SECONDS = 30.0
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+EARTH_RADIUS_KM = 6371.0
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value):
+    """Seconds since the epoch for an ISO time (see parse_iso), or inf."""
+    try:
+        return parse_iso(value).timestamp()
+    except (TypeError, ValueError):
+        return np.inf
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def coordinate(value):
+    # A game without a location is infinitely far away, so it scores 0 for distance
+    value = to_float(value)
+    return np.inf if np.isnan(value) else value
+
+
+class GameColumns:
+    """
+    Summary:
+        The candidate games as parallel NumPy arrays, one row per game, so every game is
+        scored with a handful of array operations instead of a Python loop. Everything
+        that does not depend on the user (radians, free-seat ratio, full games) is computed
+        here, once. Game types and gamer IDs are replaced by integer codes, and the games
+        each gamer plays in are indexed by gamer code.
+
+    Args:
+        games: game summaries (fetch_games shape)
+    """
+
+    def __init__(self, games):
+        self.games = tuple(games)
+        self.types = {}
+        self.gamers = {}
+        participant_codes = []
+        participant_rows = []
+        type_codes = []
+        host_codes = []
+        taken = []
+
+        for row, game in enumerate(self.games):
+            participants = game.get("participants") or []
+            type_codes.append(self.types.setdefault(game.get("game_type"), len(self.types)))
+            host_codes.append(self.gamers.setdefault(game.get("host"), len(self.gamers)))
+            taken.append(len(participants))
+            for participant in participants:
+                participant_codes.append(self.gamers.setdefault(participant, len(self.gamers)))
+                participant_rows.append(row)
+
+        self.lat = np.radians([coordinate(game.get("xcoord")) for game in self.games])
+        self.lon = np.radians([coordinate(game.get("ycoord")) for game in self.games])
+        self.start = np.array([parse_time(game.get("start_time")) for game in self.games], dtype=float)
+        capacity = np.array([to_float(game.get("max_players")) for game in self.games], dtype=float)
+        free = capacity - np.array(taken, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.free_ratio = np.nan_to_num(np.clip(free / capacity, 0, 1))
+        # Same rule as open_seats: no seats left, or no max_players
+        self.full = ~(free > 0)
+        self.type_code = np.array(type_codes, dtype=np.int32)
+        self.host_code = np.array(host_codes, dtype=np.int32)
+        # Rows each gamer plays in, grouped by gamer code: the rows of gamer code c are
+        # rows_by_gamer[offsets[c]:offsets[c + 1]], so a user's friends only touch their own games
+        participant_code = np.array(participant_codes, dtype=np.int32)
+        order = np.argsort(participant_code, kind="stable")
+        self.rows_by_gamer = np.array(participant_rows, dtype=np.int32)[order]
+        self.offsets = np.zeros(len(self.gamers) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(participant_code, minlength=len(self.gamers)), out=self.offsets[1:])
+        self.row_by_id = {game["id"]: row for row, game in enumerate(self.games)}
+
+    def __len__(self):
+        return len(self.games)
+
+    def gamer_codes(self, gamer_ids):
+        return [self.gamers[gamer_id] for gamer_id in gamer_ids if gamer_id in self.gamers]
+
+    def playing_rows(self, gamer_ids):
+        """Rows of the games each of gamer_ids (gamer document IDs) plays in, once per player."""
+        codes = self.gamer_codes(gamer_ids)
+        if not codes:
+            return np.zeros(0, dtype=np.int32)
+        return np.concatenate([self.rows_by_gamer[self.offsets[code]:self.offsets[code + 1]] for code in codes])
+
+    def attending(self, gamer_ids):
+        """Number of gamer_ids among each game's participants."""
+        return np.bincount(self.playing_rows(gamer_ids), minlength=len(self))
+
+
+def distance_km(lat, lon, columns):
+    """
+    Distance in km from (lat, lon) to every game; inf where a game has no location.
+    Equirectangular: within a fraction of a percent of the great-circle distance at city
+    scale, with no trigonometry per game.
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    return EARTH_RADIUS_KM * np.hypot(columns.lat - lat, (columns.lon - lon) * np.cos(lat))
+
+
+def score_games(columns, weights, now, location=None, friend_ids=(), type_counts=None, exclude=()):
+    """
+    Summary:
+        Score every game in columns. Each signal is scaled to 0..1 (missing data scores 0)
+        and the score is their weighted sum. Full games and games in exclude (gamer
+        document IDs hosting or playing) score -inf.
+
+    Args:
+        GameColumns columns: the candidates
+        dict weights: weight of each signal (keys of DEFAULT_WEIGHTS)
+        float now: current time in seconds since the epoch
+        tuple location: the user's (lat, lon), or None
+        list friend_ids: document IDs of the user's friends
+        dict type_counts: {game_type: number of the user's past games of that type}
+        list exclude: document IDs whose games are left out
+
+    Returns:
+        (ndarray, ndarray): the scores and the number of friends attending each game
+    """
+    score = np.zeros(len(columns))
+
+    if location is not None and weights["distance"]:
+        score += weights["distance"] * np.exp(distance_km(*location, columns) / -DISTANCE_SCALE_KM)
+
+    if weights["start"]:
+        # Games already under way count as starting now
+        seconds = np.maximum(columns.start - now, 0)
+        score += weights["start"] * np.exp(seconds / (-START_SCALE_HOURS * 3600))
+
+    if weights["capacity"]:
+        score += weights["capacity"] * columns.free_ratio
+
+    friends = columns.attending(friend_ids) if friend_ids else np.zeros(len(columns), dtype=np.int64)
+    if weights["friends"]:
+        score += weights["friends"] * np.minimum(friends / FRIENDS_SATURATION, 1.0)
+
+    if type_counts and weights["history"]:
+        # One slot per type code, plus a trailing 0 for types the user never played
+        preference = np.zeros(len(columns.types) + 1)
+        total = sum(type_counts.values())
+        for game_type, count in type_counts.items():
+            if game_type in columns.types:
+                preference[columns.types[game_type]] = count / total
+        score += weights["history"] * preference[columns.type_code]
+
+    score[columns.full] = -np.inf
+    if exclude:
+        score[columns.playing_rows(exclude)] = -np.inf
+        score[np.isin(columns.host_code, columns.gamer_codes(exclude))] = -np.inf
+    return score, friends
+
+
+def top_rows(score, limit):
+    """Rows of the limit best finite scores, best first, without sorting every game."""
+    rows = np.argpartition(-score, limit - 1)[:limit] if len(score) > limit else np.arange(len(score))
+    rows = rows[np.isfinite(score[rows])]
+    return rows[np.argsort(-score[rows], kind="stable")]
+
+
+class Recommender:
+    """
+    Summary:
+        Ranks the live games for one user ("for you"): near them, starting soon, with free
+        seats, with friends playing and of the types they have joined before.
+
+        Candidate games come from the games replica when it is ready; their columns are
+        built from a replica snapshot and shared by every request, and rebuilt for a newer
+        snapshot at most every REBUILD_SECONDS. Otherwise the live games are read from
+        Firestore and their columns shared for up to QUERY_CACHE_SECONDS, so new games
+        show up that much later; none is ranked after it expires.
+
+    Args:
+        db: Firestore client
+        replica: optional GamesReplica
+        weights: overrides for DEFAULT_WEIGHTS
+    """
+
+    def __init__(self, db, replica=None, weights=None):
+        unknown = set(weights or {}) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown recommendation weights: {', '.join(sorted(unknown))}")
+        self.db = db
+        self.replica = replica
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self._columns = (None, None, 0.0)
+        self._queried = (None, None, 0.0)  # columns read from Firestore, their first expiry, built at
+        self._lock = threading.Lock()
+
+    def _queried_fresh(self):
+        columns, next_expiry, built_at = self._queried
+        return (columns is not None and time.monotonic() - built_at < QUERY_CACHE_SECONDS
+                and (next_expiry is None or next_expiry > now_string()))
+
+    def _queried_columns(self):
+        if not self._queried_fresh():
+            with self._lock:
+                if not self._queried_fresh():
+                    query = self.db.collection("games").where("expires", ">", now_string())
+                    games = [game_summary(doc.id, doc.to_dict()) for doc in query.stream()]
+                    next_expiry = min((game["expires"] for game in games if game.get("expires")), default=None)
+                    self._queried = (GameColumns(games), next_expiry, time.monotonic())
+        return self._queried[0]
+
+    def columns(self):
+        if self.replica is None or not self.replica.ready():
+            return self._queried_columns()
+        snapshot = self.replica.snapshot()
+        version, columns, built_at = self._columns
+        if version != snapshot.version and (columns is None or time.monotonic() - built_at >= REBUILD_SECONDS):
+            with self._lock:
+                version, columns, built_at = self._columns
+                if version != snapshot.version and (columns is None or time.monotonic() - built_at >= REBUILD_SECONDS):
+                    columns = GameColumns(snapshot.games)
+                    self._columns = (snapshot.version, columns, time.monotonic())
+        return columns
+
+    def _friend_doc_ids(self, friend_ids):
+        # participants hold gamer document IDs, friends_list holds gamerId values
+        doc_ids = []
+        for start in range(0, len(friend_ids), IN_QUERY_LIMIT):
+            chunk = friend_ids[start:start + IN_QUERY_LIMIT]
+            doc_ids.extend(doc.id for doc in self.db.collection("gamers").where("gamerId", "in", chunk).stream())
+        return doc_ids
+
+    def _type_counts(self, game_ids, columns):
+        counts = {}
+        unknown = []
+        for game_id in game_ids:
+            row = columns.row_by_id.get(game_id)
+            if row is None:
+                unknown.append(game_id)
+            else:
+                game_type = columns.games[row].get("game_type")
+                counts[game_type] = counts.get(game_type, 0) + 1
+        if unknown:
+            refs = [self.db.collection("games").document(game_id) for game_id in unknown]
+            for doc in self.db.get_all(refs):
+                if doc.exists:
+                    game_type = doc.to_dict().get("game_type")
+                    counts[game_type] = counts.get(game_type, 0) + 1
+        counts.pop(None, None)
+        return counts
+
+    def recommend(self, gamer_id, location=None, limit=DEFAULT_LIMIT):
+        """
+        Returns:
+            list: the best games (game summaries plus "score" and "friends_attending"),
+            or None if the gamer does not exist
+        """
+        gamer_doc = self.db.collection("gamers").document(gamer_id).get()
+        if not gamer_doc.exists:
+            return None
+        gamer = gamer_doc.to_dict()
+        columns = self.columns()
+        if not len(columns):
+            return []
+
+        friend_ids = list(dict.fromkeys(gamer.get("friends_list") or []))
+        friend_doc_ids = self._friend_doc_ids(friend_ids) if friend_ids else ()
+        joined = list(gamer.get("joined_games") or [])[-HISTORY_LIMIT:]
+        type_counts = self._type_counts(joined, columns) if joined else None
+
+        started = time.perf_counter()
+        score, friends = score_games(columns, self.weights, time.time(), location=location,
+                                     friend_ids=friend_doc_ids, type_counts=type_counts, exclude=[gamer_id])
+        rows = top_rows(score, limit)
+        logger.debug("Games ranked", extra={"games": len(columns),
+                                            "duration_ms": round((time.perf_counter() - started) * 1000, 2)})
+        return [{**columns.games[row], "score": round(float(score[row]), 4),
+                 "friends_attending": int(friends[row])} for row in rows]
+
+
+def init_app(app, db, replica=None):
+    """
+    Summary:
+        Add POST /api/recommend_games. Takes {"gamerId", and optionally "xcoord"/"ycoord"
+        (the user's location) and "limit"}. Weights come from the RECOMMEND_WEIGHTS setting.
+
+    Returns:
+        .JSON + HTTP Status: {"games": [...]} best first with HTTP status 200, 400 for a
+        missing gamer ID or bad limit, 404 if the gamer does not exist, or 500 on an error
+    """
+    recommender = Recommender(db, replica, app.config.get("RECOMMEND_WEIGHTS"))
+    app.extensions["recommender"] = recommender
+
+    @app.route("/api/recommend_games", methods=["POST"])
+    def recommend_games():
+        data = request.get_json(silent=True) or {}
+        gamer_id = data.get("gamerId")
+        if not gamer_id:
+            return jsonify({"error": "Gamer ID is required"}), 400
+        try:
+            limit = int(data.get("limit", DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be a number"}), 400
+        if not 1 <= limit <= MAX_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {MAX_LIMIT}"}), 400
+
+        lat, lon = to_float(data.get("xcoord")), to_float(data.get("ycoord"))
+        location = None if np.isnan(lat) or np.isnan(lon) else (lat, lon)
+
+        try:
+            games = current_app.extensions["recommender"].recommend(gamer_id, location, limit)
+        except Exception as e:
+            logger.exception("Error recommending games")
+            return jsonify({"error": f"Error recommending games: {str(e)}"}), 500
+        if games is None:
+            return jsonify({"error": "Gamer not found"}), 404
+        return jsonify({"games": games}), 200
+
+    return recommender
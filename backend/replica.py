@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from compression import Precompressed
+from json_provider import dumps_bytes
+from read_models import game_summary, is_live, now_string
+
+# Immutable view of the live games published after every applied change batch.
+# Request threads grab the current one with a single attribute read (no lock).
+ReplicaSnapshot = namedtuple("ReplicaSnapshot", ["version", "games", "by_id", "body", "payload", "next_expiry", "published_at"])
+
+EMPTY_SNAPSHOT = ReplicaSnapshot(0, (), MappingProxyType({}), b"[]", Precompressed(b"[]"), None, 0.0)
+
+logger = logging.getLogger(__name__)
+
+
+class GamesReplica:
+    """
+    Summary:
+        In-memory replica of the unexpired games fed by one Firestore on_snapshot listener.
+        Every change batch publishes a new ReplicaSnapshot that already holds the
+        serialized fetch_games response body (and its gzip/br copies).
+
+        While the listener is down (or before its first batch) ready() is False and
+        callers should fall back to querying Firestore directly.
+
+    Args:
+        db: Firestore client
+        retry_seconds: minimum time between attempts to restart a dead listener
+    """
+
+    def __init__(self, db, retry_seconds=5):
+        self.db = db
+        self.retry_seconds = retry_seconds
+        self._snapshot = EMPTY_SNAPSHOT
+        self._games = {}
+        self._publish_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._watch = None
+        self._received = False
+        self._last_start = 0.0
+        self.lag_ms = None
+        self.batches = 0
+        self.restarts = 0
+
+    def start(self):
+        self.stop()
+        self._last_start = time.monotonic()
+        self._received = False
+        query = self.db.collection("games").where("expires", ">", now_string())
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def _listening(self):
+        return self._watch is not None and self._watch.is_active
+
+    def ready(self):
+        """True when snapshots are being kept up to date by a live listener."""
+        if self._listening():
+            return self._received
+        # One thread starts the listener; the others must not open (and leak) a second one
+        with self._start_lock:
+            if self._listening():
+                return self._received
+            if self._last_start and time.monotonic() - self._last_start < self.retry_seconds:
+                return False
+            if self._last_start:
+                logger.warning("Games replica listener is down, restarting it")
+                self.restarts += 1
+            # Otherwise this is the first use in this process: the listener is never started
+            # at import time, so a forked worker starts its own
+            try:
+                self.start()
+            except Exception:
+                logger.exception("Error starting games replica listener")
+            return False
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot.next_expiry is not None and snapshot.next_expiry <= now_string():
+            # No change event fires when a game expires, so drop it on the first read after
+            with self._publish_lock:
+                self._publish()
+            snapshot = self._snapshot
+        return snapshot
+
+    def get(self, game_id):
+        return self.snapshot().by_id.get(game_id)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._publish_lock:
+            if not self._received:
+                # The first snapshot after a (re)start holds every live game: rebuild from it,
+                # so games deleted while the listener was down are dropped
+                self._games = {doc.id: game_summary(doc.id, doc.to_dict()) for doc in docs}
+            else:
+                for change in changes:
+                    if change.type.name == "REMOVED":
+                        self._games.pop(change.document.id, None)
+                    else:
+                        self._games[change.document.id] = game_summary(change.document.id, change.document.to_dict())
+            self._publish()
+            self._received = True
+            self.batches += 1
+            if read_time is not None:
+                self.lag_ms = round((time.time() - read_time.timestamp()) * 1000, 1)
+
+    def _publish(self):
+        now = now_string()
+        expired = [game_id for game_id, game in self._games.items() if not is_live(game, now)]
+        for game_id in expired:
+            del self._games[game_id]
+
+        games = tuple(self._games.values())
+        body = dumps_bytes(games)
+        self._snapshot = ReplicaSnapshot(
+            version=self._snapshot.version + 1,
+            games=games,
+            by_id=MappingProxyType(dict(self._games)),
+            body=body,
+            # Compressed copies are made once per snapshot, on the first request that wants them
+            payload=Precompressed(body),
+            next_expiry=min((game["expires"] for game in games), default=None),
+            published_at=time.time(),
+        )
+
+    def metric_samples(self):
+        stats = self.stats()
+        return [
+            ("games_replica_games", (), stats["games"]),
+            ("games_replica_snapshot_bytes", (), stats["snapshot_bytes"]),
+            ("games_replica_lag_ms", (), stats["lag_ms"] or 0),
+            ("games_replica_ready", (), 1 if stats["ready"] else 0),
+        ]
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "listening": self._listening(),
+            "ready": self._listening() and self._received,
+            "games": len(snapshot.games),
+            "snapshot_bytes": len(snapshot.body),
+            "version": snapshot.version,
+            "lag_ms": self.lag_ms,
+            "age_seconds": round(time.time() - snapshot.published_at, 1) if snapshot.version else None,
+            "batches": self.batches,
+            "restarts": self.restarts,
+        }
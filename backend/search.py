@@ -0,0 +1,451 @@
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+
+from flask import jsonify, request
+
+from read_models import game_summary, is_live, now_string, pub_listing
+
+# Indexed fields and their weights (a term in the name counts more than one in a description)
+FIELDS = {
+    "game": {"game_name": 2.0, "game_type": 1.5, "game_desc": 1.0, "location": 1.0},
+    "pub": {"pub_name": 2.0, "address": 1.0},
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# The last query word also matches longer terms ("qui" finds "quiz"), up to this many
+MAX_PREFIX_TERMS = 50
+MAX_RESULTS = 50
+# Batches larger than this are indexed by appending to the sorted lists and sorting once
+BULK_LOAD = 100
+# Rounds of the threshold algorithm before documents containing every word are scored directly
+THRESHOLD_ROUNDS = 500
+# How long a search waits for the listeners' first snapshots before falling back to
+# Firestore, and how many documents per name prefix that fallback reads
+LOAD_WAIT_SECONDS = 2.0
+FALLBACK_DOCS = 100
+# The name field a fallback search matches the query against, per collection
+NAME_FIELDS = {"game": ("games", "game_name"), "pub": ("publicans", "pub_name")}
+
+TOKEN = re.compile(r"\w+")
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    """Lower-case words with accents removed ("Céilí" -> "ceili")."""
+    if not text:
+        return []
+    text = str(text).casefold()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN.findall(text)
+
+
+def _contributions(ranked, idf):
+    for negative, key in ranked:
+        yield -negative * idf, key
+
+
+class SearchIndex:
+    """
+    Summary:
+        In-memory inverted index over games and pubs with BM25 ranking. Each term maps to
+        its postings {doc key: BM25 term weight}, computed when the document is added (with
+        the average document length at that time), and to the same postings as a list kept
+        sorted by weight. Queries run the threshold algorithm over the sorted lists: they
+        walk every query word's list from the top and stop as soon as no unseen document
+        can beat the current top results, so a common word costs about as much as a rare
+        one. A sorted term list gives the prefix matches of the last word by bisection.
+
+        Documents are replaced or removed one at a time, so the index follows writes
+        incrementally. One lock guards it; a query holds it for well under a millisecond.
+    """
+
+    def __init__(self):
+        self._docs = {}  # (kind, id) -> (display record, {term: weighted tf}, length)
+        self._postings = {}  # term -> {(kind, id): weight}
+        self._ranked = {}  # term -> [(-weight, (kind, id))] in ascending order
+        self._terms = []  # sorted keys of _postings
+        self._total_length = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _analyze(self, kind, data):
+        frequencies = {}
+        for field, weight in FIELDS[kind].items():
+            for term in tokenize(data.get(field)):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        return frequencies, sum(frequencies.values())
+
+    @staticmethod
+    def _weight(frequency, length, average):
+        return frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average))
+
+    def _remove(self, key):
+        entry = self._docs.pop(key, None)
+        if entry is None:
+            return
+        _, frequencies, length = entry
+        self._total_length -= length
+        for term in frequencies:
+            postings = self._postings[term]
+            ranked = self._ranked[term]
+            del ranked[bisect.bisect_left(ranked, (-postings.pop(key), key))]
+            if not postings:
+                del self._postings[term]
+                del self._ranked[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _add(self, key, display, frequencies, length, average, touched=None):
+        self._docs[key] = (display, frequencies, length)
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._ranked[term] = []
+                bisect.insort(self._terms, term)
+            weight = self._weight(frequency, length, average)
+            postings[key] = weight
+            if touched is None:
+                bisect.insort(self._ranked[term], (-weight, key))
+            else:
+                # Bulk load: append now, sort each list once at the end
+                self._ranked[term].append((-weight, key))
+                touched.add(term)
+
+    def add(self, kind, doc_id, data):
+        """Index (or re-index) a game or pub document."""
+        self.add_many(kind, [(doc_id, data)])
+
+    def add_many(self, kind, docs, replace=False):
+        """Index a batch of documents; with replace=True they become all the documents of kind."""
+        display = game_summary if kind == "game" else pub_listing
+        analyzed = [((kind, doc_id), display(doc_id, data), *self._analyze(kind, data)) for doc_id, data in docs]
+        with self._lock:
+            if replace:
+                for key in [key for key in self._docs if key[0] == kind]:
+                    self._remove(key)
+            for key, *_ in analyzed:
+                self._remove(key)
+            # A bulk load weighs all of its documents against the average they end up with
+            total = self._total_length + sum(length for *_, length in analyzed)
+            average = total / (len(self._docs) + len(analyzed)) if total else 1.0
+            touched = set() if len(analyzed) > BULK_LOAD else None
+            for key, record, frequencies, length in analyzed:
+                self._add(key, record, frequencies, length, average, touched)
+            for term in touched or ():
+                self._ranked[term].sort()
+
+    def remove(self, kind, doc_id):
+        with self._lock:
+            self._remove((kind, doc_id))
+
+    def _expand(self, token, prefix):
+        if not prefix:
+            return [token] if token in self._postings else []
+        start = bisect.bisect_left(self._terms, token)
+        end = bisect.bisect_left(self._terms, token + "\U0010ffff", start, min(start + MAX_PREFIX_TERMS, len(self._terms)))
+        return self._terms[start:end]
+
+    def _qualifies(self, key, kinds, now, expired):
+        if kinds and key[0] not in kinds:
+            return False
+        if key[0] == "game" and not is_live(self._docs[key][0], now):
+            expired.append(key)
+            return False
+        return True
+
+    @staticmethod
+    def _matching_all(words):
+        """Keys of the documents containing every query word (a prefix word: any of its terms)."""
+        words = sorted(words, key=lambda weighted: sum(len(postings) for postings, _ in weighted))
+        first = words[0]
+        candidates = first[0][0].keys() if len(first) == 1 else set().union(*(postings.keys() for postings, _ in first))
+        for weighted in words[1:]:
+            if len(weighted) == 1:
+                # Intersecting key views runs in C over the smaller side
+                candidates = candidates & weighted[0][0].keys()
+            else:
+                candidates = {key for key in candidates if any(key in postings for postings, _ in weighted)}
+        return candidates
+
+    @staticmethod
+    def _score(key, words):
+        return sum(max(postings.get(key, 0.0) * idf for postings, idf in weighted) for weighted in words)
+
+    def _top(self, words, streams, kinds, now, expired, limit):
+        """
+        Summary:
+            The threshold algorithm: take the next entry of every word's weight-sorted list in
+            turn, scoring each new document fully, until the best `limit` scores are at
+            least the sum of the lists' current entries (what an unseen document could
+            reach). Fast when the best documents lead their lists; when they do not (a
+            common word plus a rarer one), after THRESHOLD_ROUNDS it scores every document
+            containing all the words at once, after which an unseen document must miss a
+            word and the bound drops by the smallest list entry.
+
+        Returns:
+            list: the best (score, key) pairs, unordered
+        """
+        top = []  # min-heap of the best (score, key) so far
+        seen = set()
+        frontier = [0.0] * len(streams)
+        all_words_scored = len(words) == 1
+        rounds = 0
+
+        def consider(key):
+            seen.add(key)
+            if kinds and key[0] not in kinds:
+                return
+            if key[0] == "game" and not is_live(self._docs[key][0], now):
+                expired.append(key)
+                return
+            score = self._score(key, words)
+            if len(top) < limit:
+                heapq.heappush(top, (score, key))
+            elif score > top[0][0]:
+                heapq.heapreplace(top, (score, key))
+
+        while True:
+            advanced = False
+            for i, stream in enumerate(streams):
+                item = next(stream, None)
+                if item is None:
+                    frontier[i] = 0.0
+                    continue
+                advanced = True
+                frontier[i], key = item
+                if key not in seen:
+                    consider(key)
+            rounds += 1
+            bound = sum(frontier) - (min(frontier) if all_words_scored and len(words) > 1 else 0.0)
+            if not advanced or (len(top) == limit and top[0][0] >= bound):
+                return top
+            if not all_words_scored and rounds == THRESHOLD_ROUNDS:
+                for key in self._matching_all(words) - seen:
+                    consider(key)
+                all_words_scored = True
+
+    def search(self, query, kinds=None, limit=20, prefix=True):
+        """
+        Summary:
+            Rank documents matching any query word by BM25. With prefix=True the last word
+            is treated as unfinished and also matches the terms it starts.
+
+        Returns:
+            list: [{"type", "id", "score", "doc"}] best first; expired games are left out
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            count = len(self._docs)
+            # Per query word: [(postings, idf)] of its terms, and one descending stream of
+            # (score contribution, key); a prefix word's terms are merged into one stream
+            # and a document scores the best of them
+            words = []
+            streams = []
+            for i, token in enumerate(tokens):
+                terms = self._expand(token, prefix and i == len(tokens) - 1)
+                if not terms:
+                    continue
+                weighted = []
+                for term in terms:
+                    df = len(self._postings[term])
+                    weighted.append((self._postings[term], math.log(1 + (count - df + 0.5) / (df + 0.5))))
+                lists = [_contributions(self._ranked[term], idf) for term, (_, idf) in zip(terms, weighted)]
+                streams.append(lists[0] if len(lists) == 1 else heapq.merge(*lists, key=lambda item: -item[0]))
+                words.append(weighted)
+            if not words:
+                return []
+
+            expired = []
+            results = sorted(self._top(words, streams, kinds, now_string(), expired, limit), reverse=True)
+
+            # No change event fires when a game expires, so expired games go when first seen
+            for key in set(expired):
+                self._remove(key)
+            return [{"type": key[0], "id": key[1], "score": round(score, 4), "doc": self._docs[key][0]}
+                    for score, key in results]
+
+    def stats(self):
+        return {"documents": len(self._docs), "terms": len(self._postings)}
+
+
+class SearchIndexer:
+    """
+    Summary:
+        Keeps a SearchIndex in sync with Firestore through two listeners, one on the live
+        games and one on publicans: their first snapshots build the index and every later
+        change re-indexes just the documents that changed. Each first snapshot after a
+        (re)start replaces all of its kind, so documents deleted while the listeners were
+        down are dropped. Like GamesReplica, the listeners start on first use and ready()
+        is False until both have delivered.
+
+        A search arriving before then waits briefly for them, and if they are still
+        loading ranks the few documents whose name starts with the query instead.
+
+    Args:
+        db: Firestore client
+        retry_seconds: minimum time between attempts to restart dead listeners
+    """
+
+    def __init__(self, db, retry_seconds=5):
+        self.db = db
+        self.retry_seconds = retry_seconds
+        self.index = SearchIndex()
+        self._watches = []
+        self._received = set()
+        self._loaded = threading.Event()
+        self._start_lock = threading.Lock()
+        self._last_start = 0.0
+
+    def start(self):
+        self.stop()
+        self._last_start = time.monotonic()
+        self._received = set()
+        self._loaded.clear()
+        games = self.db.collection("games").where("expires", ">", now_string())
+        self._watches = [
+            games.on_snapshot(lambda docs, changes, read_time: self._apply("game", docs, changes)),
+            self.db.collection("publicans").on_snapshot(lambda docs, changes, read_time: self._apply("pub", docs, changes)),
+        ]
+
+    def stop(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+        self._watches = []
+
+    def _listening(self):
+        return bool(self._watches) and all(watch.is_active for watch in self._watches)
+
+    def ready(self):
+        if self._listening():
+            return len(self._received) == 2
+        # One thread starts the listeners; the others must not open (and leak) a second pair
+        with self._start_lock:
+            if self._listening():
+                return len(self._received) == 2
+            if self._last_start and time.monotonic() - self._last_start < self.retry_seconds:
+                return False
+            if self._last_start:
+                logger.warning("Search index listeners are down, restarting them")
+            try:
+                self.start()
+            except Exception:
+                logger.exception("Error starting search index listeners")
+            return self._listening() and len(self._received) == 2
+
+    def _apply(self, kind, docs, changes):
+        if kind not in self._received:
+            # The first snapshot after a (re)start holds every document of its kind
+            self.index.add_many(kind, [(doc.id, doc.to_dict()) for doc in docs], replace=True)
+        else:
+            updated = []
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    self.index.remove(kind, change.document.id)
+                else:
+                    updated.append((change.document.id, change.document.to_dict()))
+            if updated:
+                self.index.add_many(kind, updated)
+        self._received.add(kind)
+        if len(self._received) == 2:
+            self._loaded.set()
+
+    def wait_ready(self, timeout):
+        """ready(), waiting up to timeout seconds for live listeners' first snapshots."""
+        if self.ready():
+            return True
+        if self._listening():
+            self._loaded.wait(timeout)
+        return self.ready()
+
+    def prefix_search(self, query, kinds=None, limit=20):
+        """
+        Summary:
+            Search without the index: read at most FALLBACK_DOCS games and pubs whose name
+            starts with the query (as typed, and capitalised) and rank just those. Finds
+            far less than the index (no match on later words or other fields), so it only
+            serves searches made while the listeners are loading.
+
+        Returns:
+            list: as SearchIndex.search
+        """
+        scratch = SearchIndex()
+        prefixes = {query, query[:1].upper() + query[1:], query.title()}
+        for kind, (collection, field) in NAME_FIELDS.items():
+            if kinds and kind not in kinds:
+                continue
+            docs = {}
+            for prefix in prefixes:
+                matching = (self.db.collection(collection).where(field, ">=", prefix)
+                            .where(field, "<", prefix + "\uf8ff").limit(FALLBACK_DOCS))
+                docs.update((doc.id, doc.to_dict()) for doc in matching.stream())
+            scratch.add_many(kind, docs.items())
+        return scratch.search(query, kinds, limit)
+
+    def metric_samples(self):
+        stats = self.index.stats()
+        return [
+            ("search_index_documents", (), stats["documents"]),
+            ("search_index_terms", (), stats["terms"]),
+        ]
+
+
+KINDS = {"games": "game", "pubs": "pub"}
+
+
+def init_app(app, db):
+    """
+    Summary:
+        Add GET /api/search?q=...&type=games|pubs&limit=20, full-text search over the live
+        games and the pubs. The last word of q matches as a prefix, for search-as-you-type.
+
+    Returns:
+        .JSON + HTTP Status: {"results": [{"type", "id", "score", "doc"}], "took_ms"} with
+        HTTP status 200, or 400 without q or with an unknown type
+    """
+    indexer = SearchIndexer(db)
+    app.extensions["search"] = indexer
+
+    @app.route("/api/search", methods=["GET"])
+    def search():
+        query = request.args.get("q", "").strip()
+        if not query:
+            return jsonify({"error": "Query parameter q is required"}), 400
+        kind = request.args.get("type")
+        if kind and kind not in KINDS:
+            return jsonify({"error": f"Unknown type {kind}, expected games or pubs"}), 400
+        try:
+            limit = max(1, min(int(request.args.get("limit", 20)), MAX_RESULTS))
+        except ValueError:
+            return jsonify({"error": "limit must be a number"}), 400
+        kinds = {KINDS[kind]} if kind else None
+
+        started = time.perf_counter()
+        if indexer.wait_ready(LOAD_WAIT_SECONDS):
+            results = indexer.index.search(query, kinds, limit)
+        else:
+            try:
+                results = indexer.prefix_search(query, kinds, limit)
+            except Exception as e:
+                logger.exception("Error searching Firestore")
+                return jsonify({"error": f"Error searching: {str(e)}"}), 500
+        took_ms = round((time.perf_counter() - started) * 1000, 3)
+        return jsonify({"results": results, "took_ms": took_ms}), 200
+
+    return indexer
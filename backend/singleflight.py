@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from json_provider import dumps_bytes
+
+
+class FlightTimeout(TimeoutError):
+    """Raised to a caller that waited longer than the key's timeout for a shared call."""
+
+
+def flight_key(name, params):
+    """Route name plus its parameters in a canonical form (sorted keys, one JSON encoding)."""
+    return name, dumps_bytes(params or {}, sort_keys=True)
+
+
+class _Flight:
+    def __init__(self, deadline):
+        self.future = Future()
+        self.deadline = deadline
+
+
+class SingleFlight:
+    """
+    Summary:
+        Coalesces identical concurrent reads: the first caller for a key runs the call and
+        every caller arriving while it is in flight waits for, and shares, its result (or
+        its exception). Nothing is cached once the call finishes. Results are shared between
+        requests, so callers must not mutate them.
+
+        A call still running after its timeout stops absorbing new callers (the next one
+        starts a fresh call), and waiters give up with FlightTimeout.
+
+    Args:
+        default_timeout: seconds a caller waits for a shared call
+        timeouts: per-name overrides of default_timeout, e.g. {"fetch_games": 5}
+    """
+
+    def __init__(self, default_timeout=10, timeouts=None):
+        self.default_timeout = default_timeout
+        self.timeouts = dict(timeouts or {})
+        self._flights = {}
+        self._lock = threading.Lock()
+        # name -> [calls run, callers served by another caller's call, timeouts]
+        self._counts = {}
+
+    def _tally(self, name, index):
+        counts = self._counts.get(name)
+        if counts is None:
+            counts = self._counts[name] = [0, 0, 0]
+        counts[index] += 1
+
+    def do(self, name, params, fn, timeout=None):
+        """
+        Summary:
+            Run fn() once for all concurrent callers with the same name and params.
+
+        Returns:
+            the result of fn(), possibly from another caller's call
+        """
+        timeout = self.timeouts.get(name, self.default_timeout) if timeout is None else timeout
+        key = flight_key(name, params)
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None or flight.deadline <= now
+            if leader:
+                flight = self._flights[key] = _Flight(now + timeout)
+            self._tally(name, 0 if leader else 1)
+
+        if leader:
+            try:
+                flight.future.set_result(fn())
+            except BaseException as e:
+                flight.future.set_exception(e)
+            finally:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+            return flight.future.result()
+
+        try:
+            return flight.future.result(timeout=max(flight.deadline - now, 0))
+        except FutureTimeout:
+            with self._lock:
+                self._tally(name, 2)
+            raise FlightTimeout(f"{name} did not complete within {timeout}s") from None
+
+    def stats(self):
+        with self._lock:
+            counts = {name: list(values) for name, values in self._counts.items()}
+            in_flight = len(self._flights)
+        routes = {}
+        for name, (calls, shared, timeouts) in counts.items():
+            routes[name] = {
+                "calls": calls,
+                "shared": shared,
+                "timeouts": timeouts,
+                "coalescing_ratio": round(shared / (calls + shared), 4),
+            }
+        return {"in_flight": in_flight, "routes": routes}
+
+    def metric_samples(self):
+        samples = []
+        with self._lock:
+            counts = {name: list(values) for name, values in self._counts.items()}
+        for name, (calls, shared, timeouts) in counts.items():
+            labels = (("name", name),)
+            samples.append(("single_flight_calls_total", labels, calls))
+            samples.append(("single_flight_shared_total", labels, shared))
+            samples.append(("single_flight_timeouts_total", labels, timeouts))
+            samples.append(("single_flight_coalescing_ratio", labels, shared / (calls + shared)))
+        return samples
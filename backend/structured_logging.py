@@ -0,0 +1,117 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message plus any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sample_rate":
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Hands records to the background writer without formatting them first, so the
+    request thread never pays for building the message string. Only exception
+    tracebacks are rendered here, while the frames are still alive.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a record passed with extra={"sample_rate": r} with probability r."""
+
+    def __init__(self):
+        super().__init__()
+        self.dropped = 0
+
+    def filter(self, record):
+        rate = getattr(record, "sample_rate", None)
+        if rate is None or rate >= 1 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+def configure_logging(level="INFO", stream=None):
+    """
+    Summary:
+        Route all logging through a queue to one background writer thread that formats
+        records as JSON lines. Calling it again only changes the level.
+
+    Args:
+        level: minimum level; records below it are dropped before any formatting
+        stream: where the writer thread writes (stdout by default)
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    handler = DeferredQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter())
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    # The writer thread does not survive a fork; give the child its own queue (so records
+    # still queued in the parent are not written twice) and its own writer
+    global _listener
+    if _listener is None:
+        return
+    fresh = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DeferredQueueHandler):
+            handler.queue = fresh
+    _listener = QueueListener(fresh, *_listener.handlers, respect_handler_level=False)
+    _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
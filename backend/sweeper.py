@@ -0,0 +1,152 @@
+import gzip
+import json
+import logging
+import time
+from datetime import datetime
+
+from firebase_admin import firestore
+
+import metrics
+from read_models import now_string
+
+GAMES_ARCHIVE = "games_archive"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Firestore allows at most 500 operations per batch
+BATCH_LIMIT = 500
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_between(earlier, later):
+    try:
+        return (datetime.strptime(later, TIME_FORMAT) - datetime.strptime(earlier[:19], TIME_FORMAT)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+class GameSweeper:
+    """
+    Summary:
+        Moves expired games out of the hot "games" collection in chunks, either into the
+        "games_archive" collection or appended to a local gzip file (one JSON game per line),
+        and removes their IDs from the players' hosted_games / joined_games arrays.
+
+    Args:
+        db: Firestore client
+        archive_path: optional path of a .jsonl.gz file; archives to Firestore when None
+        chunk_size: number of games moved per chunk
+    """
+
+    def __init__(self, db, archive_path=None, chunk_size=100):
+        self.db = db
+        self.archive_path = archive_path
+        self.chunk_size = chunk_size
+        self.last_run = None
+        self.total_swept = 0
+
+    def _expired_chunk(self, now):
+        query = (self.db.collection("games").where("expires", "<=", now)
+                 .order_by("expires").limit(self.chunk_size))
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    def sweep(self):
+        started = time.perf_counter()
+        now = now_string()
+        swept = 0
+        lag = None
+
+        while True:
+            chunk = self._expired_chunk(now)
+            if not chunk:
+                break
+            if lag is None:
+                # How far behind the sweeper is: age of the oldest expired game still in "games"
+                lag = seconds_between(chunk[0][1].get("expires"), now)
+            self._move(chunk)
+            swept += len(chunk)
+            if len(chunk) < self.chunk_size:
+                break
+
+        duration = time.perf_counter() - started
+        self.total_swept += swept
+        self.last_run = {
+            "swept": swept,
+            "duration_ms": round(duration * 1000, 2),
+            "games_per_second": round(swept / duration, 1) if duration > 0 else 0.0,
+            "lag_seconds": lag or 0,
+        }
+        metrics.registry.inc("game_sweeper_games_total", (), swept)
+        logger.info("Expired games swept", extra=self.last_run)
+        return self.last_run
+
+    def metric_samples(self):
+        # Only the process that holds the sweep lease has run it
+        if self.last_run is None:
+            return []
+        return [
+            ("game_sweeper_lag_seconds", (), self.last_run["lag_seconds"]),
+            ("game_sweeper_games_per_second", (), self.last_run["games_per_second"]),
+        ]
+
+    def _move(self, chunk):
+        if self.archive_path:
+            self._archive_to_file(chunk)
+
+        operations = []
+        if not self.archive_path:
+            archived_at = firestore.SERVER_TIMESTAMP
+            for game_id, data in chunk:
+                archive_ref = self.db.collection(GAMES_ARCHIVE).document(game_id)
+                operations.append(("set", archive_ref, {**data, "archived_at": archived_at}))
+
+        for gamer_ref, fields in self._player_updates(chunk):
+            operations.append(("update", gamer_ref, fields))
+
+        # Deletes go last so a partially committed chunk never loses a game
+        for game_id, _ in chunk:
+            operations.append(("delete", self.db.collection("games").document(game_id), None))
+
+        for start in range(0, len(operations), BATCH_LIMIT):
+            batch = self.db.batch()
+            for op, ref, data in operations[start:start + BATCH_LIMIT]:
+                if op == "set":
+                    batch.set(ref, data)
+                elif op == "update":
+                    batch.update(ref, data)
+                else:
+                    batch.delete(ref)
+            batch.commit()
+
+    def _player_updates(self, chunk):
+        hosted = {}
+        joined = {}
+        for game_id, data in chunk:
+            if data.get("host"):
+                hosted.setdefault(data["host"], []).append(game_id)
+            for participant in data.get("participants") or []:
+                joined.setdefault(participant, []).append(game_id)
+
+        gamer_ids = sorted(set(hosted) | set(joined))
+        if not gamer_ids:
+            return []
+
+        # Only update gamers that still exist; an update on a missing document fails the batch
+        refs = [self.db.collection("gamers").document(gamer_id) for gamer_id in gamer_ids]
+        updates = []
+        for snapshot in self.db.get_all(refs):
+            if not snapshot.exists:
+                continue
+            fields = {}
+            if snapshot.id in hosted:
+                fields["hosted_games"] = firestore.ArrayRemove(hosted[snapshot.id])
+            if snapshot.id in joined:
+                fields["joined_games"] = firestore.ArrayRemove(joined[snapshot.id])
+            updates.append((snapshot.reference, fields))
+        return updates
+
+    def _archive_to_file(self, chunk):
+        # Appending to a gzip file adds a new member; gzip readers treat it as one stream
+        with gzip.open(self.archive_path, "at", encoding="utf-8") as archive:
+            for game_id, data in chunk:
+                archive.write(json.dumps({"id": game_id, **data}, default=str) + "\n")
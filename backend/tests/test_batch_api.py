@@ -0,0 +1,66 @@
+import pytest
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask, jsonify, request
+
+import batch_api
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config["BATCH_MAX_REQUESTS"] = 5
+    batch_api.init_app(app)
+    barrier = threading.Barrier(3, timeout=5)
+
+    @app.route("/api/echo", methods=["POST"])
+    def echo():
+        return jsonify({"got": request.get_json(), "auth": request.headers.get("Authorization")}), 201
+
+    @app.route("/api/wait", methods=["GET"])
+    def wait():
+        # Only returns once three sub-requests are running at the same time
+        barrier.wait()
+        return jsonify({"waited": request.args.get("n")})
+
+    @app.route("/api/fail", methods=["GET"])
+    def fail():
+        raise RuntimeError("boom")
+
+    yield app.test_client()
+    app.extensions["batch_executor"].shutdown()
+
+
+# Test results come back in request order with per-item status codes
+def test_batch(client):
+    response = client.post("/api/batch", headers={"Authorization": "Bearer x"}, json={"requests": [
+        {"method": "POST", "path": "/api/echo", "body": {"gamerId": "ABCDE"}},
+        {"path": "/api/missing"},
+        {"path": "/api/fail"},
+        {"method": "DELETE", "path": "/api/echo"},
+        {"path": "/api/batch"},
+    ]})
+
+    assert response.status_code == 200
+    results = response.get_json()["responses"]
+    assert [result["status"] for result in results] == [201, 404, 500, 405, 400]
+    assert results[0]["body"] == {"got": {"gamerId": "ABCDE"}, "auth": "Bearer x"}
+
+
+# Test sub-requests run concurrently
+def test_batch_is_concurrent(client):
+    started = time.perf_counter()
+    response = client.post("/api/batch", json={"requests": [{"path": f"/api/wait?n={n}"} for n in range(3)]})
+
+    assert time.perf_counter() - started < 5
+    assert [result["body"] for result in response.get_json()["responses"]] == [{"waited": str(n)} for n in range(3)]
+
+
+def test_malformed_batch(client):
+    assert client.post("/api/batch", json={"requests": []}).status_code == 400
+    assert client.post("/api/batch", json=[{"path": "/api/echo"}]).status_code == 400
+    assert client.post("/api/batch", json={"requests": [{"path": "/api/wait"}] * 6}).status_code == 400
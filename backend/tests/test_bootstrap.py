@@ -0,0 +1,66 @@
+import pytest
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+
+import bootstrap
+import firestore_accounting
+from local_firestore import LocalFirestore
+from tracked_firestore import TrackedClient
+
+
+def make_client(friend_count=3):
+    friends = {f"f{i}": {"gamerId": f"F{i}", "fullName": f"Friend {i}", "profile": "02"} for i in range(friend_count)}
+    data = {
+        "users": {"me": {"email": "me@example.com", "isPublican": False}},
+        "gamers": {"me": {"gamerId": "ME123", "fullName": "Me", "friends_list": [f"F{i}" for i in range(friend_count)] + ["GONE"]},
+                   **friends},
+        "games": {
+            "g1": {"host": "f1", "pub_id": "p1", "expires": "2999-01-01T20:00:00", "participants": []},
+            "g2": {"host": "me", "pub_id": "p1", "expires": "2999-01-01T21:00:00", "participants": []},
+            "old": {"host": "f1", "pub_id": "p1", "expires": "2000-01-01T20:00:00", "participants": []},
+        },
+        "publicans": {"p1": {"pub_name": "The Local", "xcoord": 53.3, "ycoord": -6.2}},
+    }
+    fake = LocalFirestore(data)
+    db = TrackedClient(fake)
+    app = Flask(__name__)
+    firestore_accounting.init_app(app, db)
+    bootstrap.init_app(app, db)
+    return app.test_client(), fake
+
+
+# Test the combined payload and that each document is read only once
+def test_bootstrap():
+    client, fake = make_client(friend_count=35)
+    response = client.post("/api/bootstrap", json={"gamerId": "me"})
+
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["profile"]["email"] == "me@example.com"
+    assert payload["profile"]["fullName"] == "Me"
+    assert [game["id"] for game in payload["games"]] == ["g1", "g2"]
+    assert payload["pubs"] == [{"id": "p1", "pub_name": "The Local", "address": None, "xcoord": 53.3,
+                                "ycoord": -6.2, "BER": None, "pub_image_url": None}]
+
+    friends = {friend["gamerId"]: friend for friend in payload["friends"]}
+    assert len(friends) == 36
+    assert friends["F1"]["hosting"] == ["g1"]
+    assert friends["F0"] == {"gamerId": "F0", "fullName": "Friend 0", "profile": "02", "statusMessage": "", "hosting": []}
+    assert friends["GONE"]["fullName"] == "Unknown User"
+    assert "errors" not in payload
+
+    # users + gamers documents, the games and pubs queries, and two "in" queries for 36 friends
+    ops = response.headers[firestore_accounting.HEADER]
+    assert "queries=4" in ops
+    assert "round_trips=6" in ops
+    assert {"user", "gamer", "games", "pubs", "friends"} <= {
+        part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")}
+
+
+def test_bootstrap_errors():
+    client, _ = make_client()
+    assert client.post("/api/bootstrap", json={}).status_code == 400
+    assert client.post("/api/bootstrap", json={"gamerId": "nobody"}).status_code == 404
@@ -0,0 +1,92 @@
+import pytest
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clients import LazyFirestore, create_local_firestore
+from local_firestore import LatencyModel, LocalFirestore
+
+
+# Test the client is only created on first use and shared within a process
+def test_created_on_first_use():
+    created = []
+    lazy = LazyFirestore(lambda: created.append(1) or LocalFirestore({"games": {"g1": {"host": "a"}}}))
+    assert created == []
+    assert not lazy.created
+
+    assert lazy.collection("games").document("g1").get().to_dict() == {"host": "a"}
+    lazy.collection("games").document("g1").get()
+    assert created == [1]
+    assert lazy.created
+
+
+# Test a forked process (different PID) gets its own client
+def test_new_client_per_process(monkeypatch):
+    lazy = LazyFirestore(lambda: LocalFirestore({}))
+    parent = lazy.get()
+    assert lazy.get() is parent
+
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    child = lazy.get()
+    assert child is not parent
+    assert lazy.get() is child
+
+
+# Test listeners added before or after creation see every call
+def test_listeners_shared():
+    calls = []
+    lazy = LazyFirestore(lambda: LocalFirestore({}))
+    lazy.listeners.append(lambda call, seconds: calls.append(call.op))
+    lazy.collection("games").document("g1").get()
+    lazy.listeners.append(lambda call, seconds: calls.append("late"))
+    lazy.collection("games").document("g1").get()
+    assert calls == ["get", "get", "late"]
+
+
+def test_local_backend(tmp_path, monkeypatch):
+    path = tmp_path / "data.json"
+    path.write_text('{"games": {"g1": {"host": "a"}}}')
+    monkeypatch.setenv("LOCAL_FIRESTORE_DATA", str(path))
+
+    lazy = LazyFirestore(create_local_firestore)
+    assert lazy.collection("games").document("g1").get().to_dict() == {"host": "a"}
+
+
+# Test LOCAL_FIRESTORE_LATENCY_MS delays every round trip of the local backend
+def test_local_backend_latency(monkeypatch):
+    monkeypatch.delenv("LOCAL_FIRESTORE_DATA", raising=False)
+    monkeypatch.setenv("LOCAL_FIRESTORE_LATENCY_MS", "20")
+    db = create_local_firestore()
+    started = time.perf_counter()
+    db.collection("games").document("g1").get()
+    db.collection("games").stream()
+    assert time.perf_counter() - started >= 0.04
+
+
+# Test the latency model's median and p99 land where they were asked for
+def test_latency_model():
+    model = LatencyModel(10, 50, seed=1)
+    samples = sorted(model() for _ in range(20000))
+    assert samples[10000] == pytest.approx(0.010, rel=0.05)
+    assert samples[19800] == pytest.approx(0.050, rel=0.1)
+    assert LatencyModel.parse("") is None
+    assert LatencyModel.parse("5")() == 0.005
+    with pytest.raises(ValueError):
+        LatencyModel.parse("50,10")
+
+
+# Test listener deliveries are counted as reads, without a round trip
+def test_listener_reads_counted():
+    db = LocalFirestore({"games": {"g1": {"expires": "2999"}, "g2": {"expires": "2000"}}})
+    watch = db.collection("games").where("expires", ">", "2500").on_snapshot(lambda docs, changes, read_time: None)
+    assert db.counts["reads"] == 1 and db.counts["round_trips"] == 0
+    db.collection("games").document("g3").set({"expires": "2999"})
+    db.collection("games").document("g4").set({"expires": "2000"})
+    assert db.counts["reads"] == 2 and db.counts["writes"] == 2
+    watch.unsubscribe()
+    db.collection("games").document("g3").delete()
+    assert db.counts["reads"] == 2
+
+    db.collection("pubs").on_snapshot(lambda docs, changes, read_time: None)
+    assert db.counts["reads"] == 3
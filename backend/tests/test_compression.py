@@ -0,0 +1,85 @@
+import pytest
+import gzip
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import brotli
+from flask import Flask, jsonify
+
+import compression
+from compression import Precompressed, negotiate_encoding
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config["COMPRESS_MIN_SIZE"] = 200
+    compression.init_app(app)
+    games = [{"id": f"g{i}", "pub_id": "pub", "max_seats": 4, "expires": "2030-01-01T20:00:00"} for i in range(50)]
+    payload = Precompressed(json.dumps(games).encode("utf-8"))
+
+    @app.route("/games")
+    def games_route():
+        return jsonify(games)
+
+    @app.route("/small")
+    def small_route():
+        return jsonify({"ok": True})
+
+    @app.route("/cached")
+    def cached_route():
+        return compression.precompressed_response(app, payload)
+
+    return app, games, payload
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("br;q=0.5, gzip;q=0.8") == "gzip"
+    assert negotiate_encoding("br;q=0, gzip;q=0") is None
+    assert negotiate_encoding("*") == "br"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding(None) is None
+
+
+# Test JSON responses are compressed in the negotiated encoding
+def test_compress_json():
+    app, games, _ = make_app()
+    client = app.test_client()
+
+    response = client.get("/games", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data)) == games
+
+    response = client.get("/games", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.data)) == games
+
+    response = client.get("/games")
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json() == games
+
+
+def test_small_bodies_not_compressed():
+    app, _, _ = make_app()
+    response = app.test_client().get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json() == {"ok": True}
+
+
+# Test cached payloads are compressed once and reused
+def test_precompressed_payload():
+    app, games, payload = make_app()
+    client = app.test_client()
+
+    first = client.get("/cached", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(first.data)) == games
+    assert payload.encoded("gzip") is payload.encoded("gzip")
+    assert client.get("/cached", headers={"Accept-Encoding": "gzip"}).data == first.data
+
+    response = client.get("/cached")
+    assert response.data == payload.body
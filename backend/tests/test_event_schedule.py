@@ -0,0 +1,117 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+
+import event_schedule
+from event_schedule import EventSchedule, covering_event, event_interval, take_slots, to_timestamp
+from local_firestore import LocalFirestore
+
+
+def event(start, end, pub_id="p1"):
+    return {"game_type": "Seat Based", "start_time": f"2999-01-01T{start}:00.000Z",
+            "end_time": f"2999-01-01T{end}:00.000Z", "expires": "2999-01-02T00:00:00.000Z", "pub_id": pub_id}
+
+
+def at(hour_minute):
+    return to_timestamp(f"2999-01-01T{hour_minute}:00.000Z")
+
+
+@pytest.fixture
+def db():
+    return LocalFirestore({
+        "publicans": {"p1": {"pub_name": "The Quays", "events": ["e1", "e2"]}},
+        "events": {
+            "e1": event("18:00", "23:00"),
+            "e2": event("12:00", "15:00"),
+            "e3": event("18:00", "23:00", "p2"),
+            "old": {**event("18:00", "23:00"), "start_time": "2000-01-01T18:00:00", "end_time": "2000-01-01T23:00:00"},
+        },
+    })
+
+
+# Test event times from the app (UTC) and the backend (local) both parse
+def test_event_interval():
+    assert event_interval(event("18:00", "23:00")) == (at("18:00"), at("23:00"))
+    assert event_interval({"start_time": "2999-01-01T19:00:00", "end_time": "2999-01-01T18:00:00"}) is None
+    assert event_interval({"start_time": "soon"}) is None
+
+
+# Test the listener builds per-pub trees, follows changes and leaves out past events
+def test_schedule_follows_listener(db):
+    schedule = EventSchedule(db)
+    assert schedule.ready()
+    assert [event_id for event_id, _ in schedule.covering("p1", at("19:00"), at("21:00"))] == ["e1"]
+    assert [event_id for event_id, _ in schedule.overlapping("p1", at("14:00"), at("19:00"))] == ["e2", "e1"]
+    assert schedule.covering("p1", at("14:00"), at("19:00")) == []
+    assert schedule.known("old")
+    assert schedule.overlapping("p1", to_timestamp("2000-01-01T00:00:00"), to_timestamp("2000-01-02T00:00:00")) == []
+
+    db.collection("events").document("e1").update({"start_time": "2999-01-01T20:00:00.000Z"})
+    db.collection("events").document("e2").delete()
+    assert schedule.covering("p1", at("19:00"), at("21:00")) == []
+    assert [event_id for event_id, _ in schedule.overlapping("p1", at("12:00"), at("21:00"))] == ["e1"]
+    assert schedule.metric_samples() == [("event_schedule_pubs", (), 2), ("event_schedule_events", (), 2)]
+    schedule.stop()
+
+
+# Test the Firestore fallback finds the same covering event while the schedule is down
+def test_covering_event_fallback(db):
+    assert covering_event(db, None, "p1", at("19:00"), at("21:00"))[0] == "e1"
+    assert covering_event(db, None, "p1", at("14:00"), at("19:00")) == (None, None)
+
+
+# Test event creation rejects overlaps, including events the schedule has not seen yet
+def test_create_event(db):
+    app = Flask(__name__)
+    schedule = event_schedule.init_app(app, db)
+    client = app.test_client()
+
+    response = client.post("/api/create_event", json={**event("15:00", "18:00"), "num_seats": 20})
+    assert response.status_code == 201
+    event_id = response.get_json()["event_id"]
+    assert db.docs("events")[event_id]["num_seats"] == 20
+    assert db.docs("publicans")["p1"]["events"] == ["e1", "e2", event_id]
+
+    response = client.post("/api/create_event", json=event("17:00", "19:00"))
+    assert response.status_code == 409
+    assert sorted(response.get_json()["conflicts"]) == sorted([event_id, "e1"])
+
+    # Written by another process; this one's listener has not delivered it
+    schedule.stop()
+    schedule.ready = lambda: True
+    db.collection("events").document("e9").set(event("09:00", "11:00"))
+    db.collection("publicans").document("p1").update({"events": ["e1", "e2", event_id, "e9"]})
+    response = client.post("/api/create_event", json=event("10:00", "12:00"))
+    assert response.get_json()["conflicts"] == ["e9"]
+
+    assert client.post("/api/create_event", json=event("15:00", "18:00", "nope")).status_code == 404
+    assert client.post("/api/create_event", json={**event("15:00", "18:00"), "end_time": "2999-01-01T14:00:00"}).status_code == 400
+    assert client.post("/api/create_event", json={"pub_id": "p1"}).status_code == 400
+
+
+# Test events are created, and still checked for overlaps, before the schedule has loaded
+def test_create_event_while_loading(db, monkeypatch):
+    app = Flask(__name__)
+    schedule = event_schedule.init_app(app, db)
+    monkeypatch.setattr(schedule, "ready", lambda: False)
+    client = app.test_client()
+
+    response = client.post("/api/create_event", json=event("11:00", "13:00"))
+    assert response.status_code == 409
+    assert response.get_json()["conflicts"] == ["e2"]
+    assert client.post("/api/create_event", json=event("08:00", "10:00")).status_code == 201
+
+# Test a game takes seats, or whole tables, from the slots inside its time only
+def test_take_slots():
+    slots = {"18:00-19:00": 8, "19:00-20:00": 8, "20:00-21:00": 3, "9:00-10:00": 8}
+    seats = {**event("09:00", "23:00"), "available_slots": slots}
+    assert take_slots(seats, "2999-01-01T19:00:00.000Z", "2999-01-01T21:00:00.000Z", 3) == \
+        {"18:00-19:00": 8, "19:00-20:00": 5, "20:00-21:00": 0, "9:00-10:00": 8}
+    assert take_slots(seats, "2999-01-01T19:00:00", "2999-01-01T21:00:00", 4) is None
+
+    tables = {**seats, "game_type": "Table Based", "table_capacity": 4}
+    assert take_slots(tables, "2999-01-01T09:00:00", "2999-01-01T10:00:00", 5)["9:00-10:00"] == 6
+    assert slots["9:00-10:00"] == 8
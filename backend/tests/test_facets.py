@@ -0,0 +1,162 @@
+import pytest
+import sys
+import os
+import random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+import facets
+from facets import FacetIndex, FacetIndexer, daypart, facet_values, parse_filters
+from local_firestore import LocalFirestore
+from replica import GamesReplica
+
+LIVE = "2999-01-01T20:00:00"
+
+
+def game(game_type="Pool", pub_id="p1", start_time="2999-01-01T19:00", participants=(), **fields):
+    return {"game_type": game_type, "pub_id": pub_id, "start_time": start_time, "expires": LIVE,
+            "max_players": 2, "participants": list(participants), **fields}
+
+
+def ids(games):
+    return sorted(game["id"] for game in games)
+
+
+# Test the part of the day and the facet values of a game
+def test_facet_values():
+    assert [daypart(f"2999-01-01T{hour:02d}:00") for hour in (0, 4, 5, 11, 12, 16, 17, 21, 22, 23)] == [
+        "night", "night", "morning", "morning", "afternoon", "afternoon", "evening", "evening", "night", "night"]
+    assert daypart(None) is None
+    assert facet_values({**game(participants=["a", "b"]), "xcoord": 53.34, "ycoord": -6.26}) == {
+        "type": "Pool", "pub": "p1", "daypart": "evening", "open": "no", "area": "533_-63"}
+
+
+# Test query parameters: repeated and comma-separated values, and validation
+def test_parse_filters():
+    args = MultiDict([("type", "Pool,Darts"), ("type", "Chess"), ("open", "1"), ("daypart", "")])
+    assert parse_filters(args) == {"type": {"Pool", "Darts", "Chess"}, "open": {"yes"}}
+    assert parse_filters(MultiDict()) is None
+    with pytest.raises(ValueError):
+        parse_filters(MultiDict([("daypart", "brunch")]))
+    with pytest.raises(ValueError):
+        parse_filters(MultiDict([("open", "maybe")]))
+
+
+# Test AND across facets, OR within one, and counts that ignore the facet's own filter
+def test_filter_and_counts():
+    index = FacetIndex()
+    index.add_many([
+        ("g1", game()),
+        ("g2", game("Darts", participants=["a", "b"])),
+        ("g3", game("Darts", "p2", "2999-01-01T13:00")),
+        ("g4", game("Chess", "p2")),
+    ])
+    assert ids(index.filter(None)) == ["g1", "g2", "g3", "g4"]
+    assert ids(index.filter({"type": {"Pool", "Darts"}, "open": {"yes"}})) == ["g1", "g3"]
+    assert ids(index.filter({"pub": {"p2"}, "daypart": {"evening"}})) == ["g4"]
+    assert index.filter({"type": {"Bingo"}}) == []
+
+    total, counts = index.facet_counts({"type": {"Darts"}})
+    assert total == 2
+    assert counts["type"] == {"Pool": 1, "Darts": 2, "Chess": 1}
+    assert counts["pub"] == {"p1": 1, "p2": 1}
+    assert counts["open"] == {"yes": 1, "no": 1}
+
+
+# Test joins, leaves, removals and expiry update the bitsets, and ordinals are reused
+def test_incremental_updates(monkeypatch):
+    index = FacetIndex()
+    index.add("g1", game())
+    index.add("g2", game(expires="2999-01-01T00:00:00"))
+    index.add("g1", game(participants=["a", "b"]))
+    assert ids(index.filter({"open": {"no"}})) == ["g1"]
+    index.add("g1", game(participants=["a"]))
+    assert ids(index.filter({"open": {"yes"}})) == ["g1", "g2"]
+
+    index.remove("g1")
+    index.add("g3", game("Darts"))
+    assert index._ordinals["g3"] == 0
+    assert index.facet_counts()[1]["type"] == {"Pool": 1, "Darts": 1}
+
+    monkeypatch.setattr(facets, "now_string", lambda: "2999-01-01T12:00:00")
+    assert ids(index.filter(None)) == ["g3"]
+    assert index.stats() == {"games": 1, "bitmaps": 4, "ordinals": 2}
+
+
+# Test the bitmap results match filtering every game directly
+def test_matches_linear_scan():
+    rng = random.Random(5)
+    index = FacetIndex()
+    games = {}
+    for step in range(3000):
+        game_id = f"g{rng.randrange(400)}"
+        if rng.random() < 0.2:
+            index.remove(game_id)
+            games.pop(game_id, None)
+        else:
+            data = game(rng.choice(["Pool", "Darts", "Chess"]), rng.choice(["p1", "p2", "p3", None]),
+                        f"2999-01-01T{rng.randrange(24):02d}:00", participants=["a"] * rng.randrange(3))
+            index.add(game_id, data)
+            games[game_id] = data
+
+    for filters in [{"type": {"Pool"}}, {"type": {"Darts", "Chess"}, "open": {"yes"}},
+                    {"pub": {"p1", "p3"}, "daypart": {"night", "morning"}}]:
+        expected = sorted(game_id for game_id, data in games.items()
+                          if all(facet_values(data).get(facet) in values for facet, values in filters.items()))
+        assert ids(index.filter(filters)) == expected
+
+
+# Test the facets endpoint follows the games listener
+def test_game_facets_endpoint():
+    db = LocalFirestore({"games": {"g1": game(), "old": {**game(), "expires": "2000-01-01T00:00:00"}}})
+    app = Flask(__name__)
+    indexer = facets.init_app(app, db)
+    client = app.test_client()
+
+    response = client.get("/api/game_facets")
+    assert response.status_code == 200
+    assert response.get_json()["total"] == 1
+
+    db.collection("games").document("g2").set(game("Darts"))
+    db.collection("games").document("g1").update({"participants": ["a", "b"]})
+    response = client.get("/api/game_facets?open=true")
+    assert response.get_json() == {"total": 1, "facets": {
+        "type": {"Darts": 1}, "pub": {"p1": 1}, "daypart": {"evening": 1}, "open": {"yes": 1, "no": 1}, "area": {}}}
+    assert client.get("/api/game_facets?open=maybe").status_code == 400
+    indexer.stop()
+
+
+# Test a restarted listener rebuilds the index, dropping games deleted while it was down
+def test_restart_rebuilds():
+    db = LocalFirestore({"games": {"g1": game(), "g2": game("Darts")}})
+    indexer = FacetIndexer(db, retry_seconds=0)
+    assert indexer.ready()
+
+    indexer.stop()
+    db.collection("games").document("g1").delete()
+    assert indexer.ready()
+    assert ids(indexer.filter(None)) == ["g2"]
+    assert indexer.facet_counts()[1]["type"] == {"Darts": 1}
+    indexer.stop()
+
+
+# Test filters and counts are answered game by game, from the replica or Firestore, until the index is ready
+def test_fallback_before_ready(monkeypatch):
+    data = {"g1": game(), "g2": game("Darts", "p2", participants=["a", "b"]), "g3": game("Darts", start_time="2999-01-01T09:00"),
+            "old": {**game(), "expires": "2000-01-01T00:00:00"}}
+    db = LocalFirestore({"games": data})
+    replica = GamesReplica(db)
+    replica.ready()
+    ready = FacetIndexer(db)
+    assert ready.ready()
+
+    for source in (None, replica):
+        indexer = FacetIndexer(db, source)
+        monkeypatch.setattr(indexer, "ready", lambda: False)
+        for filters in [None, {"type": {"Darts"}}, {"type": {"Darts", "Pool"}, "open": {"yes"}}, {"daypart": {"morning"}}]:
+            assert ids(indexer.filter(filters)) == ids(ready.filter(filters))
+            assert indexer.facet_counts(filters) == ready.facet_counts(filters)
+    replica.stop()
+    ready.stop()
@@ -0,0 +1,66 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask, jsonify
+
+import firestore_accounting
+from local_firestore import LocalFirestore
+from tracked_firestore import TrackedClient
+
+
+def make_app(friend_count):
+    friends = {f"f{i}": {"gamerId": f"F{i}", "fullName": f"Friend {i}"} for i in range(friend_count)}
+    db = TrackedClient(LocalFirestore({"gamers": {"me": {"friends_list": [f"F{i}" for i in range(friend_count)]}, **friends}}))
+    app = Flask(__name__)
+    app.config["FIRESTORE_N_PLUS_ONE_THRESHOLD"] = 3
+    firestore_accounting.init_app(app, db)
+
+    @app.route("/friends")
+    def friends_route():
+        me = db.collection("gamers").document("me").get().to_dict()
+        names = []
+        for friend_id in me["friends_list"]:
+            for doc in db.collection("gamers").where("gamerId", "==", friend_id).limit(1).stream():
+                names.append(doc.to_dict()["fullName"])
+        return jsonify(names)
+
+    @app.route("/write")
+    def write_route():
+        batch = db.batch()
+        batch.set(db.collection("gamers").document("x"), {"a": 1})
+        batch.set(db.collection("gamers").document("y"), {"a": 1})
+        batch.commit()
+        return jsonify({})
+
+    return app
+
+
+# Test the per-request counts header
+def test_ops_header():
+    client = make_app(2).test_client()
+
+    response = client.get("/friends")
+    assert response.headers[firestore_accounting.HEADER] == "reads=3;writes=0;queries=2;round_trips=3"
+
+    response = client.get("/write")
+    assert response.headers[firestore_accounting.HEADER] == "reads=0;writes=2;queries=0;round_trips=1"
+
+
+# Test repeated same-shape queries are reported with their call site
+def test_n_plus_one_warning(caplog):
+    client = make_app(5).test_client()
+    client.get("/friends")
+
+    warnings = [record.getMessage() for record in caplog.records if record.levelname == "WARNING"]
+    assert len(warnings) == 1
+    assert warnings[0].startswith("Possible N+1 in /friends")
+    assert "gamers.where(gamerId ==).limit" in warnings[0]
+    assert "test_firestore_accounting.py" in warnings[0]
+    assert "friends_route" in warnings[0]
+
+
+def test_no_warning_below_threshold(caplog):
+    make_app(3).test_client().get("/friends")
+    assert not [record for record in caplog.records if record.levelname == "WARNING"]
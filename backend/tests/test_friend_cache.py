@@ -0,0 +1,116 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import friend_cache
+from friend_cache import FriendSummaryCache, friend_summary
+from local_firestore import LocalFirestore
+
+DATA = {
+    "gamers": {
+        "f1": {"gamerId": "FR001", "fullName": "Friend", "profile": "02", "friends_list": []},
+        "f2": {"gamerId": "FR002", "fullName": "Other", "statusMessage": "hi"},
+    },
+}
+
+
+@pytest.fixture
+def db():
+    return LocalFirestore(DATA)
+
+
+def fill(cache, db, *doc_ids):
+    token = cache.token()
+    for doc_id in doc_ids:
+        cache.put(token, doc_id, db.collection("gamers").document(doc_id).get().to_dict())
+
+
+# Test summaries have the fetch_friends shape, including for unknown friends
+def test_friend_summary():
+    assert friend_summary("FR002", DATA["gamers"]["f2"]) == {
+        "gamerId": "FR002", "fullName": "Other", "profile": "01", "statusMessage": "hi"}
+    assert friend_summary("NOPE", None) == {"gamerId": "NOPE", "fullName": "Unknown User", "profile": "03"}
+
+
+# Test hits, misses and LRU eviction
+def test_lru(db):
+    cache = FriendSummaryCache(db, max_entries=1, listen=False)
+    fill(cache, db, "f1")
+    found, missing = cache.get_many(["FR001", "FR002"])
+    assert found == {"FR001": friend_summary("FR001", DATA["gamers"]["f1"])}
+    assert missing == ["FR002"]
+
+    fill(cache, db, "f2")
+    assert cache.get_many(["FR001"]) == ({}, ["FR001"])
+    assert cache.stats()["evictions"] == 1
+
+
+# Test entries expire after stale_seconds while no listener keeps them fresh
+def test_stale_without_listener(db, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(friend_cache.time, "monotonic", lambda: now[0])
+    cache = FriendSummaryCache(db, ttl=300, stale_seconds=5, listen=False)
+    fill(cache, db, "f1")
+    now[0] += 4
+    assert "FR001" in cache.get_many(["FR001"])[0]
+    now[0] += 2
+    assert cache.get_many(["FR001"]) == ({}, ["FR001"])
+
+
+# Test invalidation by document ID, and that a read racing with it is not cached
+def test_invalidate(db):
+    cache = FriendSummaryCache(db, listen=False)
+    fill(cache, db, "f1")
+    cache.invalidate("f1")
+    assert cache.get_many(["FR001"])[1] == ["FR001"]
+
+    token = cache.token()
+    old = db.collection("gamers").document("f1").get().to_dict()
+    cache.invalidate("f1")
+    cache.put(token, "f1", old)
+    assert cache.get_many(["FR001"])[1] == ["FR001"]
+
+
+# Test the gamers listener drops entries whose summary fields change, and only those
+def test_listener_invalidates(db):
+    cache = FriendSummaryCache(db, ttl=300, stale_seconds=0)
+    cache.get_many([])  # starts the listener
+    fill(cache, db, "f1", "f2")
+
+    db.collection("gamers").document("f1").update({"friends_list": ["FR002"]})
+    assert "FR001" in cache.get_many(["FR001"])[0]
+
+    db.collection("gamers").document("f1").update({"statusMessage": "out tonight"})
+    db.collection("gamers").document("f2").delete()
+    assert cache.get_many(["FR001", "FR002"]) == ({}, ["FR001", "FR002"])
+    assert cache.stats()["invalidations"] == 2
+    cache.stop()
+
+
+# Test only cached gamers are listened to, IN_QUERY_LIMIT per listener, from the lookup after they are cached
+def test_listens_to_cached_gamers(monkeypatch):
+    monkeypatch.setattr(friend_cache, "IN_QUERY_LIMIT", 2)
+    db = LocalFirestore({"gamers": {f"g{i}": {"gamerId": f"G{i}", "fullName": f"Gamer {i}"} for i in range(6)}})
+    cache = FriendSummaryCache(db, max_entries=4, ttl=300, stale_seconds=0)
+    fill(cache, db, "g0", "g1", "g2")
+    assert cache.listeners() == 0
+
+    # Changed before its listener started: its first snapshot drops the entry
+    db.collection("gamers").document("g0").update({"fullName": "Renamed"})
+    assert cache.get_many(["G0", "G1", "G2"]) == ({"G1": friend_summary("G1", {"fullName": "Gamer 1"}),
+                                                   "G2": friend_summary("G2", {"fullName": "Gamer 2"})}, ["G0"])
+    assert cache.listeners() == 2
+
+    # Gamers nobody cached are not listened to
+    reads = db.counts["reads"]
+    db.collection("gamers").document("g5").update({"fullName": "Elsewhere"})
+    assert db.counts["reads"] == reads
+
+    # A listener whose gamers were all evicted is closed
+    fill(cache, db, "g3", "g4", "g5", "g0")
+    cache.get_many([])
+    assert sorted(cache.get_many(["G3", "G4", "G5", "G0"])[0]) == ["G0", "G3", "G4", "G5"]
+    assert cache.listeners() == 3
+    cache.stop()
+    assert cache.listeners() == 0
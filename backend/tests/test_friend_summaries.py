@@ -0,0 +1,84 @@
+import pytest
+import sys
+import os
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from friend_summaries import FriendSummaryFanOut, FriendSummaryRepair, denormalized_friends
+from local_firestore import LocalFirestore
+
+
+def gamers(count, friend="G0"):
+    data = {f"g{i}": {"gamerId": f"G{i}", "fullName": f"Gamer {i}", "friends_list": [friend]} for i in range(1, count + 1)}
+    data["g0"] = {"gamerId": "G0", "fullName": "Star", "profile": "04", "friends_list": ["G1"]}
+    return data
+
+
+# Test fetch_friends entries come from the stored summaries, with the gaps reported
+def test_denormalized_friends():
+    data = {"friends_list": ["A", "B"], "friend_summaries": {"A": {"fullName": "Ann", "profile": "02"}}}
+    friends, missing = denormalized_friends(data)
+    assert friends == [{"gamerId": "A", "fullName": "Ann", "profile": "02", "statusMessage": ""}, None]
+    assert missing == ["B"]
+
+
+# Test a profile change reaches every follower in chunked batches
+def test_fan_out_chunks():
+    db = LocalFirestore({"gamers": gamers(5)})
+    fanout = FriendSummaryFanOut(db, batch_size=2)
+    db.reset_counts()
+
+    assert fanout.fan_out("g0") == 5
+    assert db.counts["commits"] == 3 and db.counts["writes"] == 5
+    docs = db.docs("gamers")
+    assert all(docs[f"g{i}"]["friend_summaries"] == {"G0": {"fullName": "Star", "profile": "04"}} for i in range(1, 6))
+    assert "friend_summaries" not in docs["g0"]  # only followers of G0 are written
+    fanout.shutdown()
+
+
+# Test queued fan-outs for the same gamer run once, with the data at run time
+def test_submit_coalesces():
+    db = LocalFirestore({"gamers": gamers(2)})
+    fanout = FriendSummaryFanOut(db, max_workers=1)
+    busy = threading.Event()
+    fanout._executor.submit(busy.wait, 5)  # keep the only worker busy
+
+    ran = []
+    fan_out = fanout.fan_out
+    fanout.fan_out = lambda doc_id: ran.append(doc_id) or fan_out(doc_id)
+    first = fanout.submit("g0")
+    assert fanout.submit("g0") is None
+    db.collection("gamers").document("g0").update({"fullName": "Superstar"})
+    busy.set()
+    first.result()
+
+    assert ran == ["g0"]
+    assert db.docs("gamers")["g1"]["friend_summaries"]["G0"]["fullName"] == "Superstar"
+    fanout.shutdown()
+
+
+# Test the repair job rewrites only drifted documents and drops unfriended entries
+def test_repair():
+    data = gamers(2)
+    data["g1"]["friend_summaries"] = {"G0": {"fullName": "Star", "profile": "04"}}
+    data["g2"]["friend_summaries"] = {"G0": {"fullName": "Old name"}, "G9": {"fullName": "Ex"}}
+    db = LocalFirestore({"gamers": data})
+
+    assert FriendSummaryRepair(db).repair() == {"scanned": 3, "repaired": 2,
+                                                "duration_ms": pytest.approx(0, abs=1000)}
+    docs = db.docs("gamers")
+    assert docs["g2"]["friend_summaries"] == {"G0": {"fullName": "Star", "profile": "04"}}
+    assert docs["g0"]["friend_summaries"] == {"G1": {"fullName": "Gamer 1"}}
+    assert FriendSummaryRepair(db).repair()["repaired"] == 0
+
+
+# Test one gamer's summaries are rebuilt on demand, with a placeholder for a missing friend
+def test_repair_one():
+    db = LocalFirestore({"gamers": gamers(1)})
+    fanout = FriendSummaryFanOut(db)
+    db.collection("gamers").document("g1").update({"friends_list": ["G0", "GONE"]})
+    fanout.submit_repair("g1")
+    fanout.flush()
+    assert db.docs("gamers")["g1"]["friend_summaries"] == {
+        "G0": {"fullName": "Star", "profile": "04"}, "GONE": {"fullName": "Unknown User", "profile": "03"}}
+    fanout.shutdown()
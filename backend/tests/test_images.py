@@ -0,0 +1,67 @@
+import pytest
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image
+
+from images import ImageVariants, negotiate_format, snap_width
+
+
+@pytest.fixture
+def folder(tmp_path):
+    Image.new("RGBA", (1000, 500), (200, 10, 10, 128)).save(tmp_path / "pub.png")
+    return tmp_path
+
+
+def test_snap_width():
+    assert snap_width(100) == 160
+    assert snap_width(320) == 320
+    assert snap_width(5000) == 1280
+
+
+def test_negotiate_format():
+    assert negotiate_format("image/avif,image/webp,*/*") == "webp"
+    assert negotiate_format("image/jpeg,*/*") == "jpeg"
+    assert negotiate_format(None) == "jpeg"
+    assert negotiate_format("image/webp", requested="jpeg") == "jpeg"
+
+
+# Test variants are resized, converted and generated only once
+def test_variant_generation(folder):
+    variants = ImageVariants(str(folder))
+    path, etag, mimetype = variants.variant("pub.png", 320, "jpeg")
+
+    assert mimetype == "image/jpeg"
+    assert variants.version("pub.png") in os.path.basename(path)
+    with Image.open(path) as image:
+        assert image.format == "JPEG"
+        assert image.size == (320, 160)
+
+    mtime = os.stat(path).st_mtime_ns
+    assert variants.variant("pub.png", 320, "jpeg") == (path, etag, mimetype)
+    assert os.stat(path).st_mtime_ns == mtime
+
+    webp_path, webp_etag, _ = variants.variant("pub.png", 320, "webp")
+    assert webp_etag != etag
+    with Image.open(webp_path) as image:
+        assert image.format == "WEBP"
+
+
+# Test a replaced source image gets a new version and new variants
+def test_source_change(folder):
+    variants = ImageVariants(str(folder))
+    old_version = variants.version("pub.png")
+    old_path = variants.variant("pub.png", 160, "webp")[0]
+
+    Image.new("RGB", (400, 400), (0, 0, 255)).save(folder / "pub.png")
+    os.utime(folder / "pub.png", ns=(1, 1))
+
+    assert variants.version("pub.png") != old_version
+    assert variants.variant("pub.png", 160, "webp")[0] != old_path
+
+
+def test_missing_or_unsafe_names(folder):
+    variants = ImageVariants(str(folder))
+    assert variants.version("nope.png") is None
+    assert variants.variant("../pub.png", 160, "jpeg") is None
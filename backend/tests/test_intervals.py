@@ -0,0 +1,59 @@
+import pytest
+import sys
+import os
+import random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from intervals import IntervalTree
+
+
+# Test covering and overlapping queries, with touching ends
+def test_queries():
+    tree = IntervalTree()
+    tree.add(18, 23, "evening")
+    tree.add(12, 15, "lunch", {"name": "Lunch"})
+    tree.add(20, 21, "quiz")
+
+    assert [key for _, _, key, _ in tree.covering(20, 21)] == ["evening", "quiz"]
+    assert [key for _, _, key, _ in tree.covering(19, 22)] == ["evening"]
+    assert tree.covering(14, 19) == []
+    assert [key for _, _, key, _ in tree.overlapping(14, 19)] == ["lunch", "evening"]
+    assert tree.overlapping(15, 18) == []
+    assert tree.overlapping(23, 24) == []
+
+
+# Test replacing and removing by key
+def test_add_and_remove():
+    tree = IntervalTree()
+    tree.add(1, 2, "a", "first")
+    tree.add(5, 6, "a", "moved")
+    assert len(tree) == 1 and "a" in tree
+    assert tree.items() == [(5, 6, "a", "moved")]
+    assert tree.remove("a") == "moved"
+    assert tree.remove("a") is None
+    assert tree.items() == [] and tree.overlapping(0, 10) == []
+
+
+# Test random adds and removes against a linear scan
+def test_matches_linear_scan():
+    rng = random.Random(11)
+    tree = IntervalTree()
+    intervals = {}
+    for step in range(4000):
+        key = rng.randrange(300)
+        if rng.random() < 0.3:
+            tree.remove(key)
+            intervals.pop(key, None)
+        else:
+            start = rng.randrange(1000)
+            end = start + rng.randrange(1, 100)
+            tree.add(start, end, key)
+            intervals[key] = (start, end)
+    assert [(s, k, e) for s, e, k, _ in tree.items()] == sorted((s, k, e) for k, (s, e) in intervals.items())
+    for _ in range(200):
+        start = rng.randrange(1000)
+        end = start + rng.randrange(1, 60)
+        assert [key for _, _, key, _ in tree.overlapping(start, end)] == [
+            k for s, k in sorted((s, k) for k, (s, e) in intervals.items() if s < end and e > start)]
+        assert [key for _, _, key, _ in tree.covering(start, end)] == [
+            k for s, k in sorted((s, k) for k, (s, e) in intervals.items() if s <= start and e >= end)]
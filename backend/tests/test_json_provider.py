@@ -0,0 +1,85 @@
+import pytest
+import json
+import os
+import sys
+from datetime import date, datetime, timezone
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask, jsonify, request
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import GeoPoint
+
+import json_provider
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    json_provider.init_app(app)
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        data = request.get_json()
+        return jsonify({"types": {key: type(value).__name__ for key, value in data.items()}, "data": data})
+
+    return app
+
+
+# Test Firestore and datetime values are encoded without manual conversion
+def test_encode_firestore_types(app):
+    created = DatetimeWithNanoseconds(2025, 3, 1, 18, 30, 0, 123456, tzinfo=timezone.utc)
+    with app.app_context():
+        response = jsonify({
+            "createdAt": created,
+            "naive": datetime(2025, 3, 1, 18, 30),
+            "day": date(2025, 3, 1),
+            "location": GeoPoint(53.34, -6.26),
+            "tags": {"pool"},
+        })
+
+    assert response.mimetype == "application/json"
+    assert json.loads(response.data) == {
+        "createdAt": "2025-03-01T18:30:00.123456Z",
+        "naive": "2025-03-01T18:30:00",
+        "day": "2025-03-01",
+        "location": {"latitude": 53.34, "longitude": -6.26},
+        "tags": ["pool"],
+    }
+
+
+def test_encode_nanoseconds():
+    value = DatetimeWithNanoseconds.from_rfc3339("2025-03-01T18:30:00.123456789Z")
+    assert json_provider.dumps_bytes(value) == b'"2025-03-01T18:30:00.123456789Z"'
+    assert json_provider.revive(json_provider.loads_bytes(b'"2025-03-01T18:30:00.123456789Z"')).nanosecond == 123456789
+
+
+# Test request bodies are decoded as plain JSON: app times stay the strings documents store
+def test_decode_request(app):
+    response = app.test_client().post("/echo", json={
+        "createdAt": "2025-03-01T18:30:00Z",
+        "expires": "2025-03-01T20:00:00.000Z",
+        "location": {"latitude": 53.34, "longitude": -6.26},
+        "name": "Pool night",
+    })
+
+    assert response.get_json()["types"] == {
+        "createdAt": "str",
+        "expires": "str",
+        "location": "dict",
+        "name": "str",
+    }
+
+
+# Test revive turns explicitly typed values back into Firestore types
+def test_revive():
+    value = json_provider.revive({"createdAt": "2025-03-01T18:30:00Z", "joinedAt": "2025-03-01T18:30:00.5+01:00",
+                                  "expires": "2025-03-01T20:00:00", "location": {"latitude": 53.34, "longitude": -6.26}})
+    assert type(value["createdAt"]).__name__ == "DatetimeWithNanoseconds"
+    assert isinstance(value["joinedAt"], datetime)
+    assert value["expires"] == "2025-03-01T20:00:00"
+    assert isinstance(value["location"], GeoPoint)
+
+
+def test_unsupported_type(app):
+    with app.app_context(), pytest.raises(TypeError):
+        jsonify({"value": object()})
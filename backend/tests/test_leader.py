@@ -0,0 +1,115 @@
+import pytest
+import sys
+import os
+import multiprocessing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import leader
+import metrics
+from leader import FileLease, FirestoreLease, LeaderJob, LEASE_COLLECTION
+from local_firestore import LocalFirestore
+from tracked_firestore import TrackedClient
+
+
+@pytest.fixture
+def db():
+    return TrackedClient(LocalFirestore())
+
+
+def runs(name):
+    counters, _ = metrics.registry.collect()
+    return {dict(labels)["result"]: value for labels, value in counters.get("scheduled_job_runs_total", {}).items()
+            if dict(labels)["job"] == name}
+
+
+# Test only one holder gets a Firestore lease until it expires
+def test_firestore_lease_exclusive(db, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(leader.time, "time", lambda: now[0])
+    first = FirestoreLease(db, "sweep", ttl=60, holder="a")
+    second = FirestoreLease(db, "sweep", ttl=60, holder="b")
+
+    assert first.acquire() is True
+    assert second.acquire() is False
+    now[0] += 30
+    assert first.acquire() is True  # renewed until 1090
+    now[0] += 45
+    assert second.acquire() is False
+
+    # The leader stops renewing (it died): the other worker takes over after the expiry
+    now[0] += 20
+    assert second.acquire() is True
+    assert first.acquire() is False
+    assert db._wrapped.docs(LEASE_COLLECTION)["sweep"]["holder"] == "b"
+
+
+# Test releasing a Firestore lease lets another holder in straight away
+def test_firestore_lease_release(db):
+    first = FirestoreLease(db, "refresh", ttl=600, holder="a")
+    second = FirestoreLease(db, "refresh", ttl=600, holder="b")
+    assert first.acquire()
+    second.release()  # not the holder: no effect
+    assert not second.acquire()
+
+    first.release()
+    assert second.acquire()
+
+
+# Test lease transactions are reported as reads and commits
+def test_firestore_lease_tracked():
+    calls = []
+    db = TrackedClient(LocalFirestore(), [lambda call, seconds: calls.append((call.op, call.writes))])
+    FirestoreLease(db, "job", ttl=60, holder="a").acquire()
+    assert calls == [("get", 0), ("commit", 1)]
+
+
+def _try_lock(directory, results):
+    results.put(FileLease(directory, "Expired Game Sweeper").acquire())
+
+
+# Test a file lease is exclusive between processes and freed when released
+def test_file_lease(tmp_path):
+    lease = FileLease(str(tmp_path), "Expired Game Sweeper")
+    assert lease.acquire() and lease.acquire()
+
+    results = multiprocessing.Queue()
+    other = multiprocessing.Process(target=_try_lock, args=(str(tmp_path), results))
+    other.start()
+    other.join()
+    assert results.get() is False
+
+    lease.release()
+    other = multiprocessing.Process(target=_try_lock, args=(str(tmp_path), results))
+    other.start()
+    other.join()
+    assert results.get() is True
+
+
+# Test a job only runs under its lease, and runs and skips are counted
+def test_leader_job(db):
+    calls = []
+    job = LeaderJob(FirestoreLease(db, "test-leader-job", ttl=60, holder="a"), "test-leader-job", lambda: calls.append(1))
+    follower = LeaderJob(FirestoreLease(db, "test-leader-job", ttl=60, holder="b"), "test-leader-job", lambda: calls.append(2))
+
+    job()
+    follower()
+    job()
+    assert calls == [1, 1]
+    assert runs("test-leader-job") == {"ok": 2, "skipped": 1}
+    _, histograms = metrics.registry.collect()
+    bucket_counts, _ = histograms["scheduled_job_duration_seconds"][(("job", "test-leader-job"),)]
+    assert sum(bucket_counts) == 2
+
+
+# Test a failing job or lease is logged and counted, not raised into the scheduler
+def test_leader_job_errors():
+    class BrokenLease:
+        def acquire(self):
+            raise RuntimeError("unavailable")
+
+    def fail():
+        raise ValueError("boom")
+
+    LeaderJob(leader.NoLease("test-failing-job"), "test-failing-job", fail)()
+    LeaderJob(BrokenLease(), "test-failing-job", fail)()
+    assert runs("test-failing-job") == {"error": 1, "lease_error": 1}
@@ -0,0 +1,276 @@
+import pytest
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image
+
+import clients
+import main
+from local_firestore import LocalFirestore
+
+DATA = {
+    "users": {"f1": {"isPublican": False}},
+    "gamers": {
+        "me": {"gamerId": "ME123", "fullName": "Me", "friends_list": ["FR001"]},
+        "f1": {"gamerId": "FR001", "fullName": "Friend", "profile": "02"},
+    },
+    "games": {
+        "g1": {"host": "f1", "pub_id": "p1", "expires": "2999-01-01T20:00:00"},
+        "old": {"host": "f1", "pub_id": "p1", "expires": "2000-01-01T20:00:00"},
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def write_behind_path(tmp_path, monkeypatch):
+    # Each test gets its own write-behind queue file
+    monkeypatch.setattr(main.Config, "WRITE_BEHIND_PATH", str(tmp_path / "write-behind.sqlite3"))
+
+
+@pytest.fixture
+def factory_calls(monkeypatch):
+    calls = []
+    apps = []
+
+    def factory():
+        calls.append(1)
+        return LocalFirestore(DATA)
+
+    def create_app(config=None):
+        apps.append(app_factory(config))
+        return apps[-1]
+
+    # Apps are shut down after the test, so none of their background threads writes
+    # through the shared client into a later test's Firestore
+    app_factory = main.create_app
+    monkeypatch.setattr(main, "create_app", create_app)
+    clients.firestore_client.configure(factory)
+    yield calls
+    for app in apps:
+        main.shutdown_app(app)
+    clients.firestore_client.configure(clients.create_firestore)
+
+
+# Test creating the app connects to nothing and starts no scheduler
+def test_create_app_is_lazy(factory_calls):
+    app = main.create_app({"TESTING": True})
+    assert factory_calls == []
+    assert "scheduler" not in app.extensions
+
+    response = app.test_client().get("/api/fetch_games")
+    assert response.status_code == 200
+    assert [game["id"] for game in response.get_json()] == ["g1"]
+    assert factory_calls == [1]
+
+
+def test_fetch_friends(factory_calls):
+    client = main.create_app({"TESTING": True}).test_client()
+    response = client.post("/api/fetch_friends", json={"gamerId": "me"})
+    assert response.get_json() == [{"gamerId": "FR001", "fullName": "Friend", "profile": "02", "statusMessage": ""}]
+
+
+def test_scheduler_when_configured(factory_calls):
+    app = main.create_app({"TESTING": True, "RUN_SCHEDULER": True, "SCHEDULER_API_ENABLED": False})
+    scheduler = app.extensions["scheduler"]
+    try:
+        assert sorted(job.id for job in scheduler.get_jobs()) == [
+            "Expired Game Sweeper", "Friend Summary Repair", "Scheduled Task"]
+        # Every job runs under its own lease
+        assert [job.lease.name for job in app.extensions["scheduler_jobs"]] == [
+            "Scheduled Task", "Expired Game Sweeper", "Friend Summary Repair"]
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+# Test concurrent identical profile reads share one set of Firestore reads
+def test_fetch_profile_single_flight(factory_calls, monkeypatch):
+    app = main.create_app({"TESTING": True})
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    load_profile = main.load_profile
+
+    def slow_load(gamer_id):
+        calls.append(gamer_id)
+        started.set()
+        release.wait(5)
+        return load_profile(gamer_id)
+
+    monkeypatch.setattr(main, "load_profile", slow_load)
+    responses = []
+
+    def fetch():
+        responses.append(app.test_client().post("/api/fetch_profile", json={"gamerId": "me"}))
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["me"]
+    # No users document: every caller gets the shared "not found"
+    assert [response.status_code for response in responses] == [404] * 4
+    assert app.extensions["single_flight"].stats()["routes"]["fetch_profile"]["shared"] == 3
+
+
+# Test repeated fetch_friends calls read friends from the cache until a profile changes
+def test_fetch_friends_cache(factory_calls):
+    app = main.create_app({"TESTING": True, "FRIEND_CACHE_LISTENER": False})
+    client = app.test_client()
+    db = clients.firestore_client.get()._wrapped
+    # No copies in the gamer's document: every friend comes from the cache or a query
+    app.extensions["friend_fanout"].submit_repair = lambda doc_id: None
+
+    client.post("/api/fetch_friends", json={"gamerId": "me"})
+    db.reset_counts()
+    client.post("/api/fetch_friends", json={"gamerId": "me"})
+    assert db.counts["queries"] == 0 and db.counts["reads"] == 1
+
+    client.post("/api/update_profile", json={"gamerId": "f1", "field": "statusMessage", "value": "Playing pool"})
+    response = client.post("/api/fetch_friends", json={"gamerId": "me"})
+    assert response.get_json()[0]["statusMessage"] == "Playing pool"
+
+
+# Test fetch_friends is one document read once the friends' summaries are copied in
+def test_fetch_friends_denormalized(factory_calls):
+    app = main.create_app({"TESTING": True, "FRIEND_CACHE_LISTENER": False})
+    client = app.test_client()
+    fanout = app.extensions["friend_fanout"]
+    db = clients.firestore_client.get()._wrapped
+
+    client.post("/api/fetch_friends", json={"gamerId": "me"})
+    fanout.flush()
+    assert db.docs("gamers")["me"]["friend_summaries"] == {"FR001": {"fullName": "Friend", "profile": "02"}}
+
+    client.post("/api/update_profile_picture", json={"gamerId": "f1", "profile": "05"})
+    fanout.flush()
+    db.reset_counts()
+    response = client.post("/api/fetch_friends", json={"gamerId": "me"})
+    assert response.get_json() == [{"gamerId": "FR001", "fullName": "Friend", "profile": "05", "statusMessage": ""}]
+    assert db.counts == {"reads": 1, "writes": 0, "queries": 0, "commits": 0, "round_trips": 1}
+
+
+# Test a friend without a gamers document stops triggering repairs once its summary is stored
+def test_fetch_friends_dangling_friend(factory_calls):
+    app = main.create_app({"TESTING": True, "FRIEND_CACHE_LISTENER": False})
+    client = app.test_client()
+    db = clients.firestore_client.get()._wrapped
+    db.collection("gamers").document("me").update({"friends_list": ["FR001", "GONE"]})
+
+    client.post("/api/fetch_friends", json={"gamerId": "me"})
+    app.extensions["friend_fanout"].flush()
+    db.reset_counts()
+    response = client.post("/api/fetch_friends", json={"gamerId": "me"})
+    assert response.get_json()[1]["fullName"] == "Unknown User"
+    assert db.counts["round_trips"] == 1
+
+
+# Test filtered fetch_games calls are answered by the facet index
+def test_fetch_games_filters(factory_calls):
+    client = main.create_app({"TESTING": True}).test_client()
+    assert [game["id"] for game in client.get("/api/fetch_games?pub=p1&open=no").get_json()] == ["g1"]
+    assert client.get("/api/fetch_games?pub=p2,p3").get_json() == []
+    assert client.get("/api/fetch_games?daypart=brunch").status_code == 400
+
+
+# Test a game without an event_id is placed in the pub's event covering its time
+def test_create_game_placement(factory_calls):
+    client = main.create_app({"TESTING": True}).test_client()
+    db = clients.firestore_client.get()._wrapped
+    db.collection("events").document("e1").set({
+        "pub_id": "p1", "game_type": "Seat Based", "start_time": "2999-01-01T18:00:00.000Z",
+        "end_time": "2999-01-01T23:00:00.000Z",
+        "available_slots": {"18:00-19:00": 20, "19:00-20:00": 20, "20:00-21:00": 20}})
+    # The client's slots are ignored when the server picks the event
+    game = {"game_name": "Quiz", "pub_id": "p1", "host": "me", "location": "The Quays", "max_players": 4,
+            "game_code": "ABC", "updated_slots": {"19:00-20:00": 99}, "game_type": "Quiz",
+            "start_time": "2999-01-01T19:00:00.000Z", "end_time": "2999-01-01T20:00:00.000Z"}
+
+    response = client.post("/api/create_game", json=game)
+    assert response.status_code == 201
+    created = db.docs("games")[response.get_json()["gameId"]]
+    assert created["event_id"] == "e1" and "updated_slots" not in created
+    assert db.docs("events")["e1"]["available_slots"] == {"18:00-19:00": 20, "19:00-20:00": 16, "20:00-21:00": 20}
+    client.application.extensions["write_behind"].flush()
+    assert db.docs("gamers")["me"]["hosted_games"] == [response.get_json()["gameId"]]
+
+    response = client.post("/api/create_game", json={**game, "end_time": "2999-01-02T01:00:00.000Z"})
+    assert response.status_code == 404
+
+    response = client.post("/api/create_game", json={**game, "max_players": 17})
+    assert response.status_code == 400
+    assert db.docs("events")["e1"]["available_slots"]["19:00-20:00"] == 16
+
+    # With an event_id the app sends the event's new slots, and must send them
+    chosen = {**game, "event_id": "e1", "updated_slots": {"19:00-20:00": 12}}
+    assert client.post("/api/create_game", json=chosen).status_code == 201
+    assert db.docs("events")["e1"]["available_slots"] == {"19:00-20:00": 12}
+    del chosen["updated_slots"]
+    assert client.post("/api/create_game", json=chosen).status_code == 400
+
+
+# Test the first login is written at once and repeats go through the write-behind queue
+def test_store_gamer_id_write_behind(factory_calls):
+    app = main.create_app({"TESTING": True})
+    client = app.test_client()
+    db = clients.firestore_client.get()._wrapped
+    queue = app.extensions["write_behind"]
+    try:
+        for _ in range(3):
+            response = client.post("/api/store_gamer_id", json={"gamerId": "new", "email": "new@example.com"})
+            assert response.status_code == 200
+            # The document exists before the first login's response
+            assert db.docs("gamers")["new"] == {"gamerId": "new", "email": "new@example.com"}
+        assert queue.skipped == 2
+        assert queue.stats()["depth"] == 0
+
+        client.post("/api/store_gamer_id", json={"gamerId": "new", "email": "other@example.com"})
+        assert queue.stats()["depth"] == 1
+        queue.flush()
+        assert db.docs("gamers")["new"]["email"] == "other@example.com"
+    finally:
+        main.shutdown_app(app)
+
+
+# Test app times ("...Z" from toISOString) are stored as the strings sent and the game is indexed
+def test_create_game_keeps_iso_strings(factory_calls):
+    client = main.create_app({"TESTING": True}).test_client()
+    db = clients.firestore_client.get()._wrapped
+    db.collection("events").document("e1").set({"pub_id": "p1", "start_time": "2999-01-01T18:00:00.000Z",
+                                                 "end_time": "2999-01-01T23:00:00.000Z", "available_slots": {}})
+    game = {"game_name": "Quiz", "pub_id": "p1", "host": "me", "location": "The Quays", "max_players": 4,
+            "game_code": "ABC", "updated_slots": {}, "game_type": "Quiz", "event_id": "e1",
+            "start_time": "2999-01-01T19:00:00.000Z", "end_time": "2999-01-01T20:00:00.000Z",
+            "expires": "2999-01-01T21:00:00.000Z"}
+
+    response = client.post("/api/create_game", json=game)
+    assert response.status_code == 201
+    stored = db.docs("games")[response.get_json()["gameId"]]
+    assert stored["expires"] == "2999-01-01T21:00:00.000Z"
+    assert stored["start_time"] == "2999-01-01T19:00:00.000Z"
+
+
+# Test image variants of a source removed while rendering, or of a file that is not an image
+def test_serve_image_errors(factory_calls, tmp_path):
+    Image.new("RGB", (400, 200), (0, 0, 255)).save(tmp_path / "pub.png")
+    (tmp_path / "notes.png").write_bytes(b"not an image")
+    app = main.create_app({"TESTING": True, "UPLOAD_FOLDER": str(tmp_path)})
+    client = app.test_client()
+    assert client.get("/images/pub.png?size=thumb").status_code == 200
+
+    response = client.get("/images/notes.png?size=thumb")
+    assert response.status_code == 415 and "error" in response.get_json()
+
+    variants = app.extensions["image_variants"]
+    variant = variants.variant
+    variants.variant = lambda *args: os.remove(tmp_path / "pub.png") or variant(*args)
+    response = client.get("/images/pub.png?size=small")
+    assert response.status_code == 404 and response.get_json() == {"error": "Image not found"}
@@ -0,0 +1,86 @@
+import pytest
+import threading
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask, jsonify
+
+import metrics
+from metrics import MetricsRegistry
+
+
+def make_app():
+    app = Flask(__name__)
+    metrics.registry = MetricsRegistry()
+    metrics.init_app(app)
+
+    @app.route("/api/item/<item_id>")
+    def item(item_id):
+        if item_id == "missing":
+            return jsonify({"error": "not found"}), 404
+        return jsonify({"id": item_id})
+
+    return app
+
+
+# Test per-thread shards are merged when collected
+def test_registry_merges_threads():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(100):
+            registry.inc("hits", (("route", "/a"),))
+            registry.observe("latency", (), 0.05)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registry.observe("latency", (), 5.0)
+
+    counters, histograms = registry.collect()
+    assert counters["hits"][(("route", "/a"),)] == 400
+    bucket_counts, total = histograms["latency"][()]
+    assert bucket_counts == [400, 0, 1]
+    assert total == pytest.approx(25.0)
+
+
+# Test the Prometheus text output
+def test_render_histogram():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.describe("latency", "histogram", "Latency.")
+    registry.observe("latency", (("route", "/a"),), 0.5)
+
+    text = registry.render()
+    assert "# TYPE latency histogram" in text
+    assert 'latency_bucket{route="/a",le="0.1"} 0' in text
+    assert 'latency_bucket{route="/a",le="1"} 1' in text
+    assert 'latency_bucket{route="/a",le="+Inf"} 1' in text
+    assert 'latency_count{route="/a"} 1' in text
+
+
+# Test request middleware and the /metrics endpoint
+def test_request_metrics():
+    app = make_app()
+    client = app.test_client()
+    client.get("/api/item/1")
+    client.get("/api/item/2")
+    client.get("/api/item/missing")
+
+    response = client.get("/metrics")
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/api/item/<item_id>",status="200"} 2' in text
+    assert 'http_requests_total{method="GET",route="/api/item/<item_id>",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/item/<item_id>"} 3' in text
+    # only the scrape itself is in flight
+    assert "http_requests_in_flight 1" in text
+
+
+def test_collectors():
+    registry = MetricsRegistry()
+    registry.add_collector(lambda: [("queue_depth", (), 7)])
+    assert "queue_depth 7" in registry.render()
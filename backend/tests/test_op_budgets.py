@@ -0,0 +1,158 @@
+import json
+import math
+import pytest
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import clients
+import main
+from bootstrap import IN_QUERY_LIMIT
+from friend_summaries import SUMMARIES_FIELD
+from local_firestore import LocalFirestore
+
+# Checked-in Firestore operation budgets per route, for the fixture below. A route using
+# more than its budget fails; so does one using less, so that budgets stay tight. After
+# an intended change, regenerate them with UPDATE_OP_BUDGETS=1 python -m pytest tests/test_op_budgets.py
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), "op_budgets.json")
+COUNTED = ("reads", "writes", "queries", "commits", "round_trips", "deferred_writes")
+
+FRIENDS = 10
+GAMES = 20
+PUBS = 5
+
+
+def fixture_data(friends=FRIENDS, denormalized=True):
+    gamers = {f"f{i}": {"gamerId": f"F{i:03d}", "fullName": f"Friend {i}", "profile": "02", "friends_list": ["ME123"]}
+              for i in range(friends)}
+    me = {"gamerId": "ME123", "fullName": "Me", "email": "me@example.com",
+          "friends_list": [f"F{i:03d}" for i in range(friends)], "hosted_games": []}
+    if denormalized:
+        me[SUMMARIES_FIELD] = {f"F{i:03d}": {"fullName": f"Friend {i}", "profile": "02"} for i in range(friends)}
+    pubs = {f"p{i}": {"pub_name": f"Pub {i}", "xcoord": 53.3, "ycoord": -6.2, "events": [f"e{i}"]} for i in range(PUBS)}
+    events = {f"e{i}": {"pub_id": f"p{i}", "game_type": "Seat Based", "start_time": "2999-01-01T12:00:00.000Z",
+                        "end_time": "2999-01-01T23:00:00.000Z", "expires": "2999-01-02T00:00:00.000Z",
+                        "available_slots": {}}
+              for i in range(PUBS)}
+    games = {f"g{i}": {"game_name": f"Game {i}", "host": f"f{i % friends}", "pub_id": f"p{i % PUBS}",
+                       "game_type": "Pool", "max_players": 4, "participants": [], "xcoord": 53.3, "ycoord": -6.2,
+                       "start_time": "2999-01-01T19:00:00", "expires": "2999-01-01T20:00:00"}
+             for i in range(GAMES)}
+    return {
+        "users": {"me": {"email": "me@example.com", "isPublican": False}},
+        "gamers": {"me": me, **gamers},
+        "publicans": pubs,
+        "events": events,
+        "games": games,
+    }
+
+
+NEW_GAME = {"game_name": "Quiz", "pub_id": "p1", "host": "me", "location": "The Quays", "max_players": 4,
+            "game_code": "ABC", "updated_slots": {}, "game_type": "Quiz",
+            "start_time": "2999-01-01T19:00:00.000Z", "end_time": "2999-01-01T20:00:00.000Z"}
+NEW_EVENT = {"pub_id": "p2", "game_type": "Seat Based", "start_time": "2999-01-02T12:00:00.000Z",
+             "end_time": "2999-01-02T14:00:00.000Z", "expires": "2999-01-02T14:00:00.000Z"}
+
+# name -> (method, path, body)
+ROUTES = {
+    "fetch_games": ("GET", "/api/fetch_games", None),
+    "fetch_games_area": ("GET", "/api/fetch_games?area=533_-63", None),
+    "fetch_games_filtered": ("GET", "/api/fetch_games?type=Pool&open=1", None),
+    "fetch_pubs": ("GET", "/api/fetch_pubs", None),
+    "fetch_game": ("GET", "/api/fetch_game/g1", None),
+    "fetch_pub_summary": ("GET", "/api/fetch_pub_summary/p1", None),
+    "fetch_user_info": ("POST", "/api/fetch_user_info", {"gamerId": "me"}),
+    "fetch_friends": ("POST", "/api/fetch_friends", {"gamerId": "me"}),
+    "fetch_profile": ("POST", "/api/fetch_profile", {"gamerId": "me"}),
+    "update_profile": ("POST", "/api/update_profile", {"gamerId": "me", "field": "statusMessage", "value": "Hi"}),
+    "check_email_exists": ("POST", "/api/check_email_exists", {"email": "me@example.com"}),
+    "check_pub_name_exists": ("POST", "/api/check_pub_name_exists", {"pubName": "Pub 1"}),
+    "store_gamer_id": ("POST", "/api/store_gamer_id", {"gamerId": "me", "email": "me@example.com"}),
+    "create_game": ("POST", "/api/create_game", NEW_GAME),
+    "create_event": ("POST", "/api/create_event", NEW_EVENT),
+    "bootstrap": ("POST", "/api/bootstrap", {"gamerId": "me"}),
+    "recommend_games": ("POST", "/api/recommend_games", {"gamerId": "me", "xcoord": 53.3, "ycoord": -6.2}),
+    "search": ("GET", "/api/search?q=pub", None),
+    "game_facets": ("GET", "/api/game_facets?type=Pool", None),
+}
+
+
+@pytest.fixture
+def measure(tmp_path, monkeypatch):
+    """measure(name, data) runs one route on a fresh app over data and returns its op counts."""
+    monkeypatch.setattr(main.Config, "WRITE_BEHIND_PATH", str(tmp_path / "write-behind.sqlite3"))
+    apps = []
+
+    def run(name, data):
+        db = LocalFirestore(data)
+        clients.firestore_client.configure(lambda: db)
+        # No friend cache listener, so a fresh cache reads like the first request of a process,
+        # and no background flush, so the deferred writes are all counted here
+        app = main.create_app({"TESTING": True, "FRIEND_CACHE_LISTENER": False, "WRITE_BEHIND_FLUSH_SECONDS": 3600})
+        apps.append(app)
+        method, path, body = ROUTES[name]
+        before = dict(db.counts)
+        response = app.test_client().open(path, method=method, json=body)
+        assert response.status_code < 300, (name, response.get_json())
+        # Everything the request set off counts: the listeners it started (LocalFirestore
+        # delivers their snapshots before returning), the friend summary fan-out and the
+        # writes queued for after the response
+        app.extensions["friend_fanout"].flush()
+        deferred = app.extensions["write_behind"].flush()
+        counts = {kind: db.counts[kind] - before[kind] for kind in db.counts}
+        counts["deferred_writes"] = deferred
+        return counts
+
+    yield run
+    for app in apps:
+        main.shutdown_app(app)
+    clients.firestore_client.configure(clients.create_firestore)
+
+
+def load_budgets():
+    with open(BUDGETS_PATH) as budgets:
+        return json.load(budgets)
+
+
+# Test every route stays within (and exactly at) its checked-in Firestore budget
+def test_route_budgets(measure):
+    measured = {name: measure(name, fixture_data()) for name in ROUTES}
+    if os.environ.get("UPDATE_OP_BUDGETS") == "1":
+        with open(BUDGETS_PATH, "w") as budgets:
+            json.dump(measured, budgets, indent=2, sort_keys=True)
+            budgets.write("\n")
+
+    budgets = load_budgets()
+    assert sorted(budgets) == sorted(ROUTES), "Routes and op_budgets.json differ; regenerate the budgets"
+    over, under = [], []
+    for name, counts in measured.items():
+        for kind in COUNTED:
+            if counts[kind] > budgets[name][kind]:
+                over.append(f"{name}: {counts[kind]} {kind}, budget {budgets[name][kind]}")
+            elif counts[kind] < budgets[name][kind]:
+                under.append(f"{name}: {counts[kind]} {kind}, budget {budgets[name][kind]}")
+    assert not over, "Over Firestore budget:\n" + "\n".join(over)
+    assert not under, "Under Firestore budget, lower it in op_budgets.json:\n" + "\n".join(under)
+
+
+# Test fetch_friends makes the same round trips for 10 friends as for 200 (one read of the
+# gamer's own document, which holds their friends' summaries)
+def test_friend_scaling(measure):
+    small, large = measure("fetch_friends", fixture_data(10)), measure("fetch_friends", fixture_data(200))
+    assert large["round_trips"] == small["round_trips"] == 1
+    assert large["writes"] == small["writes"] == 0
+
+
+# Test routes that look friends up read them per IN_QUERY_LIMIT friends, never one by one
+# (a cold fetch_friends reads them twice: for the response, and to repair the summaries)
+@pytest.mark.parametrize("name, denormalized, passes", [
+    ("fetch_friends", False, 2),
+    ("bootstrap", True, 1),
+    ("recommend_games", True, 1),
+])
+def test_friend_scaling_by_chunk(measure, name, denormalized, passes):
+    small = measure(name, fixture_data(10, denormalized))
+    large = measure(name, fixture_data(200, denormalized))
+    extra_chunks = math.ceil(200 / IN_QUERY_LIMIT) - math.ceil(10 / IN_QUERY_LIMIT)
+    assert large["round_trips"] - small["round_trips"] == passes * extra_chunks
+    assert large["writes"] == small["writes"]
@@ -120,3 +120,19 @@ def test_pub_details():
     assert details["tables"] == 10
     assert details["events"] == []
     assert details["pub_image"] is None
+
+# Test overlapping events are rejected and events are deleted by start time
+def test_event_schedule():
+    publican = Publican("Pub A", "pub@example.com", "PUB001", "securepassword", "123 Street, Dublin", 53.349805, -6.26031, 10)
+    publican.create_event("Seat Based", "18:00", "21:00", "23:59", 20)
+    publican.create_event("Table Based", "12:00", "15:00", "23:59", 5, unit_capacity=4)
+
+    response = publican.create_event("Seat Based", "20:00", "22:00", "23:59", 20)
+    assert response["status"] == "error"
+    assert "overlaps" in response["message"]
+    assert publican.create_event("Seat Based", "21:00", "22:00", "23:59", 20)["status"] == "success"
+    assert [event["start_time"] for event in publican.events] == ["12:00", "18:00", "21:00"]
+
+    assert publican.delete_event("18:00", "Table Based")["status"] == "error"
+    assert publican.delete_event("18:00", "Seat Based")["status"] == "success"
+    assert [event["start_time"] for event in publican.events] == ["12:00", "21:00"]
@@ -0,0 +1,148 @@
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from local_firestore import LocalFirestore
+from read_models import ReadModelRefresher, area_key, parse_iso, read_area_games, read_pub_summary
+
+FUTURE = "2999-01-01T22:00:00"
+PAST = "2000-01-01T22:00:00"
+
+
+def make_game(pub_id="PUB1", expires=FUTURE, participants=None, max_players=4, **extra):
+    game = {
+        "game_name": "Quiz", "location": "Pub A", "xcoord": 53.34, "ycoord": -6.26,
+        "start_time": "20:00", "end_time": "22:00", "expires": expires,
+        "max_players": max_players, "participants": participants or [], "host": "H1",
+        "game_desc": "Trivia", "game_type": "Quiz", "pub_id": pub_id,
+        "updated_at": datetime(2025, 1, 1, tzinfo=timezone.utc),
+    }
+    game.update(extra)
+    return game
+
+
+# Test area keys
+def test_area_key():
+    assert area_key(53.34, -6.26) == area_key("53.31", "-6.21")
+    assert area_key(53.34, -6.26) != area_key(53.44, -6.26)
+    assert area_key(None, 1) is None
+
+
+# Test the first run builds every read model
+def test_initial_build():
+    db = LocalFirestore({"games": {
+        "g1": make_game(participants=["a"]),
+        "g2": make_game(pub_id="PUB2", max_players=6),
+        "g3": make_game(expires=PAST),
+    }})
+    stats = ReadModelRefresher(db).refresh()
+
+    assert stats["changed_games"] == 2
+    assert stats["changed_docs"] == 3  # one area, two pubs
+    area = area_key(53.34, -6.26)
+    games = read_area_games(db, area)
+    assert sorted(game["id"] for game in games) == ["g1", "g2"]
+    assert read_pub_summary(db, "PUB1") == {"pub_id": "PUB1", "upcoming_games": 1, "open_seats": 3}
+    assert read_pub_summary(db, "PUB2")["open_seats"] == 6
+
+
+# Test later runs only rewrite the documents of games the listener saw change
+def test_incremental_refresh():
+    db = LocalFirestore({"games": {"g1": make_game(), "g3": make_game(pub_id="PUB2")}})
+    refresher = ReadModelRefresher(db)
+    assert refresher.refresh()["rebuilt"] is True
+
+    later = datetime(2025, 1, 2, tzinfo=timezone.utc)
+    db.collection("games").document("g2").set(make_game(updated_at=later, participants=["a", "b"]))
+    stats = refresher.refresh()
+
+    assert stats["changed_games"] == 1
+    assert stats["changed_docs"] == 2  # the area and PUB1, not PUB2
+    assert read_pub_summary(db, "PUB1") == {"pub_id": "PUB1", "upcoming_games": 2, "open_seats": 6}
+
+
+# Test joins, leaves and deletes from the app (which never set updated_at) reach the read models
+def test_changes_without_updated_at():
+    db = LocalFirestore({"games": {"g1": make_game(), "g2": make_game(pub_id="PUB2")}})
+    refresher = ReadModelRefresher(db)
+    refresher.refresh()
+
+    db.collection("games").document("g1").update({"participants": ["a", "b"]})
+    db.collection("games").document("g2").delete()
+    stats = refresher.refresh()
+
+    assert stats["changed_games"] == 2
+    assert read_pub_summary(db, "PUB1")["open_seats"] == 2
+    assert read_pub_summary(db, "PUB2")["upcoming_games"] == 0
+    area = area_key(53.34, -6.26)
+    assert [game["participants"] for game in read_area_games(db, area)] == [["a", "b"]]
+
+
+# Test a listener restart rebuilds every document, dropping games deleted while it was down
+def test_rebuild_after_listener_restart():
+    db = LocalFirestore({"games": {"g1": make_game(), "g2": make_game(pub_id="PUB2")}})
+    refresher = ReadModelRefresher(db, retry_seconds=0)
+    refresher.refresh()
+
+    refresher.stop()
+    db.collection("games").document("g2").delete()
+    stats = refresher.refresh()
+
+    assert stats["rebuilt"] is True
+    assert read_pub_summary(db, "PUB2")["upcoming_games"] == 0
+    assert [game["id"] for game in read_area_games(db, area_key(53.34, -6.26))] == ["g1"]
+
+
+# Test runs read games changed since the watermark while the listener is down
+def test_watermark_while_listener_is_down():
+    db = LocalFirestore({"games": {"g1": make_game()}})
+    refresher = ReadModelRefresher(db)
+    refresher.refresh()
+    watermark = db.docs("read_models_meta")["refresher"]["games_watermark"]
+    assert watermark is not None
+
+    refresher.stop()
+    updated_at = datetime.now(timezone.utc)
+    db.collection("games").document("g2").set(make_game(updated_at=updated_at, participants=["a", "b"]))
+    stats = refresher.refresh()
+
+    assert stats["rebuilt"] is False
+    assert stats["changed_games"] == 1
+    assert read_pub_summary(db, "PUB1") == {"pub_id": "PUB1", "upcoming_games": 2, "open_seats": 6}
+    assert db.docs("read_models_meta")["refresher"]["games_watermark"] == updated_at
+
+
+# Test expired games drop out of the read models
+def test_expired_games_are_pruned(monkeypatch):
+    db = LocalFirestore({"games": {
+        "g1": make_game(expires="2025-06-01T21:00:00"),
+        "g2": make_game(expires="2025-06-01T23:00:00"),
+    }})
+    refresher = ReadModelRefresher(db)
+    monkeypatch.setattr("read_models.now_string", lambda: "2025-06-01T20:00:00")
+    refresher.refresh()
+
+    area = area_key(53.34, -6.26)
+    assert db.docs("active_games")[area]["next_expiry"] == "2025-06-01T21:00:00"
+
+    monkeypatch.setattr("read_models.now_string", lambda: "2025-06-01T21:30:00")
+    refresher.refresh()
+
+    assert [game["id"] for game in read_area_games(db, area)] == ["g2"]
+    assert db.docs("active_games")[area]["count"] == 1
+
+
+def test_missing_read_models():
+    db = LocalFirestore()
+    assert read_area_games(db, "1_2") == []
+    assert read_pub_summary(db, "NOPE")["upcoming_games"] == 0
+
+
+# Test app ("...Z") and backend (local) times both parse, on any supported Python
+def test_parse_iso():
+    assert parse_iso("2025-03-01T19:00:00.000Z") == datetime(2025, 3, 1, 19, tzinfo=timezone.utc)
+    assert parse_iso("2025-03-01T19:00:00") == datetime(2025, 3, 1, 19)
+    with pytest.raises(ValueError):
+        parse_iso("soon")
@@ -0,0 +1,137 @@
+import pytest
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from flask import Flask
+
+import recommend
+from local_firestore import LocalFirestore
+from recommend import DEFAULT_WEIGHTS, GameColumns, Recommender, score_games, top_rows
+from replica import GamesReplica
+
+LIVE = "2999-01-01T20:00:00"
+# Temple Bar, Dublin
+HERE = (53.345, -6.264)
+
+
+def hours_from_now(hours):
+    return (datetime.now() + timedelta(hours=hours)).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def game(game_id, **fields):
+    return {"id": game_id, "xcoord": HERE[0], "ycoord": HERE[1], "start_time": hours_from_now(2),
+            "expires": LIVE, "max_players": 4, "participants": ["h"], "host": "h", "game_type": "Pool", **fields}
+
+
+def only(signal):
+    return {name: 1.0 if name == signal else 0.0 for name in DEFAULT_WEIGHTS}
+
+
+def ranking(games, signal, **kwargs):
+    columns = GameColumns(games)
+    score, _ = score_games(columns, only(signal), time.time(), **kwargs)
+    return [columns.games[row]["id"] for row in top_rows(score, len(games))]
+
+
+# Test each signal on its own orders games the way it should
+def test_signals():
+    far = game("far", xcoord=53.6, ycoord=-6.2)
+    assert ranking([far, game("near"), game("nowhere", xcoord=None)], "distance", location=HERE) == ["near", "far", "nowhere"]
+    assert ranking([game("later", start_time=hours_from_now(30)), game("soon"), game("started", start_time=hours_from_now(-1))],
+                   "start") == ["started", "soon", "later"]
+    assert ranking([game("busy", participants=["h", "a", "b"]), game("empty")], "capacity") == ["empty", "busy"]
+    assert ranking([game("one", participants=["h", "f1"]), game("two", participants=["h", "f1", "f2"]), game("none")],
+                   "friends", friend_ids=["f1", "f2"]) == ["two", "one", "none"]
+    assert ranking([game("darts", game_type="Darts"), game("pool"), game("chess", game_type="Chess")],
+                   "history", type_counts={"Pool": 3, "Darts": 1}) == ["pool", "darts", "chess"]
+
+
+# Test full games and the user's own games are left out
+def test_exclusions():
+    games = [game("full", participants=["h", "a", "b", "c"]), game("hosting", host="me"),
+             game("playing", participants=["h", "me"]), game("open"), game("no_limit", max_players=None)]
+    assert ranking(games, "distance", location=HERE, exclude=["me"]) == ["open"]
+
+
+# Test the partial sort returns the same order as sorting every score
+def test_top_rows():
+    rng = np.random.default_rng(3)
+    score = rng.random(1000)
+    score[rng.integers(0, 1000, 50)] = -np.inf
+    expected = [row for row in np.argsort(-score, kind="stable") if np.isfinite(score[row])]
+    assert list(top_rows(score, 10)) == expected[:10]
+    assert list(top_rows(score, 5000)) == expected
+
+
+# Test unknown weight names are rejected
+def test_unknown_weight():
+    with pytest.raises(ValueError):
+        Recommender(LocalFirestore(), weights={"popularity": 1})
+
+
+# Test the endpoint resolves friends and past game types, with and without the replica
+@pytest.mark.parametrize("use_replica", [False, True])
+def test_recommend_endpoint(use_replica):
+    db = LocalFirestore({
+        "gamers": {
+            "me": {"gamerId": "ME01", "friends_list": ["FR01"], "joined_games": ["mine", "old"]},
+            "fdoc": {"gamerId": "FR01"},
+        },
+        "games": {
+            "mine": game("mine", participants=["h", "me"], game_type="Darts"),
+            "old": {**game("old", game_type="Darts"), "expires": "2000-01-01T00:00:00"},
+            "friends": game("friends", participants=["h", "fdoc"], xcoord=53.5),
+            "darts": game("darts", game_type="Darts", xcoord=53.5),
+            "other": game("other", xcoord=53.5),
+        },
+    })
+    replica = GamesReplica(db) if use_replica else None
+    app = Flask(__name__)
+    app.config["RECOMMEND_WEIGHTS"] = {"start": 0, "capacity": 0}
+    recommend.init_app(app, db, replica)
+    client = app.test_client()
+    if replica:
+        replica.ready()
+
+    response = client.post("/api/recommend_games", json={"gamerId": "me", "xcoord": HERE[0], "ycoord": HERE[1]})
+    assert response.status_code == 200
+    games = response.get_json()["games"]
+    # A type the user has joined twice outweighs one friend playing, which outweighs nothing
+    assert [g["id"] for g in games] == ["darts", "friends", "other"]
+    assert games[1]["friends_attending"] == 1 and games[1]["score"] > games[2]["score"]
+
+    assert client.post("/api/recommend_games", json={"gamerId": "me", "limit": 1}).get_json()["games"][0]["id"] == "darts"
+    assert client.post("/api/recommend_games", json={}).status_code == 400
+    assert client.post("/api/recommend_games", json={"gamerId": "me", "limit": 0}).status_code == 400
+    assert client.post("/api/recommend_games", json={"gamerId": "nobody"}).status_code == 404
+
+    def fail(gamer_id, location, limit):
+        raise RuntimeError("Firestore unavailable")
+    app.extensions["recommender"].recommend = fail
+    response = client.post("/api/recommend_games", json={"gamerId": "me"})
+    assert response.status_code == 500 and "Firestore unavailable" in response.get_json()["error"]
+    if replica:
+        replica.stop()
+
+
+# Test without the replica the games are read once per QUERY_CACHE_SECONDS, and again when one expires
+def test_columns_cached_without_replica(monkeypatch):
+    db = LocalFirestore({"games": {"a": game("a"), "b": game("b", expires="2999-01-01T19:00:00")}})
+    recommender = Recommender(db)
+    now = [1000.0]
+    monkeypatch.setattr(recommend.time, "monotonic", lambda: now[0])
+
+    first = recommender.columns()
+    db.collection("games").document("c").set(game("c"))
+    assert recommender.columns() is first and db.counts["queries"] == 1
+
+    now[0] += recommend.QUERY_CACHE_SECONDS
+    assert sorted(game["id"] for game in recommender.columns().games) == ["a", "b", "c"]
+    assert db.counts["queries"] == 2
+
+    monkeypatch.setattr(recommend, "now_string", lambda: "2999-01-01T19:30:00")
+    assert sorted(game["id"] for game in recommender.columns().games) == ["a", "c"]
@@ -0,0 +1,120 @@
+import pytest
+import json
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from local_firestore import LocalFirestore
+from replica import GamesReplica
+
+NOW = "2025-06-01T20:00:00"
+
+
+@pytest.fixture(autouse=True)
+def fixed_now(monkeypatch):
+    monkeypatch.setattr("replica.now_string", lambda: NOW)
+
+
+def make_replica(games=None):
+    db = LocalFirestore({"games": games or {}})
+    replica = GamesReplica(db)
+    replica.start()
+    return db, replica
+
+
+# Test the initial listener batch fills the replica
+def test_initial_snapshot():
+    db, replica = make_replica({
+        "g1": {"game_name": "Quiz", "expires": "2025-06-01T23:00:00"},
+        "old": {"game_name": "Darts", "expires": "2025-06-01T10:00:00"},
+    })
+
+    assert replica.ready()
+    snapshot = replica.snapshot()
+    assert [game["id"] for game in snapshot.games] == ["g1"]
+    assert json.loads(snapshot.body) == [dict(snapshot.games[0])]
+    assert replica.get("g1")["game_name"] == "Quiz"
+    assert replica.get("old") is None
+
+
+# Test each change batch publishes a new immutable snapshot
+def test_changes_publish_new_snapshot():
+    db, replica = make_replica({"g1": {"participants": [], "expires": "2025-06-01T23:00:00"}})
+    first = replica.snapshot()
+
+    db.collection("games").document("g1").update({"participants": ["p1"]})
+    db.collection("games").document("g2").set({"expires": "2025-06-01T22:00:00"})
+    second = replica.snapshot()
+
+    assert second.version > first.version
+    assert first.by_id["g1"]["participants"] == []
+    assert second.by_id["g1"]["participants"] == ["p1"]
+    assert second.next_expiry == "2025-06-01T22:00:00"
+    with pytest.raises(TypeError):
+        second.by_id["g3"] = {}
+
+    db.collection("games").document("g1").delete()
+    assert replica.get("g1") is None
+
+
+# Test games are dropped once they expire even without a change event
+def test_expired_games_dropped_on_read(monkeypatch):
+    db, replica = make_replica({
+        "g1": {"expires": "2025-06-01T21:00:00"},
+        "g2": {"expires": "2025-06-01T23:00:00"},
+    })
+    monkeypatch.setattr("replica.now_string", lambda: "2025-06-01T21:30:00")
+
+    assert [game["id"] for game in replica.snapshot().games] == ["g2"]
+
+
+# Test a dead listener reports not ready and is restarted
+def test_listener_restart():
+    db, replica = make_replica({"g1": {"expires": "2025-06-01T23:00:00"}})
+    replica.retry_seconds = 0
+    replica._watch.is_active = False
+
+    # Missed while the listener was down
+    db.collection("games").document("g1").delete()
+    db.collection("games").document("g2").set({"expires": "2025-06-01T23:00:00"})
+
+    assert replica.ready() is False
+    assert replica.restarts == 1
+    assert replica.ready() is True
+    assert [game["id"] for game in replica.snapshot().games] == ["g2"]
+
+
+# Test simultaneous first requests start one listener between them
+def test_concurrent_first_ready():
+    db = LocalFirestore({"games": {"g1": {"expires": "2025-06-01T23:00:00"}}})
+    replica = GamesReplica(db)
+    start = replica.start
+    # A slow start leaves time for every thread to find the listener not running yet
+    replica.start = lambda: time.sleep(0.05) or start()
+    barrier = threading.Barrier(8)
+
+    def first_request():
+        barrier.wait()
+        replica.ready()
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(db._watches) == 1
+    assert replica.ready() is True
+    replica.stop()
+
+
+def test_stats():
+    db, replica = make_replica({"g1": {"expires": "2025-06-01T23:00:00"}})
+    stats = replica.stats()
+
+    assert stats["ready"] is True
+    assert stats["games"] == 1
+    assert stats["snapshot_bytes"] == len(replica.snapshot().body)
+    assert stats["lag_ms"] is not None
@@ -0,0 +1,159 @@
+import pytest
+import sys
+import os
+import math
+import random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+
+import search
+from local_firestore import LocalFirestore
+from search import SearchIndex, tokenize
+
+LIVE = "2999-01-01T20:00:00"
+
+
+def game(name, **fields):
+    return {"game_name": name, "expires": LIVE, **fields}
+
+
+def brute_force(index, query, prefix=True):
+    """Score every document directly, for comparison with the threshold algorithm."""
+    tokens = list(dict.fromkeys(tokenize(query)))
+    count = len(index._docs)
+    scores = {}
+    for i, token in enumerate(tokens):
+        if prefix and i == len(tokens) - 1:
+            terms = [term for term in index._postings if term.startswith(token)]
+        else:
+            terms = [token] if token in index._postings else []
+        for key in index._docs:
+            best = 0.0
+            for term in terms:
+                df = len(index._postings[term])
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                best = max(best, index._postings[term].get(key, 0.0) * idf)
+            if best:
+                scores[key] = scores.get(key, 0.0) + best
+    return sorted((round(score, 4) for score in scores.values()), reverse=True)
+
+
+# Test words are lower-cased and accents removed
+def test_tokenize():
+    assert tokenize("Céilí Night: POOL & darts!") == ["ceili", "night", "pool", "darts"]
+    assert tokenize(None) == []
+
+
+# Test name matches outrank description matches, and the last word matches as a prefix
+def test_ranking_and_prefix():
+    index = SearchIndex()
+    index.add_many("game", [
+        ("g1", game("Pub Quiz", game_type="Quiz")),
+        ("g2", game("Poker Night", game_desc="quiz afterwards")),
+        ("g3", game("Darts", location="Temple Bar")),
+    ])
+    index.add("pub", "p1", {"pub_name": "The Quays", "address": "Temple Bar"})
+
+    assert [r["id"] for r in index.search("quiz")] == ["g1", "g2"]
+    assert [r["id"] for r in index.search("qui")] == ["g1", "g2"]
+    assert index.search("qui", prefix=False) == []
+    assert {r["id"] for r in index.search("temple")} == {"g3", "p1"}
+    assert [r["id"] for r in index.search("temple", kinds={"pub"})] == ["p1"]
+    assert index.search("") == [] and index.search("zzz") == []
+
+
+# Test the threshold algorithm returns the same top scores as scoring every document
+def test_matches_brute_force(monkeypatch):
+    rng = random.Random(7)
+    words = ["pool", "poker", "quiz", "night", "darts", "league", "table", "team", "temple", "tallaght"]
+    index = SearchIndex()
+    index.add_many("game", [(f"g{i}", game(" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))),
+                                           game_desc=" ".join(rng.choice(words) for _ in range(rng.randint(0, 6)))))
+                            for i in range(400)])
+    # Force the switch to scoring documents with every word early
+    monkeypatch.setattr(search, "THRESHOLD_ROUNDS", 3)
+    for query in ["pool", "poker night", "darts temple", "t", "quiz team ta", "league table pool"]:
+        expected = brute_force(index, query)[:10]
+        assert [r["score"] for r in index.search(query, limit=10)] == expected, query
+
+
+# Test documents are re-indexed and removed incrementally, and expired games dropped
+def test_incremental_updates():
+    index = SearchIndex()
+    index.add("game", "g1", game("Poker Night"))
+    index.add("game", "g1", game("Chess Club"))
+    assert index.search("poker") == []
+    assert [r["id"] for r in index.search("chess")] == ["g1"]
+
+    index.remove("game", "g1")
+    assert index.search("chess") == [] and index.stats() == {"documents": 0, "terms": 0}
+
+    index.add("game", "old", game("Chess", expires="2000-01-01T00:00:00"))
+    assert index.search("chess") == []
+    assert len(index) == 0
+
+
+# Test the endpoint searches data fed by the games and publicans listeners
+def test_search_endpoint():
+    db = LocalFirestore({
+        "games": {"g1": game("Pub Quiz"), "old": {"game_name": "Quiz", "expires": "2000-01-01T00:00:00"}},
+        "publicans": {"p1": {"pub_name": "Quiz Tavern"}},
+    })
+    app = Flask(__name__)
+    indexer = search.init_app(app, db)
+    client = app.test_client()
+
+    response = client.get("/api/search?q=quiz")
+    assert response.status_code == 200
+    assert [(r["type"], r["id"]) for r in response.get_json()["results"]] == [("pub", "p1"), ("game", "g1")]
+
+    db.collection("games").document("g2").set(game("Quiz Night"))
+    db.collection("publicans").document("p1").delete()
+    response = client.get("/api/search?q=quiz&type=games&limit=5")
+    assert {r["id"] for r in response.get_json()["results"]} == {"g1", "g2"}
+
+    assert client.get("/api/search").status_code == 400
+    assert client.get("/api/search?q=quiz&type=events").status_code == 400
+    indexer.stop()
+
+
+# Test restarted listeners rebuild the index, dropping documents deleted while they were down
+def test_restart_rebuilds():
+    db = LocalFirestore({
+        "games": {"g1": game("Pub Quiz"), "g2": game("Quiz Night")},
+        "publicans": {"p1": {"pub_name": "Quiz Tavern"}},
+    })
+    indexer = search.SearchIndexer(db, retry_seconds=0)
+    assert indexer.ready()
+
+    indexer.stop()
+    db.collection("games").document("g1").delete()
+    db.collection("publicans").document("p1").delete()
+    assert indexer.ready()
+    assert [(r["type"], r["id"]) for r in indexer.index.search("quiz")] == [("game", "g2")]
+    indexer.stop()
+
+
+# Test a search made while the listeners are loading ranks the documents whose name starts with the query
+def test_search_while_loading(monkeypatch):
+    db = LocalFirestore({
+        "games": {"g1": game("Quiz Night"), "g2": game("Pub Quiz"), "g3": game("quizzing"),
+                  "old": {"game_name": "Quiz", "expires": "2000-01-01T00:00:00"}},
+        "publicans": {"p1": {"pub_name": "Quiz Tavern"}, "p2": {"pub_name": "The Quays"}},
+    })
+    app = Flask(__name__)
+    indexer = search.init_app(app, db)
+    monkeypatch.setattr(indexer, "ready", lambda: False)
+    client = app.test_client()
+
+    response = client.get("/api/search?q=quiz")
+    assert response.status_code == 200
+    assert {(r["type"], r["id"]) for r in response.get_json()["results"]} == {("game", "g1"), ("game", "g3"), ("pub", "p1")}
+    response = client.get("/api/search?q=quiz n&type=games")
+    assert [r["id"] for r in response.get_json()["results"]] == ["g1"]
+
+    # Listening but not yet delivered: waits, then falls back
+    monkeypatch.setattr(indexer, "_listening", lambda: True)
+    monkeypatch.setattr(search, "LOAD_WAIT_SECONDS", 0.01)
+    assert client.get("/api/search?q=the&type=pubs").get_json()["results"][0]["id"] == "p2"
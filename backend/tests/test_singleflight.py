@@ -0,0 +1,114 @@
+import pytest
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from singleflight import FlightTimeout, SingleFlight, flight_key
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+# Test parameters are normalized: key order does not matter, values do
+def test_flight_key():
+    assert flight_key("fetch_games", {"a": 1, "b": 2}) == flight_key("fetch_games", {"b": 2, "a": 1})
+    assert flight_key("fetch_games", None) == flight_key("fetch_games", {})
+    assert flight_key("fetch_games", {"a": 1}) != flight_key("fetch_games", {"a": 2})
+    assert flight_key("fetch_games", {}) != flight_key("fetch_pubs", {})
+
+
+# Test concurrent identical calls share one backend call
+def test_concurrent_calls_coalesce():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["game"]
+
+    leader = threading.Thread(target=flights.do, args=("fetch_games", {}, slow))
+    leader.start()
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    results, errors = run_concurrently(8, lambda: flights.do("fetch_games", {}, slow))
+    leader.join()
+
+    assert calls == [1]
+    assert results == [["game"]] * 8 and errors == [None] * 8
+    stats = flights.stats()
+    assert stats["in_flight"] == 0
+    assert stats["routes"]["fetch_games"] == {"calls": 1, "shared": 8, "timeouts": 0, "coalescing_ratio": 0.8889}
+
+
+# Test different parameters and sequential calls are not shared
+def test_no_sharing_across_keys_or_time():
+    flights = SingleFlight()
+    calls = []
+    flights.do("fetch_profile", {"gamerId": "a"}, lambda: calls.append("a"))
+    flights.do("fetch_profile", {"gamerId": "b"}, lambda: calls.append("b"))
+    flights.do("fetch_profile", {"gamerId": "a"}, lambda: calls.append("a"))
+    assert calls == ["a", "b", "a"]
+
+
+# Test the leader's exception reaches every waiter
+def test_errors_are_shared():
+    flights = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("firestore down")
+
+    leader = threading.Thread(target=lambda: pytest.raises(RuntimeError, flights.do, "fetch_pubs", {}, fail))
+    leader.start()
+    started.wait(5)
+    _, errors = run_concurrently(3, lambda: flights.do("fetch_pubs", {}, fail))
+    leader.join()
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+# Test waiters time out, and a late call no longer absorbs new callers
+def test_timeout():
+    flights = SingleFlight(default_timeout=10, timeouts={"fetch_games": 0.05})
+    started = threading.Event()
+    release = threading.Event()
+
+    def stuck():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    leader = threading.Thread(target=flights.do, args=("fetch_games", {}, stuck))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(FlightTimeout):
+        flights.do("fetch_games", {}, stuck)
+
+    # Past the deadline, the next caller starts its own call
+    assert flights.do("fetch_games", {}, lambda: "fresh") == "fresh"
+    release.set()
+    leader.join()
+    assert flights.stats()["routes"]["fetch_games"]["timeouts"] == 1
+    assert ("single_flight_timeouts_total", (("name", "fetch_games"),), 1) in flights.metric_samples()
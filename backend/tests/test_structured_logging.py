@@ -0,0 +1,98 @@
+import pytest
+import io
+import json
+import logging
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import structured_logging
+from structured_logging import configure_logging, stop_logging, SamplingFilter
+
+
+@pytest.fixture
+def stream():
+    output = io.StringIO()
+    configure_logging("INFO", stream=output)
+    yield output
+    stop_logging()
+    logging.getLogger().handlers.clear()
+
+
+def lines(output):
+    stop_logging()
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+class Payload:
+    formatted = 0
+
+    def __str__(self):
+        Payload.formatted += 1
+        return "payload"
+
+
+# Test records are written as JSON lines by the background writer
+def test_json_lines(stream):
+    logger = logging.getLogger("niteout.test")
+    logger.info("Game %s created", "g1", extra={"game_id": "g1"})
+
+    entries = lines(stream)
+    assert entries[0]["msg"] == "Game g1 created"
+    assert entries[0]["level"] == "INFO"
+    assert entries[0]["game_id"] == "g1"
+
+
+# Test debug payloads are never formatted below the configured level
+def test_level_gating(stream):
+    Payload.formatted = 0
+    logging.getLogger("niteout.test").debug("Friend data: %s", Payload())
+
+    assert lines(stream) == []
+    assert Payload.formatted == 0
+
+
+# Test exceptions keep their traceback
+def test_exception(stream):
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logging.getLogger("niteout.test").exception("Failed")
+
+    entry = lines(stream)[0]
+    assert "ValueError: boom" in entry["exc"]
+
+
+# Test sampled records
+def test_sampling(monkeypatch):
+    sampler = SamplingFilter()
+    record = logging.LogRecord("x", logging.INFO, "", 0, "ops", (), None)
+    record.sample_rate = 0.1
+
+    monkeypatch.setattr(structured_logging.random, "random", lambda: 0.5)
+    assert sampler.filter(record) is False
+    monkeypatch.setattr(structured_logging.random, "random", lambda: 0.05)
+    assert sampler.filter(record) is True
+    assert sampler.dropped == 1
+
+
+# Test a forked child gets its own writer thread and does not repeat the parent's records
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_logging_after_fork(tmp_path):
+    path = tmp_path / "log.jsonl"
+    with open(path, "w") as output:
+        configure_logging("INFO", stream=output)
+        try:
+            logging.getLogger("niteout.test").info("before fork")
+            pid = os.fork()
+            if pid == 0:
+                logging.getLogger("niteout.test").info("in child")
+                stop_logging()
+                os._exit(0)
+            os.waitpid(pid, 0)
+            stop_logging()
+        finally:
+            logging.getLogger().handlers.clear()
+
+    messages = [json.loads(line)["msg"] for line in path.read_text().splitlines()]
+    assert sorted(messages) == ["before fork", "in child"]
@@ -0,0 +1,83 @@
+import pytest
+import gzip
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import metrics
+from local_firestore import LocalFirestore
+from sweeper import GameSweeper
+
+NOW = "2025-06-01T22:00:00"
+
+
+def seed(expired=3, live=1):
+    expiry_times = ["2025-06-01T20:00:00", "2025-06-01T21:00:00", "2025-05-31T10:00:00"]
+    games = {}
+    for i in range(expired):
+        games[f"old{i}"] = {"expires": expiry_times[i], "host": "h1", "participants": ["p1"]}
+    for i in range(live):
+        games[f"live{i}"] = {"expires": "2025-06-02T01:00:00", "host": "h1", "participants": ["p1"]}
+    all_ids = list(games)
+    gamers = {
+        "h1": {"hosted_games": all_ids, "joined_games": []},
+        "p1": {"hosted_games": [], "joined_games": all_ids},
+    }
+    return LocalFirestore({"games": games, "gamers": gamers})
+
+
+@pytest.fixture(autouse=True)
+def fixed_now(monkeypatch):
+    monkeypatch.setattr("sweeper.now_string", lambda: NOW)
+
+
+# Test expired games move to the archive collection in chunks
+def test_sweep_to_collection():
+    db = seed()
+    sweeper = GameSweeper(db, chunk_size=2)
+    assert sweeper.metric_samples() == []
+    swept_before = metrics.registry.collect()[0].get("game_sweeper_games_total", {}).get((), 0)
+    stats = sweeper.sweep()
+
+    assert stats["swept"] == 3
+    assert sorted(db.docs("games")) == ["live0"]
+    assert sorted(db.docs("games_archive")) == ["old0", "old1", "old2"]
+    assert db.docs("gamers")["h1"]["hosted_games"] == ["live0"]
+    assert db.docs("gamers")["p1"]["joined_games"] == ["live0"]
+    # oldest expired game expired at 2025-05-31T10:00:00
+    assert stats["lag_seconds"] == 36 * 3600
+    assert ("game_sweeper_lag_seconds", (), 36 * 3600) in sweeper.metric_samples()
+    assert metrics.registry.collect()[0]["game_sweeper_games_total"][()] == swept_before + 3
+
+
+# Test archiving to a local compressed file
+def test_sweep_to_file(tmp_path):
+    db = seed(expired=2)
+    path = tmp_path / "archive.jsonl.gz"
+    sweeper = GameSweeper(db, archive_path=str(path))
+    sweeper.sweep()
+    db.collection("games").document("late").set({"expires": "2025-06-01T21:30:00"})
+    sweeper.sweep()
+
+    with gzip.open(path, "rt") as archive:
+        archived = [json.loads(line)["id"] for line in archive]
+    assert sorted(archived) == ["late", "old0", "old1"]
+    assert "games_archive" not in db._collections
+    assert sweeper.total_swept == 3
+
+
+# Test players that no longer exist do not break the sweep
+def test_sweep_missing_gamer():
+    db = LocalFirestore({"games": {"g": {"expires": "2025-01-01T00:00:00", "host": "gone", "participants": []}}})
+    stats = GameSweeper(db).sweep()
+
+    assert stats["swept"] == 1
+    assert db.docs("games") == {}
+
+
+def test_sweep_nothing_expired():
+    db = seed(expired=0)
+    stats = GameSweeper(db).sweep()
+    assert stats["swept"] == 0
+    assert stats["lag_seconds"] == 0
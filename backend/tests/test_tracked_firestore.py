@@ -0,0 +1,55 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from local_firestore import LocalFirestore
+from tracked_firestore import TrackedClient
+
+
+def make_client(data=None):
+    calls = []
+    client = TrackedClient(LocalFirestore(data), [lambda call, seconds: calls.append(
+        (call.op, call.collection, call.shape, call.reads, call.writes))])
+    return client, calls
+
+
+# Test document operations are reported
+def test_document_calls():
+    client, calls = make_client({"gamers": {"g1": {"fullName": "Alice"}}})
+    ref = client.collection("gamers").document("g1")
+    assert ref.get().to_dict() == {"fullName": "Alice"}
+    ref.update({"profile": "02"})
+
+    assert calls == [
+        ("get", "gamers", "gamers.get", 1, 0),
+        ("update", "gamers", "gamers.update", 0, 1),
+    ]
+    assert ref.id == "g1"
+
+
+# Test query shapes leave out the values
+def test_query_shape():
+    client, calls = make_client({"gamers": {"a": {"gamerId": "X"}, "b": {"gamerId": "Y"}}})
+    for gamer_id in ("X", "Y"):
+        docs = list(client.collection("gamers").where("gamerId", "==", gamer_id).limit(1).stream())
+        assert len(docs) == 1
+
+    assert calls[0] == ("query", "gamers", "gamers.where(gamerId ==).limit", 1, 0)
+    assert calls[0] == calls[1]
+
+
+# Test batches and get_all accept wrapped references
+def test_batch_and_get_all():
+    client, calls = make_client({"gamers": {"a": {}, "b": {}}})
+    batch = client.batch()
+    batch.update(client.collection("gamers").document("a"), {"x": 1})
+    batch.delete(client.collection("gamers").document("b"))
+    batch.commit()
+    docs = client.get_all([client.collection("gamers").document("a")])
+
+    assert docs[0].to_dict() == {"x": 1}
+    assert calls == [
+        ("commit", "batch", "batch.commit", 0, 2),
+        ("get_all", "gamers", "gamers.get_all", 1, 0),
+    ]
@@ -0,0 +1,123 @@
+import pytest
+import io
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import uploads
+from local_firestore import LocalFirestore
+from uploads import UploadJobs, process_image
+
+
+def png_upload(size=(800, 400)):
+    data = io.BytesIO()
+    Image.new("RGB", size, (10, 200, 10)).save(data, "PNG")
+    data.seek(0)
+    return FileStorage(stream=data, filename="pub.png")
+
+
+def wait_for(jobs, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.status(job_id)
+        if job["status"] != "processing":
+            return job
+        time.sleep(0.05)
+    raise AssertionError("upload job did not finish")
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = UploadJobs(max_processes=1, io_threads=1, temp_dir=str(tmp_path))
+    yield jobs
+    jobs.shutdown()
+
+
+def test_process_image(tmp_path):
+    path = tmp_path / "upload"
+    png_upload().save(str(path))
+
+    info = process_image(str(path), thumbnail_width=100)
+    assert info["format"] == "png"
+    assert info["extension"] == ".png"
+    assert (info["width"], info["height"]) == (800, 400)
+    with Image.open(info["thumbnail_path"]) as thumbnail:
+        assert thumbnail.format == "WEBP"
+        assert thumbnail.size == (100, 50)
+
+
+# Test a job stores the image and thumbnail and reports the result
+def test_upload_job(jobs, tmp_path):
+    stored = {}
+    completed = []
+
+    def store(local_path, name, kind):
+        with open(local_path, "rb") as source:
+            stored[kind] = (name, source.read())
+        return f"/images/{name}"
+
+    job_id = jobs.submit(png_upload(), "pub_1", store, completed.append)
+    job = wait_for(jobs, job_id)
+
+    assert job["status"] == "done"
+    assert job["result"]["url"] == "/images/pub_1.png"
+    assert job["result"]["thumbnail_url"] == "/images/pub_1_thumb.webp"
+    assert completed == [job["result"]]
+    assert stored["image"][1].startswith(b"\x89PNG")
+    assert stored["thumbnail"][1][8:12] == b"WEBP"
+    # Spooled upload and thumbnail are cleaned up
+    assert os.listdir(tmp_path) == []
+
+
+# Test an upload that is not an image fails the job without storing anything
+def test_invalid_upload(jobs, tmp_path):
+    stored = []
+    upload = FileStorage(stream=io.BytesIO(b"not an image"), filename="pub.png")
+
+    job = wait_for(jobs, jobs.submit(upload, "pub_2", lambda *args: stored.append(args)))
+
+    assert job["status"] == "failed"
+    assert job["error"]
+    assert stored == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_unknown_job(jobs):
+    assert jobs.status("missing") is None
+
+
+# Test a job's status is found by another worker through its upload_jobs document, until it expires
+def test_shared_status(tmp_path, monkeypatch):
+    db = LocalFirestore()
+    uploading = UploadJobs(db, max_processes=1, io_threads=1, temp_dir=str(tmp_path))
+    polled = UploadJobs(db, max_processes=1, io_threads=1, temp_dir=str(tmp_path))
+    try:
+        job_id = uploading.submit(png_upload(), "pub_3", lambda local_path, name, kind: f"/images/{name}")
+        job = wait_for(polled, job_id)
+        assert job["status"] == "done"
+        assert job == uploading.status(job_id)
+        assert polled.status("missing") is None
+
+        monkeypatch.setattr(uploads, "JOB_RETENTION_SECONDS", -1)
+        uploading._update(job_id, status="done")
+        assert polled.status(job_id) is None
+    finally:
+        uploading.shutdown()
+        polled.shutdown()
+
+
+# Test the default pool splits the host's cores between its web workers
+def test_default_processes(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert uploads.default_processes() == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "17")
+    assert uploads.default_processes() == 1
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    jobs = UploadJobs()
+    assert jobs.max_processes == 8
+    jobs.shutdown()
@@ -0,0 +1,163 @@
+import pytest
+import sys
+import os
+from datetime import datetime, timezone
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from firebase_admin import firestore
+from google.api_core.exceptions import ServiceUnavailable
+from google.cloud.firestore_v1 import GeoPoint
+
+import write_behind
+from json_provider import dumps_bytes, loads_bytes
+from local_firestore import LocalFirestore
+from write_behind import WriteBehindQueue, decode, encode
+
+
+@pytest.fixture
+def db():
+    return LocalFirestore({"gamers": {"g1": {"gamerId": "G1", "hosted_games": ["a"], "wins": 1}}})
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "queue.sqlite3")
+
+
+# Test Firestore transforms survive the round trip through the queue's JSON form
+def test_encode_round_trip():
+    data = {"hosted_games": firestore.ArrayUnion(["b"]), "wins": firestore.Increment(2),
+            "seen": firestore.SERVER_TIMESTAMP, "old": firestore.DELETE_FIELD, "plain": {"a": [1, 2]},
+            "at": datetime(2025, 3, 1, 18, 30, tzinfo=timezone.utc), "local": datetime(2025, 3, 1, 18, 30),
+            "where": GeoPoint(53.3, -6.2), "iso": "2025-03-01T18:30:00.000Z"}
+    decoded = decode(loads_bytes(dumps_bytes(encode(data))))
+    assert decoded["hosted_games"].values == ["b"]
+    assert decoded["wins"].value == 2
+    assert decoded["seen"] is firestore.SERVER_TIMESTAMP
+    assert decoded["old"] is firestore.DELETE_FIELD
+    assert decoded["plain"] == {"a": [1, 2]}
+    assert decoded["at"] == data["at"] and decoded["local"] == data["local"]
+    assert decoded["where"] == data["where"]
+    assert decoded["iso"] == "2025-03-01T18:30:00.000Z"
+
+
+# Test repeated writes to a document are folded into one queued write
+def test_coalescing(db, path):
+    queue = WriteBehindQueue(db, path)
+    queue.update("gamers", "g1", {"hosted_games": firestore.ArrayUnion(["b"])})
+    queue.update("gamers", "g1", {"hosted_games": firestore.ArrayUnion(["c", "b"]), "wins": firestore.Increment(1)})
+    queue.update("gamers", "g1", {"wins": firestore.Increment(2)})
+    queue.set("gamers", "g2", {"email": "old@example.com", "prefs": {"a": 1}})
+    queue.set("gamers", "g2", {"email": "new@example.com", "prefs": {"b": 2}})
+    assert queue.stats()["depth"] == 2
+    assert queue.coalesced == 3
+
+    assert queue.flush() == 2
+    assert db.docs("gamers")["g1"]["hosted_games"] == ["a", "b", "c"]
+    assert db.docs("gamers")["g1"]["wins"] == 4
+    assert db.docs("gamers")["g2"] == {"email": "new@example.com", "prefs": {"a": 1, "b": 2}}
+    queue.shutdown()
+
+
+# Test writes that cannot be folded stay separate and are committed in order
+def test_conflicting_writes_keep_order(db, path):
+    queue = WriteBehindQueue(db, path)
+    queue.update("gamers", "g1", {"hosted_games": firestore.ArrayUnion(["b"])})
+    queue.update("gamers", "g1", {"hosted_games": firestore.ArrayRemove(["a"])})
+    queue.update("gamers", "g1", {"prefs": {"x": 1}})
+    queue.update("gamers", "g1", {"prefs.y": 2})
+    assert queue.stats()["depth"] == 3
+
+    # One write per document per batch, so the second waits for the first
+    assert queue.flush_once() == 1
+    assert db.docs("gamers")["g1"]["hosted_games"] == ["a", "b"]
+    assert queue.flush() == 2
+    assert db.docs("gamers")["g1"]["hosted_games"] == ["b"]
+    assert db.docs("gamers")["g1"]["prefs"] == {"x": 1, "y": 2}
+    queue.shutdown()
+
+
+# Test queued writes survive a restart of the process
+def test_durable(db, path):
+    WriteBehindQueue(db, path).update("gamers", "g1", {"wins": 5})
+    queue = WriteBehindQueue(db, path)
+    assert queue.stats()["depth"] == 1
+    queue.flush()
+    assert db.docs("gamers")["g1"]["wins"] == 5
+    queue.shutdown()
+
+
+# Test a failing write is retried with backoff, does not block the batch, and ends in dead_letters
+def test_retry_and_dead_letters(db, path, monkeypatch):
+    monkeypatch.setattr(write_behind, "MAX_ATTEMPTS", 2)
+    queue = WriteBehindQueue(db, path)
+    queue.update("gamers", "missing", {"wins": 1})
+    queue.update("gamers", "g1", {"wins": 2})
+
+    assert queue.flush() == 1
+    assert db.docs("gamers")["g1"]["wins"] == 2
+    stats = queue.stats()
+    assert stats["depth"] == 1 and stats["dead_letters"] == 0
+    # Not due again until its backoff has passed
+    assert queue.flush() == 0
+
+    monkeypatch.setattr(write_behind, "BACKOFF_SECONDS", 0)
+    queue._connection().execute("UPDATE pending SET next_attempt = 0")
+    assert queue.flush() == 0
+    stats = queue.stats()
+    assert stats["depth"] == 0 and stats["dead_letters"] == 1
+    queue.shutdown()
+
+
+# Test a transient error backs off the whole batch instead of retrying its writes one by one
+def test_transient_error_backs_off_batch(db, path, monkeypatch):
+    queue = WriteBehindQueue(db, path)
+    queue.update("gamers", "g1", {"wins": 2})
+    queue.set("gamers", "g2", {"wins": 3})
+    commits = []
+
+    def unavailable(rows):
+        commits.append(len(rows))
+        raise ServiceUnavailable("try again")
+
+    monkeypatch.setattr(queue, "_commit", unavailable)
+    assert queue.flush() == 0
+    assert commits == [2]
+    rows = queue._connection().execute("SELECT attempts, next_attempt FROM pending").fetchall()
+    assert [attempts for attempts, _ in rows] == [1, 1] and rows[0][1] == rows[1][1]
+
+    monkeypatch.undo()
+    queue._connection().execute("UPDATE pending SET next_attempt = 0")
+    assert queue.flush() == 2
+    assert db.docs("gamers")["g2"] == {"wins": 3}
+    queue.shutdown()
+
+# Test skip_recent_duplicate drops a set identical to the last one queued or remembered
+def test_skip_recent_duplicate(db, path):
+    queue = WriteBehindQueue(db, path)
+    assert not queue.recently_set("gamers", "g1")
+    assert queue.set("gamers", "g1", {"email": "a@example.com"}, skip_recent_duplicate=True)
+    assert queue.recently_set("gamers", "g1")
+    assert not queue.set("gamers", "g1", {"email": "a@example.com"}, skip_recent_duplicate=True)
+    assert queue.set("gamers", "g1", {"email": "b@example.com"}, skip_recent_duplicate=True)
+    queue.remember("gamers", "g2", {"email": "c@example.com"})
+    assert not queue.set("gamers", "g2", {"email": "c@example.com"}, skip_recent_duplicate=True)
+    with pytest.raises(ValueError):
+        queue.set("gamers", "g1", {"email": "c@example.com"}, merge=False)
+    queue.shutdown()
+    assert db.docs("gamers")["g1"]["email"] == "b@example.com"
+    assert "g2" not in db.docs("gamers")
+
+
+# Test the background thread commits queued writes on its own
+def test_background_flush(db, path):
+    queue = WriteBehindQueue(db, path, flush_interval=0.01)
+    queue.start()
+    queue.update("gamers", "g1", {"wins": 9})
+    for _ in range(200):
+        if not queue.stats()["depth"]:
+            break
+        queue._stopping.wait(0.01)
+    assert db.docs("gamers")["g1"]["wins"] == 9
+    assert ("write_behind_queue_depth", (), 0) in queue.metric_samples()
+    queue.shutdown(flush=False)
@@ -0,0 +1,187 @@
+import time
+
+
+def _unwrap(ref):
+    return getattr(ref, "_wrapped", ref)
+
+
+class _Tracked:
+    """Base for the wrappers: forwards any attribute it does not override."""
+
+    def __init__(self, client, wrapped):
+        self._client = client
+        self._wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+class TrackedDocument(_Tracked):
+    def __init__(self, client, wrapped, collection):
+        super().__init__(client, wrapped)
+        self._collection = collection
+
+    def get(self, *args, **kwargs):
+        if "transaction" in kwargs:
+            kwargs["transaction"] = _unwrap(kwargs["transaction"])
+        with self._client._call("get", self._collection, f"{self._collection}.get", reads=1):
+            return self._wrapped.get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        with self._client._call("set", self._collection, f"{self._collection}.set", writes=1):
+            return self._wrapped.set(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        with self._client._call("update", self._collection, f"{self._collection}.update", writes=1):
+            return self._wrapped.update(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with self._client._call("delete", self._collection, f"{self._collection}.delete", writes=1):
+            return self._wrapped.delete(*args, **kwargs)
+
+    def collection(self, name):
+        return TrackedQuery(self._client, self._wrapped.collection(name), f"{self._collection}/{name}", name)
+
+
+class TrackedQuery(_Tracked):
+    """Wraps a collection or query; the shape records fields and operators but not values."""
+
+    def __init__(self, client, wrapped, collection, shape):
+        super().__init__(client, wrapped)
+        self._collection = collection
+        self._shape = shape
+
+    def _chain(self, wrapped, step):
+        return TrackedQuery(self._client, wrapped, self._collection, f"{self._shape}.{step}")
+
+    def where(self, field_path=None, op_string=None, value=None, **kwargs):
+        if "filter" in kwargs:
+            step = f"where({type(kwargs['filter']).__name__})"
+            return self._chain(self._wrapped.where(**kwargs), step)
+        return self._chain(self._wrapped.where(field_path, op_string, value), f"where({field_path} {op_string})")
+
+    def order_by(self, field_path, *args, **kwargs):
+        return self._chain(self._wrapped.order_by(field_path, *args, **kwargs), f"order_by({field_path})")
+
+    def limit(self, count):
+        return self._chain(self._wrapped.limit(count), "limit")
+
+    def select(self, field_paths):
+        return self._chain(self._wrapped.select(field_paths), "select")
+
+    def start_after(self, *args, **kwargs):
+        return self._chain(self._wrapped.start_after(*args, **kwargs), "start_after")
+
+    def document(self, *args, **kwargs):
+        return TrackedDocument(self._client, self._wrapped.document(*args, **kwargs), self._collection)
+
+    def add(self, *args, **kwargs):
+        with self._client._call("add", self._collection, f"{self._collection}.add", writes=1):
+            return self._wrapped.add(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        call = self._client._call("query", self._collection, self._shape)
+        with call:
+            for doc in self._wrapped.stream(*args, **kwargs):
+                call.reads += 1
+                yield doc
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+
+class TrackedBatch(_Tracked):
+    def __init__(self, client, wrapped):
+        super().__init__(client, wrapped)
+        self._writes = 0
+
+    def set(self, ref, *args, **kwargs):
+        self._writes += 1
+        return self._wrapped.set(_unwrap(ref), *args, **kwargs)
+
+    def update(self, ref, *args, **kwargs):
+        self._writes += 1
+        return self._wrapped.update(_unwrap(ref), *args, **kwargs)
+
+    def delete(self, ref, *args, **kwargs):
+        self._writes += 1
+        return self._wrapped.delete(_unwrap(ref), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        with self._client._call("commit", "batch", "batch.commit", writes=self._writes):
+            return self._wrapped.commit(*args, **kwargs)
+
+
+class TrackedTransaction(TrackedBatch):
+    """
+    Used with firestore.transactional, which drives the private _begin/_commit/_rollback
+    hooks (passed through to the real transaction); the commit is reported like a batch's.
+    """
+
+    def _clean_up(self):
+        # Called before every attempt, so a retried transaction's writes are counted once
+        self._writes = 0
+        return self._wrapped._clean_up()
+
+    def _commit(self):
+        with self._client._call("commit", "transaction", "transaction.commit", writes=self._writes):
+            return self._wrapped._commit()
+
+
+class _Call:
+    def __init__(self, client, op, collection, shape, reads, writes):
+        self.client = client
+        self.op = op
+        self.collection = collection
+        self.shape = shape
+        self.reads = reads
+        self.writes = writes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        for listener in self.client.listeners:
+            listener(self, seconds)
+        return False
+
+
+class TrackedClient(_Tracked):
+    """
+    Summary:
+        Wrapper around the Firestore client that reports every round trip (document
+        get/set/update/delete, query stream, batch commit, get_all) to its listeners as
+        listener(call, seconds). `call` carries the op, collection, query shape and the
+        number of documents read or written.
+
+        Anything not wrapped (transforms, listeners) is passed through.
+    """
+
+    def __init__(self, wrapped, listeners=()):
+        super().__init__(self, wrapped)
+        self.listeners = list(listeners)
+
+    def _call(self, op, collection, shape, reads=0, writes=0):
+        return _Call(self, op, collection, shape, reads, writes)
+
+    def collection(self, name):
+        return TrackedQuery(self, self._wrapped.collection(name), name, name)
+
+    def batch(self):
+        return TrackedBatch(self, self._wrapped.batch())
+
+    def transaction(self, *args, **kwargs):
+        return TrackedTransaction(self, self._wrapped.transaction(*args, **kwargs))
+
+    def get_all(self, refs, *args, **kwargs):
+        refs = [_unwrap(ref) for ref in refs]
+        if "transaction" in kwargs:
+            kwargs["transaction"] = _unwrap(kwargs["transaction"])
+        collection = refs[0].parent.id if refs and hasattr(refs[0], "parent") else "mixed"
+        call = self._call("get_all", collection, f"{collection}.get_all")
+        with call:
+            docs = list(self._wrapped.get_all(refs, *args, **kwargs))
+            call.reads = len(docs)
+        return docs
@@ -0,0 +1,199 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image, ImageOps
+
+ALLOWED_FORMATS = {"PNG": ".png", "JPEG": ".jpg"}
+THUMBNAIL_WIDTH = 320
+
+# Finished jobs are kept this long so clients can still poll their status
+JOB_RETENTION_SECONDS = 3600
+# Job status documents, so a poll answered by another worker or host finds the job. Their
+# "expires" field is meant for a Firestore TTL policy; until it deletes them they are ignored
+JOBS_COLLECTION = "upload_jobs"
+
+logger = logging.getLogger(__name__)
+
+
+def process_image(source_path, thumbnail_width=THUMBNAIL_WIDTH):
+    """
+    Summary:
+        Validates an uploaded image and writes a WebP thumbnail next to it. Runs in a
+        worker process, so it only takes and returns plain, picklable values.
+
+    Returns:
+        dict: format, extension, width and height of the image and the thumbnail path
+    """
+    with Image.open(source_path) as image:
+        image.verify()
+
+    with Image.open(source_path) as image:
+        if image.format not in ALLOWED_FORMATS:
+            raise ValueError(f"Unsupported image format: {image.format}")
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((thumbnail_width, thumbnail_width * 4))
+        if thumbnail.mode not in ("RGB", "RGBA"):
+            thumbnail = thumbnail.convert("RGBA")
+        thumbnail_path = f"{source_path}.thumb.webp"
+        thumbnail.save(thumbnail_path, "WEBP", quality=80)
+
+    return {
+        "format": image_format.lower(),
+        "extension": ALLOWED_FORMATS[image_format],
+        "width": width,
+        "height": height,
+        "thumbnail_path": thumbnail_path,
+    }
+
+
+def default_processes():
+    """This worker's share of the host's cores, as every web worker on the host (WEB_CONCURRENCY) has its own pool."""
+    workers = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+class UploadJobs:
+    """
+    Summary:
+        Background ingestion for uploaded images. The request thread only streams the
+        upload to a temp file and gets a job ID back; validation and thumbnailing run on a
+        process pool (the host's cores shared between its web workers) and storing the results runs on a small thread
+        pool, so request workers are never blocked by image work or storage uploads.
+
+        Job status is kept in memory and, with a db, mirrored to an upload_jobs document,
+        since the poll may reach a different worker than the upload.
+
+    Args:
+        db: Firestore client for the shared job status, or None to keep it in this process
+        max_processes: process pool size (defaults to default_processes())
+        io_threads: threads used for storage uploads and completion callbacks
+        temp_dir: where uploads are spooled before processing
+    """
+
+    def __init__(self, db=None, max_processes=None, io_threads=4, temp_dir=None):
+        self.db = db
+        self.max_processes = max_processes or default_processes()
+        self.temp_dir = temp_dir or tempfile.gettempdir()
+        self._io = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="upload-io")
+        self._processes = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created on first use so importing the app never starts worker processes. They are
+        # spawned, not forked: a fork of a web worker would copy its threads' locks (and the
+        # Firestore client's gRPC state) mid-use
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_processes,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+            return self._processes
+
+    def submit(self, file_storage, name, store, on_complete=None):
+        """
+        Summary:
+            Spool `file_storage` (a werkzeug FileStorage) to disk and queue it
+
+        Args:
+            name: file name to store the image under (the thumbnail gets a _thumb suffix)
+            store: store(local_path, name, kind) -> URL or path, kind is "image" or "thumbnail"
+            on_complete: called with the job result once both files are stored
+
+        Returns:
+            String: the job ID to poll with status()
+        """
+        job_id = uuid.uuid4().hex
+        fd, temp_path = tempfile.mkstemp(prefix="upload-", dir=self.temp_dir)
+        with os.fdopen(fd, "wb") as temp_file:
+            file_storage.save(temp_file)
+
+        job = {"id": job_id, "status": "processing", "created": time.time()}
+        with self._lock:
+            self._purge_finished()
+            self._jobs[job_id] = job
+        self._record(dict(job))
+
+        future = self._pool().submit(process_image, temp_path)
+        future.add_done_callback(
+            lambda done: self._io.submit(self._finish, job_id, temp_path, name, store, on_complete, done))
+        return job_id
+
+    def _finish(self, job_id, temp_path, name, store, on_complete, future):
+        info = None
+        try:
+            info = future.result()
+            stem = os.path.splitext(name)[0]
+            result = {
+                "url": store(temp_path, f"{stem}{info['extension']}", "image"),
+                "thumbnail_url": store(info["thumbnail_path"], f"{stem}_thumb.webp", "thumbnail"),
+                "width": info["width"],
+                "height": info["height"],
+            }
+            if on_complete:
+                on_complete(result)
+            self._update(job_id, status="done", result=result)
+        except Exception as e:
+            logger.exception("Upload job %s failed", job_id)
+            self._update(job_id, status="failed", error=str(e))
+        finally:
+            for path in (temp_path, info and info["thumbnail_path"]):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, finished=time.time())
+            job = dict(job)
+        self._record(job)
+
+    def _record(self, job):
+        if self.db is None:
+            return
+        expires = datetime.now(timezone.utc) + timedelta(seconds=JOB_RETENTION_SECONDS)
+        try:
+            self.db.collection(JOBS_COLLECTION).document(job["id"]).set({**job, "expires": expires})
+        except Exception:
+            # The job still runs, and this process can still answer for it
+            logger.exception("Error recording upload job %s", job["id"])
+
+    def _purge_finished(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j for j, job in self._jobs.items() if job.get("finished", time.time()) < cutoff]:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        if self.db is None:
+            return None
+        # Submitted through another worker
+        doc = self.db.collection(JOBS_COLLECTION).document(job_id).get()
+        if not doc.exists:
+            return None
+        job = doc.to_dict()
+        expires = job.pop("expires", None)
+        if expires is not None and expires <= datetime.now(timezone.utc):
+            return None
+        return job
+
+    def shutdown(self, wait=True):
+        # Processes first: their completion callbacks still hand work to the I/O threads
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait)
+        self._io.shutdown(wait=wait)
@@ -0,0 +1,513 @@
+import hashlib
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from firebase_admin import firestore
+from google.api_core import exceptions as api_exceptions
+from google.cloud.firestore_v1 import GeoPoint
+from google.cloud.firestore_v1.transforms import ArrayRemove, ArrayUnion, Increment
+
+import metrics
+from json_provider import dumps_bytes, loads_bytes, revive
+
+# Firestore allows at most 500 operations per batch
+BATCH_LIMIT = 500
+# A write that has failed this many times is moved to the dead_letters table
+MAX_ATTEMPTS = 8
+# Retry delays double from BACKOFF_SECONDS up to MAX_BACKOFF_SECONDS
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 300.0
+# Errors after which a whole batch is retried later, since every write in it would have
+# failed the same way; any other error may come from one bad write (InvalidArgument,
+# NotFound), so the batch is split to find it
+TRANSIENT_ERRORS = (api_exceptions.ServiceUnavailable, api_exceptions.DeadlineExceeded,
+                    api_exceptions.InternalServerError, api_exceptions.ResourceExhausted,
+                    api_exceptions.Aborted, ConnectionError, TimeoutError)
+# Rows claimed by a flush that never finished (its process died) are retried after this
+CLAIM_TIMEOUT_SECONDS = 60.0
+# set(..., skip_recent_duplicate=True) drops a write identical to one this process queued
+# (or remembered) this recently, for at most this many documents. It does not read
+# Firestore, so it cannot tell whether the document still holds that data.
+DUPLICATE_SECONDS = 600.0
+DUPLICATE_ENTRIES = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data BLOB NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS pending_doc ON pending (collection, doc_id, seq);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    seq INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data BLOB NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class _Conflict(Exception):
+    """Two writes to a document that cannot be folded into one (e.g. ArrayUnion then ArrayRemove of a field)."""
+
+
+def encode(value):
+    """
+    Plain JSON-able form of a write's data, with Firestore transforms, timestamps and
+    GeoPoints as {"$...": ...} objects (JSON decoding leaves look-alike strings alone).
+    """
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if isinstance(value, ArrayUnion):
+        return {"$array_union": encode(list(value.values))}
+    if isinstance(value, ArrayRemove):
+        return {"$array_remove": encode(list(value.values))}
+    if isinstance(value, Increment):
+        return {"$increment": value.value}
+    if value is firestore.SERVER_TIMESTAMP:
+        return {"$server_timestamp": True}
+    if value is firestore.DELETE_FIELD:
+        return {"$delete": True}
+    if isinstance(value, datetime):
+        return {"$timestamp": dumps_bytes(value).decode("utf-8").strip('"')}
+    if isinstance(value, GeoPoint):
+        return {"$geopoint": [value.latitude, value.longitude]}
+    return value
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        (key, item), = value.items()
+        if key == "$array_union":
+            return firestore.ArrayUnion(decode(item))
+        if key == "$array_remove":
+            return firestore.ArrayRemove(decode(item))
+        if key == "$increment":
+            return firestore.Increment(item)
+        if key == "$server_timestamp":
+            return firestore.SERVER_TIMESTAMP
+        if key == "$delete":
+            return firestore.DELETE_FIELD
+        if key == "$timestamp":
+            timestamp = revive(item)
+            # revive only reads timestamps with an offset
+            return datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+        if key == "$geopoint":
+            return GeoPoint(*item)
+    return {key: decode(item) for key, item in value.items()}
+
+
+def _transform(value):
+    if isinstance(value, dict) and len(value) == 1:
+        key = next(iter(value))
+        if key.startswith("$"):
+            return key
+    return None
+
+
+def _fold_value(old, new):
+    """One encoded value with the effect of writing old and then new to a field."""
+    kind = _transform(new)
+    if kind is None or kind in ("$server_timestamp", "$delete", "$timestamp", "$geopoint"):
+        # A plain value (or a sentinel) replaces whatever was there
+        return new
+    old_kind = _transform(old)
+    if kind in ("$array_union", "$array_remove"):
+        if old_kind == kind:
+            return {kind: old[kind] + [item for item in new[kind] if item not in old[kind]]}
+        if old_kind is None and isinstance(old, list):
+            if kind == "$array_union":
+                return old + [item for item in new[kind] if item not in old]
+            return [item for item in old if item not in new[kind]]
+    if kind == "$increment" and old_kind == kind:
+        return {kind: old[kind] + new[kind]}
+    raise _Conflict()
+
+
+def _merge_set(old, new):
+    """Fold two set(merge=True) payloads: nested maps merge, everything else is replaced."""
+    merged = dict(old)
+    for key, value in new.items():
+        if key in merged and isinstance(value, dict) and isinstance(merged[key], dict) and _transform(value) is None \
+                and _transform(merged[key]) is None:
+            merged[key] = _merge_set(merged[key], value)
+        elif key in merged:
+            merged[key] = _fold_value(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _merge_update(old, new):
+    """Fold two update payloads, whose keys are dotted field paths."""
+    merged = dict(old)
+    for path, value in new.items():
+        # A write to "a" replaces earlier writes to "a.b"; one to "a.b" after "a" cannot be folded
+        for existing in list(merged):
+            if existing.startswith(path + "."):
+                del merged[existing]
+            elif path.startswith(existing + "."):
+                raise _Conflict()
+        merged[path] = _fold_value(merged[path], value) if path in merged else value
+    return merged
+
+
+def backoff(attempts):
+    """Seconds before retry number attempts, with jitter so failed writes do not retry in step."""
+    delay = min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class WriteBehindQueue:
+    """
+    Summary:
+        Durable queue for side-effect writes that a response does not depend on (a
+        gamer's hosted_games, a repeat login's merge-set). A request only appends the write
+        to a local SQLite file and returns; a background thread commits queued writes to
+        Firestore in batches.
+
+        Writes to the same document are coalesced while they wait: a second set or
+        update is folded into the queued one (later fields win, ArrayUnions combine), so
+        a document written ten times between flushes is written once. Writes to one
+        document are committed in the order they were queued. A failed batch is retried
+        one write at a time so a single bad write cannot hold the others back; failing
+        writes back off exponentially and, after MAX_ATTEMPTS, move to dead_letters.
+
+        Queued writes survive a restart, and several processes may share one file: the
+        flusher claims rows in a SQLite transaction, and a claim left behind by a dead
+        process expires after CLAIM_TIMEOUT_SECONDS.
+
+    Args:
+        db: Firestore client
+        path: SQLite database file (":memory:" for a queue that is not durable)
+        batch_size: writes committed per batch
+        flush_interval: seconds the flusher waits for more writes before committing
+    """
+
+    def __init__(self, db, path, batch_size=BATCH_LIMIT, flush_interval=0.2):
+        self.db = db
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._lock = threading.Lock()
+        # Held for a whole claim-commit, so flush() waits for a batch the thread has in flight
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._recent = OrderedDict()  # (collection, doc ID) -> (digest, queued at), for skip_recent_duplicate
+        self.coalesced = 0
+        self.skipped = 0
+
+    def _connection(self):
+        # Opened on first use, in the process that uses it (never before a fork)
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                # Survives the process dying; only a power cut can lose the last writes
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def start(self):
+        """Start the flusher thread if it is not running (also picks up writes left by a previous run)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def set(self, collection, doc_id, data, merge=True, skip_recent_duplicate=False):
+        """
+        Summary:
+            Queue a set of collection/doc_id (merge=True is the only supported form:
+            a full overwrite is never safe to fold into other writes).
+
+        Returns:
+            bool: False when skip_recent_duplicate dropped a write identical to one this
+            process queued in the last DUPLICATE_SECONDS
+        """
+        if not merge:
+            raise ValueError("Only merge sets can be queued")
+        encoded = encode(data)
+        if skip_recent_duplicate:
+            with self._lock:
+                if self._remember((collection, doc_id), encoded):
+                    self.skipped += 1
+                    metrics.registry.inc("write_behind_enqueued_total", (("result", "skipped"),))
+                    return False
+        self._enqueue(collection, doc_id, "set", encoded)
+        return True
+
+    def recently_set(self, collection, doc_id):
+        """True when this process queued or remembered a set of collection/doc_id in the last DUPLICATE_SECONDS."""
+        with self._lock:
+            recent = self._recent.get((collection, doc_id))
+            return recent is not None and time.monotonic() - recent[1] < DUPLICATE_SECONDS
+
+    def remember(self, collection, doc_id, data):
+        """Note a set written directly to Firestore, so skip_recent_duplicate drops a repeat of it."""
+        with self._lock:
+            self._remember((collection, doc_id), encode(data))
+
+    def _remember(self, key, encoded):
+        """Record a set of key; returns True when it repeats the one recorded last (self._lock held)."""
+        digest = hashlib.blake2b(dumps_bytes(encoded, sort_keys=True), digest_size=16).digest()
+        now = time.monotonic()
+        recent = self._recent.get(key)
+        if recent and recent[0] == digest and now - recent[1] < DUPLICATE_SECONDS:
+            return True
+        self._recent[key] = (digest, now)
+        self._recent.move_to_end(key)
+        while len(self._recent) > DUPLICATE_ENTRIES:
+            self._recent.popitem(last=False)
+        return False
+
+    def update(self, collection, doc_id, data):
+        """Queue an update of collection/doc_id (the document must exist when it is flushed)."""
+        self._enqueue(collection, doc_id, "update", encode(data))
+
+    def _enqueue(self, collection, doc_id, op, data):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Only the newest row of the document can take the write, and only while no
+                # flush has claimed it
+                row = conn.execute(
+                    "SELECT seq, op, data, claimed_at FROM pending WHERE collection = ? AND doc_id = ? "
+                    "ORDER BY seq DESC LIMIT 1", (collection, doc_id)).fetchone()
+                folded = None
+                if row is not None and row[1] == op and row[3] is None:
+                    try:
+                        merge = _merge_set if op == "set" else _merge_update
+                        folded = merge(loads_bytes(row[2]), data)
+                    except _Conflict:
+                        folded = None
+                if folded is not None:
+                    conn.execute("UPDATE pending SET data = ? WHERE seq = ?", (dumps_bytes(folded), row[0]))
+                    self.coalesced += 1
+                else:
+                    conn.execute(
+                        "INSERT INTO pending (collection, doc_id, op, data, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                        (collection, doc_id, op, dumps_bytes(data), time.time()))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        metrics.registry.inc("write_behind_enqueued_total", (("result", "coalesced" if folded is not None else "queued"),))
+        self._wake.set()
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # The oldest row of each document only, so one document's writes land in order
+                rows = conn.execute(
+                    "SELECT seq, collection, doc_id, op, data, enqueued_at, attempts FROM pending AS p "
+                    "WHERE next_attempt <= ? AND (claimed_at IS NULL OR claimed_at < ?) "
+                    "AND NOT EXISTS (SELECT 1 FROM pending AS q WHERE q.collection = p.collection "
+                    "AND q.doc_id = p.doc_id AND q.seq < p.seq) "
+                    "ORDER BY seq LIMIT ?", (now, now - CLAIM_TIMEOUT_SECONDS, self.batch_size)).fetchall()
+                if rows:
+                    conn.executemany("UPDATE pending SET claimed_at = ? WHERE seq = ?", [(now, row[0]) for row in rows])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _commit(self, rows):
+        batch = self.db.batch()
+        for _, collection, doc_id, op, data, _, _ in rows:
+            ref = self.db.collection(collection).document(doc_id)
+            if op == "set":
+                batch.set(ref, decode(loads_bytes(data)), merge=True)
+            else:
+                batch.update(ref, decode(loads_bytes(data)))
+        batch.commit()
+
+    def _done(self, rows):
+        now = time.time()
+        with self._lock:
+            self._connection().executemany("DELETE FROM pending WHERE seq = ?", [(row[0],) for row in rows])
+        for row in rows:
+            metrics.registry.observe("write_behind_flush_seconds", (), now - row[5])
+        metrics.registry.inc("write_behind_writes_total", (("result", "ok"),), len(rows))
+
+    def _failed(self, rows, error):
+        """Schedule rows that failed together for one retry after a backoff, or dead-letter them."""
+        dead, retried = [], []
+        for seq, collection, doc_id, op, data, enqueued_at, attempts in rows:
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS:
+                dead.append((seq, collection, doc_id, op, data, enqueued_at, attempts, str(error)))
+            else:
+                retried.append((attempts, seq))
+        # One delay for the lot, from the row that has failed most, so they retry as a batch again
+        next_attempt = time.time() + backoff(max((attempts for attempts, _ in retried), default=1))
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR REPLACE INTO dead_letters VALUES (?, ?, ?, ?, ?, ?, ?, ?)", dead)
+            conn.executemany("DELETE FROM pending WHERE seq = ?", [(row[0],) for row in dead])
+            conn.executemany("UPDATE pending SET attempts = ?, next_attempt = ?, claimed_at = NULL WHERE seq = ?",
+                             [(attempts, next_attempt, seq) for attempts, seq in retried])
+            conn.execute("COMMIT")
+        for _, collection, doc_id, op, _, _, attempts, _ in dead:
+            logger.error("Write-behind %s of %s/%s failed %d times, moved to dead_letters",
+                         op, collection, doc_id, attempts, extra={"error": str(error)})
+        if dead:
+            metrics.registry.inc("write_behind_writes_total", (("result", "dead"),), len(dead))
+        if retried:
+            first = rows[0]
+            logger.warning("Write-behind of %d writes (first %s of %s/%s) failed, retrying",
+                           len(retried), first[3], first[1], first[2], extra={"error": str(error)})
+            metrics.registry.inc("write_behind_writes_total", (("result", "retry"),), len(retried))
+
+    def flush_once(self):
+        """Commit one batch of the writes that are due. Returns the number committed."""
+        with self._flush_lock:
+            return self._flush_batch()
+
+    def _flush_batch(self):
+        rows = self._claim()
+        if not rows:
+            return 0
+        started = time.perf_counter()
+        try:
+            self._commit(rows)
+        except Exception as e:
+            if len(rows) == 1 or isinstance(e, TRANSIENT_ERRORS):
+                self._failed(rows, e)
+                return 0
+            # Find the bad writes: commit the rest on their own
+            committed = []
+            for row in rows:
+                try:
+                    self._commit([row])
+                    committed.append(row)
+                except Exception as row_error:
+                    self._failed([row], row_error)
+            self._done(committed)
+            return len(committed)
+        self._done(rows)
+        metrics.registry.observe("write_behind_batch_seconds", (), time.perf_counter() - started)
+        return len(rows)
+
+    def flush(self, timeout=10):
+        """Commit every write that is due now (used at shutdown and in tests). Returns the count."""
+        deadline = time.monotonic() + timeout
+        total = 0
+        while time.monotonic() < deadline:
+            committed = self.flush_once()
+            if not committed:
+                return total
+            total += committed
+        return total
+
+    def _next_due(self):
+        with self._lock:
+            row = self._connection().execute("SELECT MIN(next_attempt) FROM pending WHERE claimed_at IS NULL").fetchone()
+        return row[0]
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                # Give a burst of writes flush_interval to arrive (and coalesce) before committing
+                if self._stopping.wait(self.flush_interval):
+                    return
+                while self.flush_once() == self.batch_size and not self._stopping.is_set():
+                    pass
+                due = self._next_due()
+                wait = None if due is None else max(due - time.time(), 0.0)
+                self._wake.wait(wait)
+                self._wake.clear()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+                self._stopping.wait(BACKOFF_SECONDS)
+
+    def shutdown(self, flush=True, timeout=10):
+        """Stop the flusher, first committing what is due if flush is set. The rest stays queued."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if flush and self._conn is not None:
+            try:
+                self.flush(timeout)
+            except Exception:
+                logger.exception("Write-behind flush at shutdown failed")
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            depth, oldest = conn.execute("SELECT COUNT(*), MIN(enqueued_at) FROM pending").fetchone()
+            dead = conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        return {
+            "depth": depth,
+            "oldest_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "dead_letters": dead,
+            "coalesced": self.coalesced,
+            "skipped": self.skipped,
+        }
+
+    def metric_samples(self):
+        if self._conn is None:
+            # Nothing queued by this process yet; do not open the file just for /metrics
+            return []
+        stats = self.stats()
+        return [
+            ("write_behind_queue_depth", (), stats["depth"]),
+            ("write_behind_oldest_age_seconds", (), stats["oldest_age_seconds"]),
+            ("write_behind_dead_letters", (), stats["dead_letters"]),
+        ]
+
+
+def init_app(app, db, path, batch_size=BATCH_LIMIT, flush_interval=0.2):
+    """
+    Summary:
+        Create the app's write-behind queue. Nothing is opened here: the SQLite file and
+        the flusher thread are started by the first request in each process, which also
+        flushes any writes a previous run left queued.
+
+    Returns:
+        WriteBehindQueue: also stored as app.extensions["write_behind"]
+    """
+    queue = WriteBehindQueue(db, path, batch_size=batch_size, flush_interval=flush_interval)
+    app.extensions["write_behind"] = queue
+
+    @app.before_request
+    def _start_write_behind():
+        queue.start()
+
+    return queue
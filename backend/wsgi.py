@@ -0,0 +1,5 @@
+from main import create_app
+
+# Entry point for production servers, e.g. gunicorn -c gunicorn.conf.py wsgi:app
+# The scheduled jobs are started per worker by gunicorn.conf.py, never at import
+app = create_app({"RUN_SCHEDULER": False})